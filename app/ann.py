@@ -0,0 +1,190 @@
+"""
+近似最近邻索引模块
+Approximate Nearest Neighbour (FAISS) Index Module
+
+按配置创建FAISS索引: Flat(精确检索)、IVF-Flat、IVF-PQ或HNSW。
+IVF/PQ需要先在样本向量上训练; 样本不足以训练时自动退化为更简单的索引。
+所有索引都使用L2距离, 与langchain FAISS默认的距离和分数换算保持一致。
+"""
+
+import threading
+from typing import Dict
+
+import faiss
+import numpy as np
+
+from app.config import FILTER_EXACT_MAX_ROWS
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+_direct_map_lock = threading.Lock()
+
+# faiss建议每个聚类中心至少39个训练样本
+MIN_POINTS_PER_CENTROID = 39
+
+
+def _pq_subquantizers(dim: int, pq_m: int) -> int:
+    """PQ子空间数必须整除向量维度, 取不超过pq_m的最大约数"""
+    for m in range(min(pq_m, dim), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+# 影响索引内容的构建参数(查询参数nprobe/efSearch可在加载后随时调整)
+BUILD_PARAMS = {
+    "flat": (),
+    "ivf_flat": ("nlist",),
+    "ivf_pq": ("nlist", "pq_m", "pq_nbits"),
+    "hnsw": ("hnsw_m",),
+}
+
+
+def build_config(index_type: str, params: Dict) -> Dict:
+    """索引类型及其构建参数, 写入增量索引清单用于判断是否需要重建"""
+    return {"type": index_type, **{name: params[name] for name in BUILD_PARAMS.get(index_type, ())}}
+
+
+def index_factory_string(index_type: str, dim: int, n_train: int, params: Dict) -> str:
+    """
+    根据索引类型和训练样本数生成faiss.index_factory描述串
+
+    Args:
+        index_type: flat / ivf_flat / ivf_pq / hnsw
+        dim: 向量维度
+        n_train: 可用于训练的向量数
+        params: nlist / pq_m / pq_nbits / hnsw_m
+
+    Returns:
+        index_factory描述串, 如"IVF256,PQ48x8"
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"不支持的向量索引类型: {index_type} (可选: {', '.join(INDEX_TYPES)})")
+
+    if index_type == "hnsw":
+        return f"HNSW{params['hnsw_m']}"
+
+    if index_type in ("ivf_flat", "ivf_pq"):
+        # 聚类中心数不超过样本数/39, 样本太少时退化为精确检索
+        nlist = min(params["nlist"], n_train // MIN_POINTS_PER_CENTROID)
+        if nlist >= 2:
+            if index_type == "ivf_flat":
+                return f"IVF{nlist},Flat"
+            # PQ每个子空间有2^nbits个码字, 同样需要足够的训练样本
+            if n_train >= MIN_POINTS_PER_CENTROID * (1 << params["pq_nbits"]):
+                m = _pq_subquantizers(dim, params["pq_m"])
+                return f"IVF{nlist},PQ{m}x{params['pq_nbits']}"
+            return f"IVF{nlist},Flat"
+
+    return "Flat"
+
+
+def build_index(train_vectors: np.ndarray, dim: int, index_type: str, params: Dict):
+    """
+    创建并训练FAISS索引(不添加向量)
+
+    Args:
+        train_vectors: 训练样本, 形状(n, dim)
+        dim: 向量维度
+        index_type: flat / ivf_flat / ivf_pq / hnsw
+        params: nlist / pq_m / pq_nbits / hnsw_m / nprobe / ef_search
+
+    Returns:
+        (已训练的索引, index_factory描述串)
+    """
+    spec = index_factory_string(index_type, dim, len(train_vectors), params)
+    index = faiss.index_factory(dim, spec, faiss.METRIC_L2)
+    if not index.is_trained:
+        index.train(np.ascontiguousarray(train_vectors, dtype=np.float32))
+    set_search_params(index, params)
+    return index, spec
+
+
+def set_search_params(index, params: Dict):
+    """设置查询参数: IVF的nprobe与HNSW的efSearch(不影响索引内容, 加载后可随时调整)"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(params["nprobe"], ivf.nlist)
+
+    hnsw_index = faiss.downcast_index(index)
+    if isinstance(hnsw_index, faiss.IndexHNSW):
+        hnsw_index.hnsw.efSearch = params["ef_search"]
+
+
+def _reconstruct(index, ivf, rows: np.ndarray) -> np.ndarray:
+    """取出指定位置的向量(IVF首次调用时建立位置到倒排表的映射)"""
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        with _direct_map_lock:
+            if ivf.direct_map.type == faiss.DirectMap.NoMap:
+                ivf.make_direct_map()
+    return index.reconstruct_batch(rows)
+
+
+def search_rows(index, queries: np.ndarray, k: int, rows: np.ndarray, exact_max_rows: int = FILTER_EXACT_MAX_ROWS):
+    """
+    只在给定位置的向量中检索(元数据过滤下推到索引)
+
+    过滤后的向量不超过exact_max_rows时取出这些向量精确检索; 否则使用faiss的IDSelector,
+    不在rows中的向量不参与计算距离, 并按过滤比例放大nprobe/efSearch,
+    使近似检索访问到的满足条件的向量数与不过滤时相当。
+
+    Args:
+        index: faiss索引或MmapFlatIndex
+        queries: 查询向量, 形状(n, d)
+        k: 每个查询返回的结果数
+        rows: 向量位置(升序, int64)
+        exact_max_rows: 精确检索的行数上限
+
+    Returns:
+        与index.search一致的(距离平方, 位置), 不足k个时以-1填充
+    """
+    from app.mmap_store import MmapFlatIndex
+
+    queries = np.asarray(queries, dtype=np.float32).reshape(-1, index.d)
+    if not isinstance(index, faiss.Index):
+        return index.search_rows(queries, k, rows)
+
+    rows = np.ascontiguousarray(rows, dtype=np.int64)
+    ivf = faiss.try_extract_index_ivf(index)
+    hnsw_index = faiss.downcast_index(index)
+    if len(rows) <= exact_max_rows and not isinstance(hnsw_index, faiss.IndexFlat):
+        vectors = _reconstruct(index, ivf, rows)
+        distances, labels = MmapFlatIndex(vectors, np.einsum('ij,ij->i', vectors, vectors)).search(queries, k)
+        return distances, np.where(labels >= 0, rows[np.maximum(labels, 0)], -1)
+
+    selector = faiss.IDSelectorBatch(rows)
+    scale = index.ntotal / max(len(rows), 1)
+    if ivf is not None:
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=min(ivf.nlist, int(np.ceil(ivf.nprobe * scale))))
+    elif isinstance(hnsw_index, faiss.IndexHNSW):
+        ef_search = min(index.ntotal, int(np.ceil(max(hnsw_index.hnsw.efSearch, k) * scale)))
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(ef_search, k))
+    else:
+        # Flat索引本身是精确检索
+        params = faiss.SearchParameters(sel=selector)
+    return index.search(queries, k, params=params)
+
+
+def describe_index(index) -> str:
+    """索引的简要描述, 用于启动日志"""
+    if not isinstance(index, faiss.Index):
+        # 非faiss实现的索引(如内存映射的Flat向量)自行提供描述
+        return index.describe()
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        kind = "IVF-PQ" if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ) else "IVF-Flat"
+        return f"{kind} (nlist={ivf.nlist}, nprobe={ivf.nprobe})"
+
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return f"HNSW (M={index.hnsw.nb_neighbors(1)}, efSearch={index.hnsw.efSearch})"
+    return "Flat"
+
+
+def supports_remove(index) -> bool:
+    """
+    删除后剩余向量的位置需连续重排(与文本块行号一致),
+    只有Flat索引满足; IVF保留原始ID, HNSW不支持删除
+    """
+    return isinstance(index, faiss.Index) and isinstance(faiss.downcast_index(index), faiss.IndexFlat)
@@ -0,0 +1,143 @@
+"""
+语义回答缓存模块
+Semantic Answer Cache Module
+
+以独立问题(经过对话改写后的问题)的嵌入向量为键缓存LLM回答。
+相似度超过阈值、且本次检索到的文本块与缓存时一致的问题直接返回缓存回答,
+跳过远程LLM调用。支持TTL过期、LRU淘汰和知识库重建后的失效。
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """基于向量相似度的问答缓存"""
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000, ttl_seconds: float = 3600):
+        """
+        初始化回答缓存
+
+        Args:
+            threshold: 命中所需的最小余弦相似度
+            max_entries: 最大缓存条目数(超出时淘汰最久未使用的条目)
+            ttl_seconds: 条目有效期(秒)
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.misses = 0
+
+        self._vectors: Optional[np.ndarray] = None
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._free_slots: List[int] = []
+        self._index_version = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _check_version(self, index_version):
+        """知识库索引版本变化时清空缓存"""
+        if index_version != self._index_version:
+            self._clear()
+            self._index_version = index_version
+
+    def _clear(self):
+        self._vectors = None
+        self._entries.clear()
+        self._free_slots.clear()
+
+    def _evict(self, slot: int):
+        self._entries.pop(slot, None)
+        self._vectors[slot] = 0
+        self._free_slots.append(slot)
+
+    def lookup(self, vector, chunk_ids: List[str], index_version=None) -> Optional[Dict]:
+        """
+        查找语义相近且检索结果一致的缓存回答
+
+        Args:
+            vector: 独立问题的嵌入向量
+            chunk_ids: 本次检索到的文本块ID
+            index_version: 当前知识库索引版本
+
+        Returns:
+            命中的缓存条目(包含question和answer), 未命中返回None
+        """
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            self._check_version(index_version)
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            # 清理过期条目
+            for slot in [s for s, e in self._entries.items() if now - e["created_at"] > self.ttl_seconds]:
+                self._evict(slot)
+
+            slots = np.fromiter(self._entries.keys(), dtype=np.int64)
+            if len(slots) > 0:
+                scores = self._vectors[slots] @ query
+                for i in np.argsort(-scores):
+                    if scores[i] < self.threshold:
+                        break
+                    slot = int(slots[i])
+                    entry = self._entries[slot]
+                    if entry["chunk_ids"] == sorted(chunk_ids):
+                        self._entries.move_to_end(slot)
+                        self.hits += 1
+                        return entry
+
+            self.misses += 1
+            return None
+
+    def store(self, question: str, vector, answer: str, chunk_ids: List[str], index_version=None):
+        """写入缓存条目"""
+        query = self._normalize(vector)
+        with self._lock:
+            self._check_version(index_version)
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, query.shape[0]), dtype=np.float32)
+                self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+            if not self._free_slots:
+                oldest = next(iter(self._entries))
+                self._evict(oldest)
+
+            slot = self._free_slots.pop()
+            self._vectors[slot] = query
+            self._entries[slot] = {
+                "question": question,
+                "answer": answer,
+                "chunk_ids": sorted(chunk_ids),
+                "created_at": time.time(),
+            }
+
+    def invalidate(self):
+        """清空缓存(知识库重建后调用)"""
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> Dict:
+        """缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+        }
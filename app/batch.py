@@ -0,0 +1,267 @@
+"""
+离线批量问答模块
+Offline Batch Question Answering Module
+
+一次性回答一批标准问题(如生成FAQ页面), 运行方式: python main.py --batch questions.jsonl
+
+    1. 读取问题文件, 跳过输出文件中已成功回答的问题(中断后重新运行同一命令即可续跑)
+    2. 全部问题一次批量检索(RAGRetriever.retrieve_batch: 分批嵌入, 按过滤条件批量检索向量索引)
+    3. 线程池并发调用LLM, 同时进行的请求不超过concurrency个; 每个问题独立回答, 不使用对话记忆
+    4. 遇到限流(HTTP 429)时所有线程一起暂停, 按指数退避(带随机抖动)重试;
+       超时、连接错误、5xx同样重试, 其他错误直接记为失败
+    5. 每完成一个问题立即向输出文件追加一行并刷新
+
+问题文件每行一个JSON对象:
+    {"id": "q1", "question": "上海大学辅导员岗位的报名截止时间是?", "filters": {"institution": "上海大学"}}
+id可省略(按问题文本生成), filters可省略(按检索器的规则自动推断)。
+
+输出文件每行一个JSON对象:
+    成功  {"id", "question", "answer", "sources": [{"source", "section", "chunk_id"}], "attempts"}
+    失败  {"id", "question", "error", "attempts"}
+失败的问题下次运行时重新回答, 同一id以最后一行为准。
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Set
+
+from langchain.schema import Document
+
+from app.chatbot import GovernmentChatbot
+from app.tracing import tracer
+
+
+def question_id(question: str) -> str:
+    """未指定id时按问题文本生成(多次运行之间保持不变)"""
+    return hashlib.sha1(question.encode("utf-8")).hexdigest()[:12]
+
+
+def load_questions(path: str) -> List[Dict]:
+    """
+    读取问题文件(JSONL)
+
+    Returns:
+        [{"id", "question", "filters"}], 重复的id只保留第一个
+    """
+    questions = []
+    seen = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path} 第{line_no}行不是合法的JSON: {e}") from e
+            question = str(item.get("question", "")).strip()
+            if not question:
+                raise ValueError(f"{path} 第{line_no}行缺少question字段")
+
+            qid = str(item.get("id") or question_id(question))
+            if qid in seen:
+                continue
+            seen.add(qid)
+            questions.append({"id": qid, "question": question, "filters": item.get("filters")})
+    return questions
+
+
+def completed_ids(path: str) -> Set[str]:
+    """
+    输出文件中已成功回答的问题id
+
+    上次运行在写入某一行的中途被终止时, 先截掉文件末尾不完整的行, 之后追加的结果才能逐行解析。
+    """
+    if not os.path.exists(path):
+        return set()
+
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            data = data[:data.rfind(b"\n") + 1]
+            f.truncate(len(data))
+
+    results: Dict[str, bool] = {}
+    for line in data.decode("utf-8").splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(record, dict) and "id" in record:
+            results[record["id"]] = "answer" in record and not record.get("error")
+    return {qid for qid, answered in results.items() if answered}
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """异常携带的HTTP状态码(openai/httpx/requests的异常都带有status_code或response)"""
+    for source in (error, getattr(error, "response", None)):
+        for attribute in ("status_code", "status"):
+            value = getattr(source, attribute, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """LLM服务返回的限流错误"""
+    if _status_code(error) == 429 or "RateLimit" in type(error).__name__:
+        return True
+    message = str(error).lower()
+    return "rate limit" in message or "too many requests" in message
+
+
+def is_retryable(error: Exception) -> bool:
+    """限流、超时、连接错误和服务端5xx错误可以重试"""
+    if is_rate_limited(error) or isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = _status_code(error)
+    if status is not None:
+        return status >= 500
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """响应头Retry-After指定的等待秒数"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class BatchAnswerer:
+    """批量回答问题: 先批量检索, 再并发调用LLM并逐条写入结果"""
+
+    def __init__(
+        self,
+        chatbot: GovernmentChatbot,
+        concurrency: int,
+        max_retries: int,
+        base_delay: float,
+        max_delay: float
+    ):
+        """
+        Args:
+            chatbot: 聊天机器人(使用其检索器、提示词模板和LLM客户端)
+            concurrency: 同时进行的LLM请求数
+            max_retries: 每个问题最多重试的次数
+            base_delay: 首次重试的等待秒数, 之后每次翻倍
+            max_delay: 单次等待的上限(秒)
+        """
+        self.chatbot = chatbot
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # 限流冷却结束时间: 任一线程被限流后, 所有线程在此之前都不发起新请求
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def run(self, questions: List[Dict], output_path: str) -> Dict[str, int]:
+        """
+        回答输出文件中尚未成功回答的问题, 结果追加写入output_path
+
+        Returns:
+            {"total", "skipped", "answered", "failed"}
+        """
+        done = completed_ids(output_path)
+        pending = [item for item in questions if item["id"] not in done]
+        stats = {"total": len(questions), "skipped": len(questions) - len(pending), "answered": 0, "failed": 0}
+        print(f"📋 共 {stats['total']} 个问题, 已完成 {stats['skipped']} 个, 待回答 {len(pending)} 个")
+        if not pending:
+            return stats
+
+        start = time.perf_counter()
+        print("🔍 正在批量检索...")
+        all_docs = self.chatbot.rag_retriever.retrieve_batch(
+            [item["question"] for item in pending],
+            filters=[item["filters"] for item in pending]
+        )
+        print(f"✅ 检索完成 ({time.perf_counter() - start:.1f}s)")
+
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        print(f"🤖 正在生成回答 (并发 {self.concurrency})...")
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch")
+        futures = [executor.submit(self._answer, item, docs) for item, docs in zip(pending, all_docs)]
+        try:
+            with open(output_path, 'a', encoding='utf-8') as f:
+                for finished, future in enumerate(as_completed(futures), 1):
+                    record = future.result()
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    f.flush()
+                    if "error" in record:
+                        stats["failed"] += 1
+                        print(f"  [{finished}/{len(pending)}] ❌ {record['id']}: {record['error']}")
+                    else:
+                        stats["answered"] += 1
+                        print(f"  [{finished}/{len(pending)}] ✅ {record['id']} (尝试 {record['attempts']} 次)")
+        finally:
+            # 中断时取消尚未开始的问题, 已写入的结果在下次运行时跳过
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        print(f"✅ 批量问答完成: 成功 {stats['answered']} 个, 失败 {stats['failed']} 个 "
+              f"({time.perf_counter() - start:.1f}s)")
+        return stats
+
+    def _answer(self, item: Dict, docs: List[Document]) -> Dict:
+        """回答单个问题, 可重试的错误按退避策略重试"""
+        record = {"id": item["id"], "question": item["question"]}
+        attempt = 0
+        while True:
+            self._wait_for_cooldown()
+            attempt += 1
+            try:
+                answer = self.chatbot.answer(item["question"], docs)
+            except Exception as e:
+                if attempt > self.max_retries or not is_retryable(e):
+                    return {**record, "error": f"{type(e).__name__}: {e}", "attempts": attempt}
+                delay = self._backoff(attempt, e)
+                if is_rate_limited(e):
+                    tracer.count("chatbot_batch_retries_total", reason="rate_limit")
+                    self._cool_down(delay)
+                else:
+                    tracer.count("chatbot_batch_retries_total", reason="error")
+                    time.sleep(delay)
+                continue
+
+            sources = [
+                {
+                    "source": doc.metadata.get("source", ""),
+                    "section": doc.metadata.get("section", ""),
+                    "chunk_id": doc.metadata.get("chunk_id", "")
+                }
+                for doc in docs
+            ]
+            return {**record, "answer": answer, "sources": sources, "attempts": attempt}
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """第attempt次失败后的等待秒数: 优先使用Retry-After, 否则指数退避并在后一半区间随机抖动"""
+        hinted = retry_after(error)
+        if hinted is not None:
+            return min(hinted, self.max_delay)
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def _cool_down(self, seconds: float):
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    def _wait_for_cooldown(self):
+        while True:
+            with self._lock:
+                remaining = self._resume_at - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
@@ -0,0 +1,101 @@
+"""
+请求微批处理模块
+Request Micro-Batching Module
+
+多个线程并发提交的单条请求(如查询嵌入)在后台线程中合并为一次批量调用:
+收到第一条请求后最多再等待max_wait_ms毫秒或凑满max_batch_size条, 然后一次性处理,
+把结果分发给各自等待的调用方。
+
+只有上一批合并到多条请求(存在并发)时才等待; 没有并发时单条请求立即处理, 不增加延迟。
+处理期间到达的请求在队列中累积, 下一批会一并取出。
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Generic, List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """把并发提交的请求合并为批量调用(线程安全)"""
+
+    def __init__(self, fn: Callable[[List[T]], Sequence[R]], max_batch_size: int = 32,
+                 max_wait_ms: float = 2.0, name: str = "micro-batcher"):
+        """
+        Args:
+            fn: 批量处理函数, 返回与输入一一对应的结果
+            max_batch_size: 每批最多的请求数
+            max_wait_ms: 存在并发时, 收到第一条请求后等待更多请求的最长时间(毫秒), 为0时只合并已排队的请求
+            name: 后台线程名称
+        """
+        self.fn = fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self._last_batch_size = 0
+        self._queue: Optional[queue.Queue] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self) -> queue.Queue:
+        # fork后子进程中没有后台线程, 需要重新启动
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue()
+                    threading.Thread(target=self._run, args=(self._queue,), name=self.name, daemon=True).start()
+                    self._pid = os.getpid()
+        return self._queue
+
+    def submit_future(self, item: T) -> Future:
+        """提交一条请求, 返回其结果的Future(异步代码可用asyncio.wrap_future等待)"""
+        future = Future()
+        self._ensure_worker().put((item, future))
+        return future
+
+    def submit(self, item: T) -> R:
+        """提交一条请求并等待结果"""
+        return self.submit_future(item).result()
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.items / self.batches if self.batches else 0.0
+
+    def _collect(self, requests: queue.Queue) -> list:
+        batch = [requests.get()]
+        deadline = time.monotonic() + (self.max_wait if self._last_batch_size > 1 else 0.0)
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(requests.get(timeout=remaining) if remaining > 0 else requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, requests: queue.Queue):
+        while True:
+            batch = self._collect(requests)
+            self._last_batch_size = len(batch)
+            # 调用方取消(如请求超时)的Future不再计算
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                results = self.fn([item for item, _ in batch])
+            except BaseException as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -3,12 +3,14 @@
 Chatbot Core Module with LangChain
 """
 
-from typing import List, Dict
+import asyncio
+import threading
+import contextvars
+from typing import AsyncIterator, Dict, Iterator, List, Optional
 from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
+from langchain.chains.conversational_retrieval.base import _get_chat_history
 from langchain.prompts import PromptTemplate
 from langchain.schema import Document
-from langchain_openai import ChatOpenAI
 
 from app.config import (
     OPENAI_API_KEY,
@@ -16,39 +18,76 @@ from app.config import (
     QW_API_KEY,
     QW_Model,
     LLM_TYPE,
-    LLM_MODEL,
     OLLAMA_MODEL,
     OLLAMA_BASE_URL,
+    OPENAI_API_BASE,
+    OPENAI_CHAT_MODEL,
+    LLM_BACKENDS,
+    LLM_HEDGE_ENABLED,
     TEMPERATURE,
-    SYSTEM_PROMPT
+    SYSTEM_PROMPT,
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_TTL,
+    MEMORY_MAX_TOKENS,
+    MEMORY_KEEP_TURNS,
+    CONDENSE_FAST_PATH,
+    CONDENSE_MIN_CHARS,
+    CONDENSE_MODEL,
+    CONTEXT_PACKING,
+    CONTEXT_MAX_TOKENS
 )
 from app.rag import RAGRetriever
+from app.answer_cache import SemanticAnswerCache
+from app.memory import TokenBudgetMemory
+from app.condense import is_standalone_question
+from app.context import pack_context
+from app.profiling import profiler
+from app.tracing import tracer
+from app.tokens import count_tokens
 
 
 class GovernmentChatbot:
     """政务智能客服机器人"""
     
-    def __init__(self, rag_retriever: RAGRetriever):
+    def __init__(self, rag_retriever: RAGRetriever, llm_type: Optional[str] = None):
         """
         初始化聊天机器人
         
         Args:
             rag_retriever: RAG检索器实例
+            llm_type: LLM类型(默认使用配置中的LLM_TYPE)
         """
         self.rag_retriever = rag_retriever
+        self.llm_type = llm_type or LLM_TYPE
         self.llm = None
         self.memory = None
         self.qa_chain = None
+        self.answer_cache: Optional[SemanticAnswerCache] = None
+        self.condense_llm = None
+        # 问题改写路径统计: 无历史 / 判定为完整问题 / 调用LLM改写
+        self.condense_stats = {"no_history": 0, "standalone": 0, "condensed": 0}
+        self._stats_lock = threading.Lock()
         
-        self._initialize_llm()
+        if ANSWER_CACHE_ENABLED:
+            self.answer_cache = SemanticAnswerCache(
+                threshold=ANSWER_CACHE_THRESHOLD,
+                max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                ttl_seconds=ANSWER_CACHE_TTL
+            )
+        
+        with profiler.phase("初始化LLM客户端"):
+            self._initialize_llm()
         self._initialize_memory()
-        self._initialize_chain()
+        with profiler.phase("构建对话检索链"):
+            self._initialize_chain()
     
     def _initialize_llm(self):
         """初始化大语言模型"""
         
         # 自动选择可用的LLM
-        llm_type = LLM_TYPE
+        llm_type = self.llm_type
         if llm_type == "auto":
             if OPENAI_API_KEY:
                 llm_type = "openai"
@@ -61,25 +100,28 @@ class GovernmentChatbot:
         print(f"🤖 正在初始化LLM模型...")
         print(f"   类型: {llm_type}")
         
+        # 各后端的依赖只在选中时导入
         try:
-            llm_type = "qw"
             if llm_type == "openai":
                 # 使用 OpenAI
-                from openai import OpenAI
+                from langchain_openai import ChatOpenAI
                 
                 if not OPENAI_API_KEY:
                     raise ValueError("OpenAI API Key未设置")
                 
-                print(f"   模型: {LLM_MODEL}")
-                self.llm = ChatOpenAI(
-                    model="deepseek-chat",  # 或者 "deepseek-reasoner" 用于思考模式:cite[1]
+                print(f"   模型: {OPENAI_CHAT_MODEL}")
+                options = dict(
                     temperature=TEMPERATURE,
                     openai_api_key=OPENAI_API_KEY,
-                    openai_api_base="https://api.deepseek.com/v1",  # DeepSeek API 端点:cite[1]:cite[5]
+                    openai_api_base=OPENAI_API_BASE,  # DeepSeek API 端点:cite[1]:cite[5]
                     max_tokens=1024,  # 可选参数
                     timeout=None,
                     max_retries=2
                 )
+                # 或者 "deepseek-reasoner" 用于思考模式:cite[1]
+                self.llm = ChatOpenAI(model=OPENAI_CHAT_MODEL, **options)
+                if CONDENSE_MODEL:
+                    self.condense_llm = ChatOpenAI(model=CONDENSE_MODEL, **options)
                 # self.llm = ChatOpenAI(
                 #     model=OLLAMA_MODEL,  # 或者 "deepseek-reasoner" 用于思考模式:cite[1]
                 #     temperature=TEMPERATURE,
@@ -91,33 +133,43 @@ class GovernmentChatbot:
                 # )
                 print("✅ OpenAI模型初始化完成")
             elif llm_type == "qw":
-                # 使用 QW 大模型
+                # 使用 QW 大模型(OpenAI兼容接口)
+                from langchain_openai import ChatOpenAI
+                
                 if not QW_API_KEY:
                     raise ValueError("QW API Key未设置")
                 
                 print(f"   模型: {QW_Model}")
                 print(f"   服务: {QW_API_BASE_URL}")
-                self.llm = ChatOpenAI(
-                    model=QW_Model,
+                options = dict(
                     openai_api_key=QW_API_KEY,
                     openai_api_base=QW_API_BASE_URL,
                     temperature=TEMPERATURE,
                     timeout=30
                 )
+                self.llm = ChatOpenAI(model=QW_Model, **options)
+                if CONDENSE_MODEL:
+                    self.condense_llm = ChatOpenAI(model=CONDENSE_MODEL, **options)
                 print("✅ QW大模型初始化完成")    
             elif llm_type == "ollama":
                 # 使用 Ollama 本地模型
                 try:
-                    from langchain_community.llms import Ollama
+                    from app.ollama_llm import OllamaLLM
                     
                     print(f"   模型: {OLLAMA_MODEL}")
                     print(f"   服务: {OLLAMA_BASE_URL}")
-                    self.llm = Ollama(
+                    # 模型常驻时长、上下文窗口等见config中的OLLAMA_*配置
+                    self.llm = OllamaLLM(
                         model=OLLAMA_MODEL,
                         base_url=OLLAMA_BASE_URL,
-                        temperature=TEMPERATURE,
-                        timeout=300
+                        temperature=TEMPERATURE
                     )
+                    if CONDENSE_MODEL:
+                        self.condense_llm = OllamaLLM(
+                            model=CONDENSE_MODEL,
+                            base_url=OLLAMA_BASE_URL,
+                            temperature=TEMPERATURE
+                        )
                     print("✅ Ollama本地模型初始化完成")
                     print("💡 提示: 使用免费的本地大语言模型")
                     
@@ -129,6 +181,22 @@ class GovernmentChatbot:
                     print(f"   拉取模型: ollama pull {OLLAMA_MODEL}")
                     raise
                     
+            elif llm_type == "router":
+                # 在多个已配置的服务之间路由: 共享连接池、故障转移、熔断和可选的对冲请求
+                from app.llm_router import RoutingLLM, create_backends
+                
+                backends = create_backends(LLM_BACKENDS)
+                if not backends:
+                    raise ValueError(f"LLM_BACKENDS ({LLM_BACKENDS}) 中没有已配置的LLM服务")
+                
+                for backend in backends:
+                    print(f"   服务: {backend.name} ({backend.model} @ {backend.base_url})")
+                self.llm = RoutingLLM(backends=backends, hedge=LLM_HEDGE_ENABLED)
+                if CONDENSE_MODEL:
+                    # 与问答共用服务及其健康状态, 只替换模型名
+                    self.condense_llm = RoutingLLM(backends=backends, hedge=LLM_HEDGE_ENABLED, model=CONDENSE_MODEL)
+                print(f"✅ LLM路由初始化完成 (对冲请求: {'开启' if LLM_HEDGE_ENABLED else '关闭'})")
+                
             elif llm_type == "fake":
                 # 使用假的LLM用于测试
                 from langchain_community.llms.fake import FakeListLLM
@@ -159,14 +227,18 @@ class GovernmentChatbot:
     
     def _initialize_memory(self):
         """初始化对话记忆"""
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            output_key="answer",
-            return_messages=True
-        )
+        self.memory = self.new_memory()
         
         print("💭 对话记忆已初始化")
     
+    def new_memory(self):
+        """创建一份新的对话记忆(服务模式下每个会话各持有一份)"""
+        return TokenBudgetMemory(
+            llm=self.llm,
+            max_tokens=MEMORY_MAX_TOKENS,
+            keep_turns=MEMORY_KEEP_TURNS
+        )
+    
     def _initialize_chain(self):
         """初始化对话检索链"""
         print("🔗 正在构建对话检索链...")
@@ -187,25 +259,31 @@ class GovernmentChatbot:
             input_variables=["context", "question"]
         )
         
-        # 创建对话检索链
+        # 可选: 问题改写使用同一服务商的更小模型(由_initialize_llm创建)
+        if self.condense_llm is not None:
+            print(f"   问题改写模型: {CONDENSE_MODEL}")
+        
+        # 创建对话检索链(问题改写和文档问答两个子链由chat()按步骤调用,
+        # 对话记忆也由chat()读写, 以便在调用LLM之前查询回答缓存)
         self.qa_chain = ConversationalRetrievalChain.from_llm(
             llm=self.llm,
             retriever=self.rag_retriever.retriever,
-            memory=self.memory,
             return_source_documents=True,
             combine_docs_chain_kwargs={"prompt": QA_PROMPT},
+            condense_question_llm=self.condense_llm,
             verbose=False
         )
         
         print("✅ 对话检索链构建完成\n")
     
-    def chat(self, user_input: str, show_sources: bool = False) -> Dict:
+    def chat(self, user_input: str, show_sources: bool = False, memory=None) -> Dict:
         """
         处理用户输入并返回回答
         
         Args:
             user_input: 用户输入的问题
             show_sources: 是否显示来源文档
+            memory: 会话的对话记忆, 默认使用self.memory
             
         Returns:
             包含回答和来源的字典
@@ -216,20 +294,240 @@ class GovernmentChatbot:
                 "sources": []
             }
         
-        # 调用对话链
-        result = self.qa_chain.invoke({"question": user_input})
+        with tracer.trace("chat", mode="chat") as trace:
+            # 1. 结合对话历史把问题改写为独立问题
+            memory = self.memory if memory is None else memory
+            chat_history = _get_chat_history(memory.buffer_messages())
+            question = self._condense_question(user_input, chat_history)
+            
+            # 2. 检索相关文档并查询语义回答缓存
+            turn = self._retrieve(question)
+            
+            # 3. 缓存未命中时调用LLM生成回答
+            if turn["cached"] is not None:
+                answer = turn["cached"]["answer"]
+            else:
+                answer = "".join(self._generate(turn["docs"], question, chat_history))
+            
+            # 4. 写入缓存并更新对话记忆
+            trace.set(cached=turn["cached"] is not None)
+            return self._finish_turn(memory, user_input, turn, answer, show_sources)
+    
+    def stream_chat(self, user_input: str, show_sources: bool = False, memory=None) -> Iterator[Dict]:
+        """
+        流式处理用户输入, 在LLM生成回答的同时逐个产出token
+        
+        对话记忆在回答生成结束后更新; 若调用方提前停止迭代, 本轮不会写入记忆。
+        
+        Args:
+            user_input: 用户输入的问题
+            show_sources: 是否显示来源文档
+            memory: 会话的对话记忆, 默认使用self.memory
+            
+        Yields:
+            {"type": "token", "content": 文本片段},
+            最后产出 {"type": "end", "answer": 完整回答, "sources": 来源列表, "cached": 是否命中缓存}
+        """
+        if not user_input.strip():
+            yield {"type": "end", "answer": "请输入您的问题。", "sources": [], "cached": False}
+            return
+        
+        with tracer.trace("chat", mode="stream") as trace:
+            memory = self.memory if memory is None else memory
+            chat_history = _get_chat_history(memory.buffer_messages())
+            question = self._condense_question(user_input, chat_history)
+            turn = self._retrieve(question)
+            
+            if turn["cached"] is not None:
+                answer = turn["cached"]["answer"]
+                yield {"type": "token", "content": answer}
+            else:
+                parts = []
+                for text in self._generate(turn["docs"], question, chat_history):
+                    parts.append(text)
+                    yield {"type": "token", "content": text}
+                answer = "".join(parts)
+            
+            trace.set(cached=turn["cached"] is not None)
+            response = self._finish_turn(memory, user_input, turn, answer, show_sources)
+        yield {"type": "end", **response}
+    
+    async def astream_chat(self, user_input: str, show_sources: bool = False, memory=None) -> AsyncIterator[Dict]:
+        """
+        stream_chat的异步版本
+        
+        问题改写和回答生成使用LLM的异步接口, 检索(嵌入+向量搜索)在线程池中执行。
+        
+        Args:
+            user_input: 用户输入的问题
+            show_sources: 是否显示来源文档
+            memory: 会话的对话记忆, 默认使用self.memory
+            
+        Yields:
+            与stream_chat相同的事件
+        """
+        if not user_input.strip():
+            yield {"type": "end", "answer": "请输入您的问题。", "sources": [], "cached": False}
+            return
+        
+        loop = asyncio.get_running_loop()
+        with tracer.trace("chat", mode="async") as trace:
+            memory = self.memory if memory is None else memory
+            chat_history = _get_chat_history(memory.buffer_messages())
+            with tracer.span("condense"):
+                if self._needs_condense(user_input, chat_history):
+                    question = await self.qa_chain.question_generator.arun(
+                        question=user_input,
+                        chat_history=chat_history
+                    )
+                else:
+                    question = user_input
+            # 线程池中执行的检索需要复制当前上下文, 其中的span才能归入本轮链路
+            context = contextvars.copy_context()
+            turn = await loop.run_in_executor(None, context.run, self._retrieve, question)
+            
+            if turn["cached"] is not None:
+                answer = turn["cached"]["answer"]
+                yield {"type": "token", "content": answer}
+            else:
+                prompt = self._traced_prompt(turn["docs"], question, chat_history)
+                parts = []
+                with tracer.span("llm") as span:
+                    async for chunk in self.llm.astream(prompt):
+                        text = self._chunk_text(chunk)
+                        if text:
+                            if not parts:
+                                self._record_first_token(span)
+                            parts.append(text)
+                            yield {"type": "token", "content": text}
+                    self._record_completion(span, parts)
+                answer = "".join(parts)
+            
+            trace.set(cached=turn["cached"] is not None)
+            response = self._finish_turn(memory, user_input, turn, answer, show_sources)
+        yield {"type": "end", **response}
+    
+    def answer(self, question: str, docs: List[Document]) -> str:
+        """
+        无状态地回答一个独立问题(离线批量问答, 见app/batch.py)
+        
+        文档已由调用方检索(RAGRetriever.retrieve_batch); 不读写对话记忆和语义回答缓存,
+        可在多个线程中并发调用。LLM调用失败时异常原样抛出, 由调用方决定是否重试。
+        
+        Args:
+            question: 问题
+            docs: 相关文档
+            
+        Returns:
+            回答文本
+        """
+        with tracer.trace("chat", mode="batch") as trace:
+            trace.set(docs=len(docs))
+            answer = "".join(self._generate(docs, question, ""))
+        return answer or "抱歉,我无法回答这个问题。"
+    
+    def _retrieve(self, question: str) -> Dict:
+        """检索独立问题的相关文档, 并查询语义回答缓存"""
+        source_docs, vector = self.rag_retriever.retrieve_with_vector(question)
+        turn = {
+            "question": question,
+            "docs": source_docs,
+            "chunk_ids": [doc.metadata.get("chunk_id", "") for doc in source_docs],
+            "vector": vector,
+            "cached": None
+        }
+        
+        if self.answer_cache is not None:
+            with tracer.span("answer_cache") as span:
+                # 复用检索时的查询向量, 只有未做向量检索时才单独嵌入
+                if turn["vector"] is None:
+                    turn["vector"] = self.rag_retriever.embeddings.embed_query(question)
+                turn["cached"] = self.answer_cache.lookup(
+                    turn["vector"], turn["chunk_ids"], index_version=self.rag_retriever.index_version
+                )
+                span.set(hit=turn["cached"] is not None)
+            tracer.count("chatbot_cache_total", cache="answer", result="hit" if turn["cached"] is not None else "miss")
         
-        answer = result.get("answer", "抱歉,我无法回答这个问题。")
-        source_docs = result.get("source_documents", [])
+        return turn
+    
+    def _generate(self, docs: List[Document], question: str, chat_history: str) -> Iterator[str]:
+        """流式调用LLM生成回答, 逐个产出文本片段(记录首token耗时和token数)"""
+        prompt = self._traced_prompt(docs, question, chat_history)
+        parts = []
+        with tracer.span("llm") as span:
+            for chunk in self.llm.stream(prompt):
+                text = self._chunk_text(chunk)
+                if text:
+                    if not parts:
+                        self._record_first_token(span)
+                    parts.append(text)
+                    yield text
+            self._record_completion(span, parts)
+    
+    def _traced_prompt(self, docs: List[Document], question: str, chat_history: str):
+        """拼接提示词并记录其token数"""
+        with tracer.span("build_prompt") as span:
+            prompt = self._build_prompt(docs, question, chat_history)
+            if tracer.enabled:
+                tokens = count_tokens(prompt.to_string())
+                span.set(prompt_tokens=tokens)
+                tracer.count("chatbot_tokens_total", tokens, kind="prompt")
+        return prompt
+    
+    @staticmethod
+    def _record_first_token(span):
+        ttft = span.elapsed()
+        span.set(ttft_ms=round(ttft * 1000, 3))
+        tracer.observe("chatbot_llm_first_token_seconds", ttft)
+    
+    @staticmethod
+    def _record_completion(span, parts: List[str]):
+        if tracer.enabled:
+            tokens = count_tokens("".join(parts))
+            span.set(completion_tokens=tokens)
+            tracer.count("chatbot_tokens_total", tokens, kind="completion")
+    
+    def _build_prompt(self, docs: List[Document], question: str, chat_history: str):
+        """按问答链的提示词模板拼接上下文和问题(上下文先打包到token预算内)"""
+        if CONTEXT_PACKING:
+            docs, stats = pack_context(docs, CONTEXT_MAX_TOKENS)
+            if tracer.enabled:
+                tracer.annotate(
+                    context_tokens_before=stats["tokens_before"],
+                    context_tokens_after=stats["tokens_after"],
+                    context_chunks=f"{stats['chunks_before']}->{stats['chunks_after']}"
+                )
+                tracer.count("chatbot_context_tokens_total", stats["tokens_before"], stage="retrieved")
+                tracer.count("chatbot_context_tokens_total", stats["tokens_after"], stage="packed")
+        combine_chain = self.qa_chain.combine_docs_chain
+        inputs = combine_chain._get_inputs(docs, question=question, chat_history=chat_history)
+        return combine_chain.llm_chain.prompt.format_prompt(**inputs)
+    
+    @staticmethod
+    def _chunk_text(chunk) -> str:
+        """提取流式输出片段的文本(聊天模型为消息块, 补全模型为字符串)"""
+        return chunk if isinstance(chunk, str) else getattr(chunk, "content", "")
+    
+    def _finish_turn(self, memory, user_input: str, turn: Dict, answer: str, show_sources: bool) -> Dict:
+        """写入回答缓存、更新对话记忆并组装响应"""
+        answer = answer or "抱歉,我无法回答这个问题。"
+        if self.answer_cache is not None and turn["cached"] is None:
+            self.answer_cache.store(
+                turn["question"], turn["vector"], answer, turn["chunk_ids"],
+                index_version=self.rag_retriever.index_version
+            )
+        
+        memory.save_context({"question": user_input}, {"answer": answer})
         
         response = {
             "answer": answer,
-            "sources": []
+            "sources": [],
+            "cached": turn["cached"] is not None
         }
         
         # 如果需要显示来源
-        if show_sources and source_docs:
-            for i, doc in enumerate(source_docs[:3], 1):
+        if show_sources and turn["docs"]:
+            for i, doc in enumerate(turn["docs"][:3], 1):
                 response["sources"].append({
                     "index": i,
                     "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
@@ -237,6 +535,71 @@ class GovernmentChatbot:
         
         return response
     
+    def _needs_condense(self, user_input: str, chat_history: str) -> bool:
+        """判断是否需要调用LLM改写问题, 并记录所走的路径"""
+        if not chat_history:
+            path = "no_history"
+        elif CONDENSE_FAST_PATH and is_standalone_question(
+            user_input, self.rag_retriever.institutions(), CONDENSE_MIN_CHARS
+        ):
+            path = "standalone"
+        else:
+            path = "condensed"
+        
+        with self._stats_lock:
+            self.condense_stats[path] += 1
+        tracer.annotate(path=path)
+        return path == "condensed"
+    
+    def _condense_question(self, user_input: str, chat_history: str) -> str:
+        """结合对话历史将用户问题改写为独立问题(首轮或完整问题直接使用原问题)"""
+        with tracer.span("condense"):
+            if not self._needs_condense(user_input, chat_history):
+                return user_input
+            
+            return self.qa_chain.question_generator.run(
+                question=user_input,
+                chat_history=chat_history
+            )
+    
+    def get_cache_stats(self) -> Dict:
+        """
+        获取回答缓存命中统计
+        
+        Returns:
+            包含hits/misses/hit_rate/size的字典, 未启用缓存时为空字典
+        """
+        if self.answer_cache is None:
+            return {}
+        return self.answer_cache.stats()
+    
+    def get_llm_status(self) -> List[Dict]:
+        """LLM路由中各服务的状态与首token耗时(未使用路由时为空)"""
+        return self.llm.status() if hasattr(self.llm, "status") else []
+    
+    def get_condense_stats(self) -> Dict[str, int]:
+        """
+        获取问题改写路径统计
+        
+        Returns:
+            各路径(no_history/standalone/condensed)的次数
+        """
+        with self._stats_lock:
+            return dict(self.condense_stats)
+    
+    def get_memory_usage(self, memory=None) -> Dict[str, int]:
+        """
+        获取对话记忆的token占用
+        
+        Args:
+            memory: 会话的对话记忆, 默认使用self.memory
+            
+        Returns:
+            包含summary/pending/recent/total/budget的字典
+        """
+        memory = self.memory if memory is None else memory
+        return memory.token_usage()
+    
     def reset_conversation(self):
         """重置对话历史"""
         self.memory.clear()
@@ -251,6 +614,8 @@ class GovernmentChatbot:
         """
         messages = self.memory.chat_memory.messages
         history = []
+        if self.memory.summary:
+            history.append({"role": "摘要", "content": self.memory.summary})
         
         for msg in messages:
             if hasattr(msg, 'type'):
@@ -0,0 +1,117 @@
+"""
+Markdown结构化分块模块
+Structure-Aware Markdown Chunking Module
+
+按Markdown标题(如公告中的"# 一、招聘岗位 / # 二、基本条件")切分章节, 文本块不跨越章节;
+超过chunk_size的章节依次在段落、换行、句末标点、逗号处切开, 相邻文本块之间没有重叠。
+
+每个文本块的metadata:
+    source        来源文件
+    section       所属章节标题(文档开头没有标题的部分为"")
+    heading_path  从一级标题到所属章节的标题路径, 以" / "连接
+    start_index   文本块在源文件中的起始字符位置
+    end_index     结束字符位置(不含), page_content == 原文[start_index:end_index]
+
+只扫描一遍文本(线性时间), 以生成器逐个产出文本块。
+"""
+
+import re
+from typing import Iterable, Iterator, List, Tuple
+
+from langchain.schema import Document
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t#]*$", re.MULTILINE)
+HEADING_SEPARATOR = " / "
+
+# 章节过长时的切分位置, 按优先级排列
+BREAKS = (
+    ("\n\n",),
+    ("\n",),
+    ("。", "！", "？", "；", "!", "?", ";"),
+    ("，", ","),
+)
+
+
+def _sections(text: str) -> Iterator[Tuple[int, int, List[str]]]:
+    """
+    按标题切分, 依次产出(起始位置, 结束位置, 标题路径); 每个章节从其标题行开始。
+    只有标题没有正文的章节(紧跟子标题)并入下一个章节, 不单独成块。
+    """
+    path: List[Tuple[int, str]] = []
+    start = 0
+    heading_end = 0
+    for match in HEADING_PATTERN.finditer(text):
+        if text[heading_end:match.start()].strip():
+            yield start, match.start(), [title for _, title in path]
+            start = match.start()
+        heading_end = match.end()
+        level = len(match.group(1))
+        while path and path[-1][0] >= level:
+            path.pop()
+        path.append((level, match.group(2).strip()))
+    if start < len(text):
+        yield start, len(text), [title for _, title in path]
+
+
+def _break_at(text: str, start: int, limit: int) -> int:
+    """在text[start:limit]中寻找最靠后的切分位置(切分符之后), 找不到时在limit处硬切"""
+    # 切分位置太靠前时文本块过碎, 改用下一级切分符
+    floor = start + (limit - start) // 4
+    for separators in BREAKS:
+        best = max(text.rfind(separator, start, limit) + len(separator) for separator in separators)
+        if best > floor:
+            return best
+    return limit
+
+
+def _spans(text: str, start: int, end: int, chunk_size: int) -> Iterator[Tuple[int, int]]:
+    """把章节切成不超过chunk_size的片段, 去掉首尾空白"""
+    position = start
+    while position < end:
+        limit = min(end, position + chunk_size)
+        cut = end if limit == end else _break_at(text, position, limit)
+        left, right = position, cut
+        while left < right and text[left].isspace():
+            left += 1
+        while right > left and text[right - 1].isspace():
+            right -= 1
+        if right > left:
+            yield left, right
+        position = cut
+
+
+class MarkdownChunker:
+    """按Markdown章节分块, 附带标题路径与字符位置"""
+
+    def __init__(self, chunk_size: int):
+        self.chunk_size = chunk_size
+
+    def split_text(self, text: str, metadata: dict) -> Iterator[Document]:
+        """
+        分割单个文档
+
+        Args:
+            text: 文档全文
+            metadata: 文档的metadata(如source), 复制到每个文本块
+
+        Yields:
+            文本块
+        """
+        for start, end, headings in _sections(text):
+            section = headings[-1] if headings else ""
+            heading_path = HEADING_SEPARATOR.join(headings)
+            for left, right in _spans(text, start, end, self.chunk_size):
+                yield Document(
+                    page_content=text[left:right],
+                    metadata=dict(
+                        metadata,
+                        section=section,
+                        heading_path=heading_path,
+                        start_index=left,
+                        end_index=right,
+                    )
+                )
+
+    def split_documents(self, documents: Iterable[Document]) -> Iterator[Document]:
+        for document in documents:
+            yield from self.split_text(document.page_content, document.metadata)
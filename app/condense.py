@@ -0,0 +1,47 @@
+"""
+问题改写路由模块
+Question Condensing Router Module
+
+判断用户问题是否需要结合对话历史改写。改写需要一次额外的LLM调用,
+对于首轮提问或本身语义完整的问题可以直接跳过。
+
+"面试什么时候开始?"没有指代词, 但仍在问上一轮讨论的单位; 因此只有点名了具体实体
+(知识库中的招聘单位, 见RAGRetriever.institutions)的问题才视为完整问题。
+"""
+
+import re
+from typing import Iterable
+
+# 指代词(子串匹配, 如"这"同时覆盖"这个/这些/这里"): 出现时问题通常依赖上文,
+# 误判只会多一次改写, 不影响正确性
+REFERENCE_WORDS = ("它", "其", "该", "此", "这", "那", "他", "她", "上述", "上面", "前面", "刚才", "之前")
+
+# 省略/承接开头: "那...", "还有...", "另外..."
+FOLLOW_UP_PREFIXES = ("那", "还有", "另外", "然后", "以及", "和", "并且", "而且", "也")
+
+# 以"呢"结尾的短问句通常是省略问句, 如"学历呢?"
+_ELLIPSIS_ENDING = re.compile(r"呢\s*[?？。!！]*\s*$")
+
+
+def is_standalone_question(question: str, entities: Iterable[str] = (), min_chars: int = 8) -> bool:
+    """
+    使用本地启发式规则判断问题是否语义完整(不依赖对话历史)
+
+    Args:
+        question: 用户问题
+        entities: 已知的实体名称(如招聘单位), 问题中没有出现任何一个时需要改写
+        min_chars: 判定为完整问题的最少字符数, 更短的问题视为省略问句
+
+    Returns:
+        True表示可以跳过问题改写
+    """
+    text = question.strip()
+    if len(text) < min_chars:
+        return False
+    if text.startswith(FOLLOW_UP_PREFIXES):
+        return False
+    if _ELLIPSIS_ENDING.search(text):
+        return False
+    if any(word in text for word in REFERENCE_WORDS):
+        return False
+    return any(entity in text for entity in entities)
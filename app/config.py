@@ -16,26 +16,155 @@ QW_API_KEY = os.getenv("QW_API_KEY", "")
 QW_Model = os.getenv("QW_Model", "qwen2.5-14b-instruct-1m")
 QW_API_BASE_URL = os.getenv("QW_API_BASE_URL", "")
 # 模型配置
-# 支持的模型类型: "openai", "ollama", "fake"
+# 支持的模型类型: "openai", "qw", "ollama", "router", "fake"
 LLM_TYPE = os.getenv("LLM_TYPE", "auto")  # auto 自动选择
-LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")  # OpenAI模型
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen3:4b")  # Ollama本地模型
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")  # Ollama服务地址
 TEMPERATURE = float(os.getenv("TEMPERATURE", "0.7"))
 OLLAMA_API_KEY = os.getenv('OLLAMA_API_KEY','') #Ollama 云模型
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.deepseek.com/v1")  # OpenAI兼容接口(默认DeepSeek)
+OPENAI_CHAT_MODEL = os.getenv("OPENAI_CHAT_MODEL", "deepseek-chat")
+
+# Ollama(LLM_TYPE=ollama): 请求间隔超过OLLAMA_KEEP_ALIVE时模型被卸载, 已计算的KV缓存随之丢失
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # 如 "30m", "1h", "-1"(常驻)
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "0"))  # 上下文窗口(token), 0为服务端默认
+
+# LLM路由(LLM_TYPE=router): 在多个已配置的服务之间故障转移, 所有服务共享一个HTTP连接池
+LLM_BACKENDS = os.getenv("LLM_BACKENDS", "qw,openai,ollama")  # 缺少API Key或服务地址的自动跳过
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))  # 秒
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "30"))  # 首token及相邻两段输出之间的最长等待(秒)
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "300"))  # 本地模型首次加载较慢
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "32"))  # 连接池的最大连接数(所有服务合计)
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))  # 空闲连接保留时间(秒)
+LLM_CIRCUIT_FAILURES = int(os.getenv("LLM_CIRCUIT_FAILURES", "3"))  # 连续失败N次后熔断
+LLM_CIRCUIT_COOLDOWN = float(os.getenv("LLM_CIRCUIT_COOLDOWN", "30"))  # 熔断持续时间(秒)
+# 对冲请求: 首选服务超过其首token耗时P95仍未返回时, 向下一个服务发出同样的请求, 采用先返回的
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "2.0"))  # 延迟样本不足时的对冲等待(秒)
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.1"))  # 对冲等待下限(秒)
 
 # 向量数据库配置
 # 使用更简单的模型名称(自动从Hugging Face下载)
 # 备选模型: "all-MiniLM-L6-v2" (英文), "paraphrase-multilingual-MiniLM-L12-v2" (多语言)
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"  # 轻量级英文模型,下载更快
 # 如果需要中文支持,改为: "paraphrase-multilingual-MiniLM-L12-v2"
+# 嵌入推理后端: "torch"(sentence-transformers, 全精度) 或 "onnx"(onnxruntime, 不需要torch)
+# 切换后端或量化设置会触发全量重建(向量略有差异), 可先用 python benchmark.py embeddings 检查一致性
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model.onnx")  # 模型仓库中的ONNX文件
+EMBEDDING_QUANTIZE = os.getenv("EMBEDDING_QUANTIZE", "true").lower() == "true"  # int8动态量化(需要onnx包)
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # onnxruntime算子内线程数, 0为按物理核数自动选择
+# 并发的查询嵌入合并为一次前向计算: 最多等待EMBED_QUERY_MAX_WAIT_MS毫秒或凑满EMBED_QUERY_BATCH_SIZE条
+EMBED_QUERY_BATCH_SIZE = int(os.getenv("EMBED_QUERY_BATCH_SIZE", "32"))
+EMBED_QUERY_MAX_WAIT_MS = float(os.getenv("EMBED_QUERY_MAX_WAIT_MS", "2"))
 VECTOR_STORE_PATH = "data/vector_store"
+# 向量数据库后端: "faiss"(默认), "chroma"(ChromaDB持久化集合), "numpy"(暴力检索, 无额外依赖)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "faiss")
+CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "rag_collection")
+# 增量索引清单文件(位于VECTOR_STORE_PATH下, 记录文件/文本块的内容哈希)
+INDEX_MANIFEST_FILE = "manifest.json"
+# 嵌入向量缓存(按 模型+归一化标志+文本哈希 持久化到磁盘, 前置内存LRU)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_DIR = "./.cache/embeddings"
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", "10000"))
+# 文档入库: 每批嵌入的文本块数量, 以及sentence-transformers编码进程数(>1时启用多进程池)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+# 向量索引类型: "flat"(精确检索), "ivf_flat", "ivf_pq", "hnsw"
+# IVF/PQ在前ANN_TRAIN_SAMPLE个向量上训练; 修改类型或构建参数会触发全量重建(嵌入走缓存)
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")
+ANN_TRAIN_SAMPLE = int(os.getenv("ANN_TRAIN_SAMPLE", "50000"))
+IVF_NLIST = int(os.getenv("IVF_NLIST", "1024"))  # 聚类中心数上限(按训练样本数自动缩小)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))  # 查询时搜索的聚类数
+PQ_M = int(os.getenv("PQ_M", "48"))  # PQ子空间数(需整除向量维度, 否则自动取约数)
+PQ_NBITS = int(os.getenv("PQ_NBITS", "8"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))  # 查询时的候选列表长度
 CHUNK_SIZE = 500
-CHUNK_OVERLAP = 100
+# 分块方式: "markdown"(按标题切分章节, 无重叠, 附带章节metadata), "recursive"(按字符递归切分, 带重叠)
+# 修改分块方式会触发全量重建
+CHUNKER = os.getenv("CHUNKER", "markdown")
+CHUNK_OVERLAP = 100  # 仅用于recursive
 
 # RAG配置
 TOP_K_RESULTS = 3
-SCORE_THRESHOLD = 0.5
+SCORE_THRESHOLD = float(os.getenv("SCORE_THRESHOLD", "0.5"))  # 重排序相关度(0~1)下限, 低于此值的文本块不进入提示词
+
+# 上下文打包: 去重、合并同一来源中重叠/相邻的文本块, 按相关度排序并截断到token预算(<=0表示不限制)
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "true").lower() == "true"
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+
+# 交叉编码器重排序: 先检索RERANK_CANDIDATES个候选, 打分后只保留TOP_K_RESULTS个
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+# 如果需要中文支持,改为: "BAAI/bge-reranker-base"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_BACKEND = os.getenv("RERANK_BACKEND", "auto")  # "auto", "onnx"(onnxruntime), "torch"(sentence-transformers)
+# 模型仓库中的ONNX文件, 可改为仓库自带的量化版本(如 "onnx/model_qint8_avx512.onnx")
+RERANK_ONNX_FILE = os.getenv("RERANK_ONNX_FILE", "onnx/model.onnx")
+RERANK_QUANTIZE = os.getenv("RERANK_QUANTIZE", "false").lower() == "true"  # 本地int8动态量化(需要onnx包)
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "512"))
+RERANK_MIN_KEEP = int(os.getenv("RERANK_MIN_KEEP", "1"))  # 全部低于SCORE_THRESHOLD时仍保留的文本块数
+
+# 检索微批处理: 并发会话的查询在RETRIEVAL_BATCH_MAX_WAIT_MS毫秒内合并,
+# 一次embed_documents嵌入、一次向量索引批量检索, 再把结果分发给各调用方
+RETRIEVAL_BATCH_ENABLED = os.getenv("RETRIEVAL_BATCH_ENABLED", "true").lower() == "true"
+RETRIEVAL_BATCH_SIZE = int(os.getenv("RETRIEVAL_BATCH_SIZE", "32"))
+RETRIEVAL_BATCH_MAX_WAIT_MS = float(os.getenv("RETRIEVAL_BATCH_MAX_WAIT_MS", "2"))
+
+# 元数据过滤: 加载公告时提取 单位/批次/截止日期/岗位类型, 检索时只在满足条件的文本块中检索
+# 问题中出现知识库里的单位名称时自动只检索该单位的公告(默认关闭: 比较多个单位的问题会检索不到其他单位)
+METADATA_AUTO_FILTER = os.getenv("METADATA_AUTO_FILTER", "false").lower() == "true"
+FILTER_EXACT_MAX_ROWS = int(os.getenv("FILTER_EXACT_MAX_ROWS", "4096"))  # 过滤后文本块不超过该数量时精确检索(IVF/HNSW)
+
+# 混合检索: 向量检索与BM25词法检索各取若干候选, 用倒数排名融合(RRF)合并
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = 60
+# 分词器: "auto"(安装了jieba时使用jieba, 否则字符二元组), "jieba", "bigram"
+LEXICAL_TOKENIZER = os.getenv("LEXICAL_TOKENIZER", "auto")
+LEXICAL_INDEX_DIR = "bm25"  # 位于VECTOR_STORE_PATH下
+
+# 语义回答缓存: 独立问题相似度超过阈值且检索到的文本块一致时直接返回缓存回答
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))  # 秒
+
+# HTTP服务模式(python main.py --serve)
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))  # 同时发往LLM的请求上限
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "10000"))
+SESSION_TTL = int(os.getenv("SESSION_TTL", "1800"))  # 会话空闲过期时间(秒)
+# 多进程服务: 主进程加载索引和嵌入模型后fork出SERVER_WORKERS个工作进程共享(<=1为单进程),
+# 会话按session_id固定转发到同一个工作进程; LLM_MAX_CONCURRENCY与MAX_SESSIONS为每个工作进程的上限
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "1"))
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "0"))  # 每个工作进程的推理/检索线程数, 0为按CPU核数均分
+
+# 离线批量问答(python main.py --batch questions.jsonl): 并发LLM请求数与限流重试
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_RETRIES = int(os.getenv("BATCH_MAX_RETRIES", "5"))
+BATCH_RETRY_BASE_DELAY = float(os.getenv("BATCH_RETRY_BASE_DELAY", "1.0"))  # 秒, 每次重试翻倍
+BATCH_RETRY_MAX_DELAY = float(os.getenv("BATCH_RETRY_MAX_DELAY", "60"))  # 秒
+
+# 对话链路追踪: 各阶段耗时汇总为Prometheus指标(服务模式 GET /metrics)
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_LOG_FILE = os.getenv("TRACE_LOG_FILE", "")  # 设置后每轮对话的链路以JSON行追加写入
+METRICS_FILE = os.getenv("METRICS_FILE", "")  # 设置后定期写入Prometheus文本格式指标
+
+# Token计数使用的tiktoken编码(不可用时退化为本地估算)
+TOKENIZER_ENCODING = "cl100k_base"
+
+# 对话记忆: 最近N轮原样保留, 更早的对话在后台压缩为滚动摘要, 总量不超过token预算
+MEMORY_MAX_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", "1500"))
+MEMORY_KEEP_TURNS = int(os.getenv("MEMORY_KEEP_TURNS", "4"))
+
+# 问题改写快速路径: 首轮提问或语义完整(点名知识库中的单位且没有指代词)的问题跳过改写LLM调用
+CONDENSE_FAST_PATH = os.getenv("CONDENSE_FAST_PATH", "true").lower() == "true"
+CONDENSE_MIN_CHARS = int(os.getenv("CONDENSE_MIN_CHARS", "8"))  # 更短的问题视为省略问句
+CONDENSE_MODEL = os.getenv("CONDENSE_MODEL", "")  # 可选: 用更小更快的模型做问题改写(同一服务商)
 
 # 知识库文件路径
 KNOWLEDGE_BASE_PATH = "data"
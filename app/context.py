@@ -0,0 +1,163 @@
+"""
+上下文打包模块
+Context Packing Module
+
+把检索到的文本块组装为问答提示词中的上下文:
+
+1. 去重: 内容相同的文本块只保留检索排名最靠前的一个
+2. 合并: 同一来源文件中重叠或相邻的文本块合并为一段, 重叠部分只出现一次;
+   文本块带start_index/end_index时按字符位置合并, 否则按"前一块的结尾就是后一块的开头"的重叠文本合并
+3. 排序: 合并后的段落按其中最相关文本块的检索排名排列, 段内保持原文顺序
+4. 截断: 按token预算依次放入段落, 超出预算的段落截断(剩余预算太少时丢弃)
+
+token计数使用app/tokens.py(tiktoken, 不可用时本地估算)。
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+from langchain.schema import Document
+
+from app.tokens import count_tokens, truncate_tokens
+
+# 同一来源的两个文本块相隔不超过该字符数(之间只有空白)时视为相邻
+ADJACENT_GAP = 4
+# 没有字符位置时, 重叠文本至少这么长才合并(避免把偶然相同的短句当作重叠)
+MIN_OVERLAP_CHARS = 20
+# 剩余预算不足该token数时不再截断放入下一段
+MIN_TRUNCATED_TOKENS = 32
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class _Passage:
+    """一段上下文: 一个或多个合并后的文本块"""
+
+    def __init__(self, doc: Document, rank: int):
+        self.rank = rank
+        self.source = doc.metadata.get("source", "")
+        self.text = doc.page_content
+        self.start: Optional[int] = doc.metadata.get("start_index")
+        self.end: Optional[int] = None
+        if self.start is not None:
+            self.end = doc.metadata.get("end_index", self.start + len(self.text))
+        self.docs = [doc]
+
+    def absorb(self, other: "_Passage", text: str):
+        self.text = text
+        self.rank = min(self.rank, other.rank)
+        self.docs.extend(other.docs)
+        if self.end is not None and other.end is not None:
+            self.end = max(self.end, other.end)
+
+    def to_document(self) -> Document:
+        metadata = dict(self.docs[0].metadata)
+        if len(self.docs) > 1:
+            metadata["chunk_ids"] = [doc.metadata.get("chunk_id", "") for doc in self.docs]
+            if self.start is not None:
+                metadata["start_index"], metadata["end_index"] = self.start, self.end
+        return Document(page_content=self.text, metadata=metadata)
+
+
+def _overlap(left: str, right: str) -> int:
+    """left的结尾与right的开头重合的最长字符数(不足MIN_OVERLAP_CHARS时为0)"""
+    for size in range(min(len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _merge_positioned(passages: List[_Passage]) -> List[_Passage]:
+    """按字符位置合并同一来源中重叠或相邻的段落"""
+    merged: List[_Passage] = []
+    for passage in sorted(passages, key=lambda p: p.start):
+        last = merged[-1] if merged else None
+        if last is None or passage.start > last.end + ADJACENT_GAP:
+            merged.append(passage)
+        elif passage.end <= last.end:
+            # 完全包含在前一段中
+            last.absorb(passage, last.text)
+        elif passage.start < last.end:
+            last.absorb(passage, last.text + passage.text[last.end - passage.start:])
+        else:
+            last.absorb(passage, last.text + "\n" + passage.text)
+    return merged
+
+
+def _merge_by_text(passages: List[_Passage]) -> List[_Passage]:
+    """没有字符位置时, 合并被包含的段落以及首尾重叠的段落"""
+    passages = list(passages)
+    changed = True
+    while changed:
+        changed = False
+        for left in passages:
+            for right in passages:
+                if left is right:
+                    continue
+                if right.text in left.text:
+                    left.absorb(right, left.text)
+                else:
+                    size = _overlap(left.text, right.text)
+                    if not size:
+                        continue
+                    left.absorb(right, left.text + right.text[size:])
+                passages.remove(right)
+                changed = True
+                break
+            if changed:
+                break
+    return passages
+
+
+def pack_context(docs: List[Document], max_tokens: int) -> Tuple[List[Document], Dict[str, int]]:
+    """
+    去重、合并、排序并按token预算截断检索到的文本块
+
+    Args:
+        docs: 检索结果(按相关度从高到低)
+        max_tokens: 上下文的token预算(<=0表示不限制)
+
+    Returns:
+        (打包后的文档列表, {"chunks_before", "chunks_after", "tokens_before", "tokens_after"})
+    """
+    stats = {
+        "chunks_before": len(docs),
+        "tokens_before": sum(count_tokens(doc.page_content) for doc in docs),
+    }
+
+    seen = set()
+    by_source: Dict[str, List[_Passage]] = {}
+    for rank, doc in enumerate(docs):
+        key = _WHITESPACE.sub(" ", doc.page_content).strip()
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        passage = _Passage(doc, rank)
+        by_source.setdefault(passage.source, []).append(passage)
+
+    passages: List[_Passage] = []
+    for source_passages in by_source.values():
+        if all(passage.start is not None for passage in source_passages):
+            passages.extend(_merge_positioned(source_passages))
+        else:
+            passages.extend(_merge_by_text(source_passages))
+    passages.sort(key=lambda passage: passage.rank)
+
+    packed: List[Document] = []
+    used = 0
+    for passage in passages:
+        tokens = count_tokens(passage.text)
+        if max_tokens <= 0 or used + tokens <= max_tokens:
+            packed.append(passage.to_document())
+            used += tokens
+            continue
+        remaining = max_tokens - used
+        if remaining >= MIN_TRUNCATED_TOKENS or not packed:
+            passage.text = truncate_tokens(passage.text, remaining)
+            packed.append(passage.to_document())
+            used += count_tokens(passage.text)
+        break
+
+    stats["chunks_after"] = len(packed)
+    stats["tokens_after"] = used
+    return packed, stats
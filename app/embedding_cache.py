@@ -0,0 +1,290 @@
+"""
+嵌入向量缓存模块
+Persistent Embedding Cache Module
+
+以 (嵌入模型, 归一化标志, 规范化文本哈希) 为键缓存嵌入向量:
+内存中使用LRU缓存热点文本, 磁盘上使用float32内存映射文件保存向量,
+并使用追加写入的哈希索引文件记录每个键所在的行。
+
+只有文档(文本块)的向量写入磁盘; 用户查询各不相同, 只保存在内存LRU中,
+否则服务模式下磁盘文件会随查询数无限增长。
+"""
+
+import os
+import json
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.tracing import tracer
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本(全角/半角统一、合并空白), 用于生成缓存键"""
+    text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """磁盘持久化的嵌入向量缓存, 前置内存LRU"""
+
+    VECTORS_FILE = "vectors.f32"
+    INDEX_FILE = "index.tsv"
+    META_FILE = "meta.json"
+
+    def __init__(self, cache_dir: str, model_name: str, normalize: bool, memory_size: int = 10000):
+        """
+        初始化嵌入缓存
+
+        Args:
+            cache_dir: 缓存根目录
+            model_name: 嵌入模型名称
+            normalize: 嵌入向量是否归一化
+            memory_size: 内存LRU缓存的最大条目数
+        """
+        namespace = hashlib.sha256(f"{model_name}|normalize={normalize}".encode('utf-8')).hexdigest()[:16]
+        self.path = os.path.join(cache_dir, namespace)
+        self.model_name = model_name
+        self.normalize = normalize
+        self.memory_size = memory_size
+
+        self.dim: Optional[int] = None
+        self._rows: Dict[str, int] = {}
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._mmap: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+
+        os.makedirs(self.path, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def make_key(text: str) -> str:
+        """计算文本的缓存键"""
+        return hashlib.sha1(normalize_text(text).encode('utf-8')).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        """加载元数据和哈希索引"""
+        meta_path = self._file(self.META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                self.dim = json.load(f).get("dim")
+
+        index_path = self._file(self.INDEX_FILE)
+        if self.dim is None or not os.path.exists(index_path):
+            return
+
+        # 忽略向量文件中尚未完整写入的行
+        total_rows = self._total_rows()
+        with open(index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                key, _, row = line.rstrip("\n").partition("\t")
+                if row.isdigit() and int(row) < total_rows:
+                    self._rows[key] = int(row)
+
+    def _total_rows(self) -> int:
+        """向量文件中完整写入的行数"""
+        vectors_path = self._file(self.VECTORS_FILE)
+        if not os.path.exists(vectors_path):
+            return 0
+        return os.path.getsize(vectors_path) // (self.dim * 4)
+
+    def _vectors(self, min_rows: int) -> np.memmap:
+        """获取覆盖至少min_rows行的只读内存映射"""
+        if self._mmap is None or self._mmap.shape[0] < min_rows:
+            self._mmap = np.memmap(
+                self._file(self.VECTORS_FILE),
+                dtype=np.float32,
+                mode='r',
+                shape=(self._total_rows(), self.dim)
+            )
+        return self._mmap
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """批量查询缓存, 返回命中的键到向量的映射"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                    continue
+
+                row = self._rows.get(key)
+                if row is None:
+                    continue
+                vector = np.array(self._vectors(row + 1)[row])
+                self._remember(key, vector)
+                found[key] = vector
+        return found
+
+    def put_many(self, keys: List[str], vectors: np.ndarray, persist: bool = True):
+        """批量写入缓存(追加到磁盘文件), persist为False时只写入内存LRU"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(keys) == 0:
+            return
+
+        if not persist:
+            with self._lock:
+                for key, vector in zip(keys, vectors):
+                    self._remember(key, vector.copy())
+            return
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self._file(self.META_FILE), 'w', encoding='utf-8') as f:
+                    json.dump({"model_name": self.model_name, "normalize": self.normalize, "dim": self.dim}, f)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"嵌入维度不一致: {vectors.shape[1]} != {self.dim}")
+
+            pending = [(key, vector) for key, vector in zip(keys, vectors) if key not in self._rows]
+            for key, vector in zip(keys, vectors):
+                self._remember(key, vector.copy())
+            if not pending:
+                return
+
+            with open(self._file(self.VECTORS_FILE), 'ab') as vf, open(self._file(self.INDEX_FILE), 'ab') as kf:
+                # 多进程同时写入时以文件锁保证向量行与索引对应
+                if fcntl is not None:
+                    fcntl.flock(kf.fileno(), fcntl.LOCK_EX)
+                try:
+                    vf.seek(0, os.SEEK_END)
+                    start_row = vf.tell() // (self.dim * 4)
+                    vf.write(np.stack([vector for _, vector in pending]).tobytes())
+                    vf.flush()
+                    kf.write("".join(
+                        f"{key}\t{start_row + i}\n" for i, (key, _) in enumerate(pending)
+                    ).encode('utf-8'))
+                    kf.flush()
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(kf.fileno(), fcntl.LOCK_UN)
+
+            for i, (key, _) in enumerate(pending):
+                self._rows[key] = start_row + i
+
+    def _remember(self, key: str, vector: np.ndarray):
+        """写入内存LRU缓存"""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+
+class CachedEmbeddings(Embeddings):
+    """带持久化缓存的嵌入模型包装器, 只对缓存未命中的文本调用底层模型"""
+
+    def __init__(self, inner, cache: EmbeddingCache):
+        """
+        Args:
+            inner: 底层嵌入模型(HuggingFaceEmbeddings或兼容对象)
+            cache: 嵌入向量缓存
+        """
+        self.inner = inner
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """批量嵌入文档, 只计算未命中的文本"""
+        return self._embed_many(texts, persist=True)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """批量嵌入查询(查询微批处理), 向量只保存在内存LRU中"""
+        return self._embed_many(texts, persist=False)
+
+    def _embed_many(self, texts: List[str], persist: bool) -> List[List[float]]:
+        keys = [self.cache.make_key(text) for text in texts]
+        found = self.cache.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        hits = len(texts) - len(missing)
+        self.hits += hits
+        self.misses += len(missing)
+        # 只统计查询; 建索引时的文档嵌入不计入服务的缓存命中率
+        if not persist:
+            if hits:
+                tracer.count("chatbot_cache_total", hits, cache="embedding", result="hit")
+            if missing:
+                tracer.count("chatbot_cache_total", len(missing), cache="embedding", result="miss")
+        if missing:
+            vectors = np.asarray(self.inner.embed_documents(list(missing.values())), dtype=np.float32)
+            self.cache.put_many(list(missing.keys()), vectors, persist=persist)
+            found.update(zip(missing.keys(), vectors))
+
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """嵌入查询文本(向量只保存在内存LRU中)"""
+        key = self.cache.make_key(text)
+        vector = self.cache.get_many([key]).get(key)
+        tracer.annotate(embedding_cache="hit" if vector is not None else "miss")
+        tracer.count("chatbot_cache_total", cache="embedding", result="hit" if vector is not None else "miss")
+        if vector is not None:
+            self.hits += 1
+            return vector.tolist()
+
+        self.misses += 1
+        vector = np.asarray(self.inner.embed_query(text), dtype=np.float32)
+        self.cache.put_many([key], vector[None, :], persist=False)
+        return vector.tolist()
+
+
+class LazyEmbeddings(Embeddings):
+    """首次嵌入时才加载底层模型的包装器, 避免启动时加载嵌入模型"""
+
+    def __init__(self, factory: Callable[[], Embeddings]):
+        """
+        Args:
+            factory: 创建嵌入模型的函数(只调用一次)
+        """
+        self.factory = factory
+        self._inner: Optional[Embeddings] = None
+        self._lock = threading.Lock()
+
+    @property
+    def inner(self) -> Embeddings:
+        if self._inner is None:
+            with self._lock:
+                if self._inner is None:
+                    self._inner = self.factory()
+        return self._inner
+
+    @property
+    def loaded(self) -> bool:
+        return self._inner is not None
+
+    def ensure_loaded(self) -> Embeddings:
+        """立即加载底层模型(默认推迟到首次嵌入)"""
+        return self.inner
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.inner.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        inner = self.inner
+        return inner.embed_queries(texts) if hasattr(inner, "embed_queries") else inner.embed_documents(texts)
@@ -0,0 +1,283 @@
+"""
+检索评测模块
+Retrieval Evaluation Module
+
+标注集中的每个问题给出若干"证据片段": 检索到的文本块只要包含某个证据片段(且来源文件匹配)
+即视为相关。按片段而不是按文本块ID标注, 修改CHUNK_SIZE/CHUNK_OVERLAP后标注依然有效。
+
+另提供:
+    synthetic_corpus   合成招聘公告语料(含可自动生成标注的事实), 用于10k~1M文本块的规模测试
+    HashingEmbeddings  字符n-gram哈希嵌入, 不需要下载模型, 用于完全离线的基准测试
+    embedding_parity   比较两种推理后端(如PyTorch与ONNX int8)的嵌入与检索结果
+"""
+
+import json
+import random
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+
+
+def load_labels(path: str) -> List[Dict]:
+    """
+    读取标注集
+
+    格式: [{"question": "...", "source": "文件名片段(可选)", "evidence": ["证据片段", ...]}, ...]
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        labels = json.load(f)
+    for label in labels:
+        if not label.get("question") or not label.get("evidence"):
+            raise ValueError(f"标注缺少question或evidence: {label}")
+    return labels
+
+
+def matched_evidence(doc: Document, label: Dict) -> List[int]:
+    """文本块包含的证据片段序号(来源不匹配时为空)"""
+    source = label.get("source")
+    if source and source not in doc.metadata.get("source", ""):
+        return []
+    return [i for i, evidence in enumerate(label["evidence"]) if evidence in doc.page_content]
+
+
+def evaluate(results: Sequence[Sequence[Document]], labels: Sequence[Dict], ks: Sequence[int]) -> Dict:
+    """
+    计算检索质量指标
+
+    Args:
+        results: 每个问题的检索结果(按相关度排序, 长度不少于max(ks))
+        labels: 与results一一对应的标注
+        ks: 计算recall@k / hit@k的k值
+
+    Returns:
+        recall@k: 前k个结果覆盖的证据片段比例(按问题平均)
+        hit@k: 前k个结果中至少有一个相关文本块的问题比例
+        mrr: 第一个相关文本块排名倒数的平均值(未命中计0)
+    """
+    metrics = {f"recall@{k}": 0.0 for k in ks}
+    metrics.update({f"hit@{k}": 0.0 for k in ks})
+    reciprocal_ranks = []
+    misses = []
+
+    for docs, label in zip(results, labels):
+        matches = [matched_evidence(doc, label) for doc in docs]
+        for k in ks:
+            covered = {i for found in matches[:k] for i in found}
+            metrics[f"recall@{k}"] += len(covered) / len(label["evidence"])
+            metrics[f"hit@{k}"] += 1.0 if covered else 0.0
+
+        rank = next((position + 1 for position, found in enumerate(matches) if found), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        if rank is None:
+            misses.append(label["question"])
+
+    count = max(1, len(labels))
+    metrics = {name: value / count for name, value in metrics.items()}
+    metrics["mrr"] = sum(reciprocal_ranks) / count
+    metrics["misses"] = misses
+    return metrics
+
+
+def latency_summary(latencies_ms: Sequence[float]) -> Dict[str, float]:
+    """延迟分位数(毫秒)"""
+    if not latencies_ms:
+        return {"mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    values = np.asarray(latencies_ms)
+    return {
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+    }
+
+
+# 合成语料的素材
+_CITIES = ["上海", "浦东", "徐汇", "静安", "闵行", "嘉定", "宝山", "松江", "青浦", "奉贤", "金山", "崇明"]
+_KINDS = ["大学", "职业技术学院", "医院", "中学", "研究所", "图书馆", "疾病预防控制中心", "档案馆", "科技馆", "卫生服务中心"]
+_POSTS = ["辅导员", "教师", "科研助理", "护士", "会计", "信息技术员", "行政管理员", "实验员", "图书管理员", "档案管理员"]
+_DEGREES = ["博士学位", "硕士研究生学历", "大学本科学历", "大专学历"]
+_FILLER = [
+    "热爱本职工作，具有良好的职业道德和团队合作精神。",
+    "遵纪守法，诚实守信，身体健康，能够适应岗位要求。",
+    "应聘者须如实填写报名信息，提供虚假材料的取消应聘资格。",
+    "招聘工作坚持公开、平等、竞争、择优的原则。",
+    "资格审查贯穿招聘全过程，对不符合条件的人员随时取消资格。",
+    "具体岗位职责详见招聘岗位一览表。",
+    "面试成绩合格后按程序组织体检和考察。",
+    "拟聘用人员按规定进行公示，公示期满无异议的办理聘用手续。",
+]
+
+
+def _synthetic_unit(index: int, rng: random.Random) -> Dict:
+    """第index个合成招聘单位及其可标注的事实"""
+    name = f"{rng.choice(_CITIES)}第{index + 1}{rng.choice(_KINDS)}"
+    return {
+        "name": name,
+        "post": f"{rng.choice(_POSTS)}岗{rng.randint(1, 9)}个",
+        "degree": rng.choice(_DEGREES),
+        "deadline": f"2025年{rng.randint(1, 12)}月{rng.randint(1, 28)}日",
+        "email": f"hr{index + 1}@example.gov.cn",
+        "salary": f"年薪{rng.randint(10, 60)}万元",
+    }
+
+
+def _padded(text: str, length: int, rng: random.Random) -> str:
+    """用通用条款把段落补足到约length个字符, 模拟真实文本块长度"""
+    parts = [text]
+    size = len(text)
+    while size < length:
+        filler = rng.choice(_FILLER)
+        parts.append(filler)
+        size += len(filler)
+    return "".join(parts)
+
+
+def synthetic_corpus(n_chunks: int, chunk_chars: int = 400, seed: int = 0) -> Iterator[Document]:
+    """
+    生成n_chunks个合成文本块(每个单位一篇公告, 分为5节)
+
+    文本块只在生成时存在, 可以惰性地流入RAGRetriever.add_chunks。
+    metadata['source']为虚拟文件名, 同一单位的文本块来源相同。
+    """
+    rng = random.Random(seed)
+    # 填充文本使用独立的随机数, 使单位事实只取决于seed(synthetic_labels据此重建)
+    filler_rng = random.Random(seed + 1)
+    for index in range((n_chunks + 4) // 5):
+        unit = _synthetic_unit(index, rng)
+        sections = [
+            f"# 一、招聘岗位\n{unit['name']}招聘{unit['post']}。",
+            f"# 二、基本条件\n{unit['name']}应聘者须具有{unit['degree']}。",
+            f"# 三、岗位待遇\n{unit['name']}提供{unit['salary']}，纳入事业单位编制。",
+            f"# 四、应聘方式\n{unit['name']}报名时间：即日起至{unit['deadline']}。",
+            f"# 五、联系方式\n{unit['name']}请将报名材料发送至{unit['email']}。",
+        ]
+        source = f"synthetic/{unit['name']}.md"
+        for section in sections[:n_chunks - index * 5]:
+            yield Document(page_content=_padded(section, chunk_chars, filler_rng), metadata={"source": source})
+
+
+def synthetic_labels(n_chunks: int, n_questions: int, seed: int = 0) -> List[Dict]:
+    """为synthetic_corpus(n_chunks, seed=seed)生成标注问题"""
+    rng = random.Random(seed)
+    units = [_synthetic_unit(index, rng) for index in range(n_chunks // 5)]
+    sampler = random.Random(seed + 2)
+    templates = [
+        ("{name}招聘什么岗位？", "{name}招聘{post}"),
+        ("{name}对学历有什么要求？", "{name}应聘者须具有{degree}"),
+        ("{name}的薪酬待遇是多少？", "{name}提供{salary}"),
+        ("{name}报名截止到什么时候？", "{name}报名时间：即日起至{deadline}"),
+        ("{name}的报名邮箱是什么？", "{name}请将报名材料发送至{email}"),
+    ]
+
+    labels = []
+    for unit in sampler.sample(units, min(n_questions, len(units))):
+        question, evidence = sampler.choice(templates)
+        labels.append({
+            "question": question.format(**unit),
+            "source": f"synthetic/{unit['name']}.md",
+            "evidence": [evidence.format(**unit)],
+        })
+    return labels
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    字符一元/二元组的特征哈希嵌入(归一化)
+
+    不需要模型文件, 只捕捉字面重合, 检索质量明显低于语义模型;
+    用于离线测量索引构建与查询的开销, 以及在没有模型的环境中跑通评测流程。
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _embed(self, text: str) -> np.ndarray:
+        codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if len(codes) == 0:
+            return vector
+
+        features = [codes * np.uint64(2654435761)]
+        if len(codes) > 1:
+            features.append((codes[:-1] * np.uint64(40503) + codes[1:]) * np.uint64(2246822519))
+        # 乘法哈希的低位分布较差, 桶号和符号取自高位
+        hashed = (np.concatenate(features) % np.uint64(2**32)) >> np.uint64(8)
+        signs = np.where(hashed & np.uint64(1 << 23), 1.0, -1.0).astype(np.float32)
+        np.add.at(vector, (hashed % np.uint64(self.dim)).astype(np.int64), signs)
+
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text).tolist()
+
+
+def _normalized(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def embedding_parity(reference_docs: np.ndarray, reference_queries: np.ndarray,
+                     candidate_docs: np.ndarray, candidate_queries: np.ndarray, k: int) -> Dict[str, float]:
+    """
+    比较两种推理方式(如PyTorch全精度与ONNX int8)对同一组文本的嵌入
+
+    Args:
+        reference_docs / reference_queries: 参照实现的文档向量与查询向量
+        candidate_docs / candidate_queries: 待比较实现的向量(行与参照一一对应)
+        k: 检索结果比较的前k个
+
+    Returns:
+        cosine_mean / cosine_min: 同一文本两种向量的余弦相似度
+        overlap@k: 各自检索(精确余弦)的前k个文档的平均重合比例
+        top1_agreement: 第一名相同的查询比例
+    """
+    ref_docs, cand_docs = _normalized(reference_docs), _normalized(candidate_docs)
+    ref_queries, cand_queries = _normalized(reference_queries), _normalized(candidate_queries)
+    cosines = np.concatenate([
+        np.einsum('ij,ij->i', ref_docs, cand_docs),
+        np.einsum('ij,ij->i', ref_queries, cand_queries),
+    ])
+
+    k = min(k, len(ref_docs))
+    ref_top = np.argsort(-(ref_queries @ ref_docs.T), axis=1, kind="stable")[:, :k]
+    cand_top = np.argsort(-(cand_queries @ cand_docs.T), axis=1, kind="stable")[:, :k]
+    overlaps = [len(set(a) & set(b)) / k for a, b in zip(ref_top, cand_top)]
+    return {
+        "cosine_mean": float(cosines.mean()),
+        "cosine_min": float(cosines.min()),
+        f"overlap@{k}": float(np.mean(overlaps)) if overlaps else 1.0,
+        "top1_agreement": float(np.mean(ref_top[:, 0] == cand_top[:, 0])) if len(ref_top) else 1.0,
+    }
+
+
+def compare_to_baseline(current: Dict, baseline: Dict, max_recall_drop: float,
+                        max_latency_increase: float) -> List[str]:
+    """
+    与基线结果比较, 返回回归项说明(为空表示未回归)
+
+    按语料名称匹配运行结果; 召回率类指标下降超过max_recall_drop(绝对值),
+    或P95延迟增加超过max_latency_increase(相对比例)视为回归。
+    """
+    regressions = []
+    baseline_runs = {run["corpus"]: run for run in baseline.get("runs", [])}
+    for run in current.get("runs", []):
+        previous: Optional[Dict] = baseline_runs.get(run["corpus"])
+        if previous is None:
+            continue
+        for name, value in run["quality"].items():
+            if name == "misses" or name not in previous["quality"]:
+                continue
+            if previous["quality"][name] - value > max_recall_drop:
+                regressions.append(f"{run['corpus']}: {name} {previous['quality'][name]:.3f} → {value:.3f}")
+        old_p95 = previous["latency"]["p95_ms"]
+        new_p95 = run["latency"]["p95_ms"]
+        if old_p95 > 0 and (new_p95 - old_p95) / old_p95 > max_latency_increase:
+            regressions.append(f"{run['corpus']}: P95延迟 {old_p95:.2f}ms → {new_p95:.2f}ms")
+    return regressions
+
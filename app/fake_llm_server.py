@@ -0,0 +1,364 @@
+"""
+本地模拟LLM服务
+Fake LLM HTTP Server for Offline Testing
+
+模拟OpenAI兼容接口(DeepSeek/通义千问)与Ollama接口的流式输出, 不访问网络即可测试
+LLM路由的连接复用、故障转移、熔断和对冲请求(见app/llm_router.py与 python benchmark.py llm):
+
+    POST /v1/chat/completions   OpenAI兼容接口, stream=true时以SSE逐段推送
+    POST /api/generate          Ollama接口, stream=true时逐行输出JSON
+    GET  /stats                 已处理的请求数与建立过的TCP连接数(连接数远小于请求数说明连接被复用)
+
+延迟与故障可配置: 首token延迟(固定值, 按概率叠加长尾延迟)、相邻两段输出的间隔、按概率返回的HTTP错误。
+
+Ollama接口还模拟提示词计算(prefill)与KV缓存(见app/ollama_llm.py), 每个字符计1个token:
+    - 模型首次请求或超过keep_alive未被使用时重新加载(--load-ms), KV缓存清空
+    - num_parallel个槽位各自缓存上一个请求的token序列, 新请求使用公共前缀最长的槽位(相同时用最久未用的),
+      只有前缀之后的token需要计算, 每个耗时--prompt-eval-ms毫秒
+    - 请求中的context(上一轮返回的token)拼接在本轮提示词之前; 响应返回context、prompt_eval_count、
+      prompt_eval_duration、load_duration等与Ollama相同的字段
+
+    python -m app.fake_llm_server --port 8001 --first-token-ms 200 --tail-ms 3000 --tail-rate 0.1
+    python -m app.fake_llm_server --port 11434 --prompt-eval-ms 2 --load-ms 3000
+    QW_API_BASE_URL=http://127.0.0.1:8001/v1  OLLAMA_BASE_URL=http://127.0.0.1:8001
+"""
+
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+
+# 模拟的聊天模板: 非raw模式下Ollama用模型的模板包装提示词
+_TEMPLATE = "<|user|>\n{prompt}\n<|assistant|>\n"
+_DURATION = re.compile(r"^(-?\d+(?:\.\d+)?)(ms|s|m|h)?$")
+
+
+class FakeLLMServer:
+    """模拟LLM服务(在后台线程中运行)"""
+
+    def __init__(
+        self,
+        name: str = "fake",
+        host: str = "127.0.0.1",
+        port: int = 0,
+        first_token_ms: float = 50,
+        tail_ms: float = 0,
+        tail_rate: float = 0.0,
+        token_ms: float = 5,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        prompt_eval_ms: float = 0,
+        load_ms: float = 0,
+        num_parallel: int = 1,
+        seed: Optional[int] = None
+    ):
+        """
+        Args:
+            name: 服务名称, 写在回答中便于区分是哪个服务回答的
+            host: 监听地址
+            port: 监听端口(0表示随机选择空闲端口)
+            first_token_ms: 首token延迟(毫秒)
+            tail_ms: 长尾请求额外增加的首token延迟(毫秒)
+            tail_rate: 长尾请求的比例
+            token_ms: 相邻两段输出的间隔(毫秒)
+            error_rate: 返回错误的请求比例
+            error_status: 错误的HTTP状态码(429时附带Retry-After)
+            prompt_eval_ms: Ollama接口每计算一个提示词token的耗时(毫秒)
+            load_ms: Ollama接口加载模型的耗时(毫秒)
+            num_parallel: Ollama接口的KV缓存槽位数(对应OLLAMA_NUM_PARALLEL)
+            seed: 随机种子
+        """
+        self.name = name
+        self.first_token_ms = first_token_ms
+        self.tail_ms = tail_ms
+        self.tail_rate = tail_rate
+        self.token_ms = token_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.prompt_eval_ms = prompt_eval_ms
+        self.load_ms = load_ms
+        self.stats = {
+            "requests": 0, "connections": 0, "errors": 0, "disconnects": 0,
+            "loads": 0, "prompt_tokens": 0, "prompt_cached_tokens": 0, "prompt_eval_ms": 0.0,
+        }
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # KV缓存槽位: 缓存的token序列与最近使用时间
+        self._slots = [{"tokens": [], "used": 0.0} for _ in range(max(1, num_parallel))]
+        self._loaded_until = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._server = ThreadingHTTPServer((host, port), _handler(self))
+        self._server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reply(self, prompt: str) -> str:
+        return f"这是{self.name}的模拟回答(提示词{len(prompt)}字)。"
+
+    def start(self) -> "FakeLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"fake-llm-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _plan(self) -> Dict:
+        """本次请求是否出错, 以及首token延迟(秒)"""
+        with self._lock:
+            self.stats["requests"] += 1
+            failed = self._random.random() < self.error_rate
+            delay = self.first_token_ms + (self.tail_ms if self._random.random() < self.tail_rate else 0)
+        return {"failed": failed, "delay": delay / 1000}
+
+    def _prefill(self, tokens: List[int]) -> Dict[str, Any]:
+        """
+        模拟模型加载与提示词计算
+
+        Returns:
+            {"slot": 使用的槽位, "cached": 命中缓存的token数, "evaluated": 需要计算的token数,
+             "load": 加载耗时(秒), "eval": 计算耗时(秒)}
+        """
+        now = time.monotonic()
+        with self._lock:
+            load = 0.0
+            if now >= self._loaded_until:
+                load = self.load_ms / 1000
+                self.stats["loads"] += 1
+                for slot in self._slots:
+                    slot["tokens"] = []
+            slot = max(self._slots, key=lambda item: (_common_prefix(item["tokens"], tokens), -item["used"]))
+            # 至少计算最后一个token(与llama.cpp相同)
+            cached = min(_common_prefix(slot["tokens"], tokens), len(tokens) - 1)
+            evaluated = len(tokens) - cached
+            slot["tokens"] = list(tokens)
+            slot["used"] = now
+            # 请求处理期间模型不会被卸载
+            self._loaded_until = float("inf")
+            self.stats["prompt_tokens"] += len(tokens)
+            self.stats["prompt_cached_tokens"] += cached
+            self.stats["prompt_eval_ms"] += evaluated * self.prompt_eval_ms
+        return {"slot": slot, "cached": cached, "evaluated": evaluated,
+                "load": load, "eval": evaluated * self.prompt_eval_ms / 1000}
+
+    def _finish(self, slot: Dict, tokens: List[int], keep_alive: Any):
+        """请求结束: 槽位缓存提示词和回答, 模型在keep_alive后卸载"""
+        with self._lock:
+            # 处理期间槽位未被其他请求占用时, 追加缓存回答部分
+            if slot["tokens"] == tokens[:len(slot["tokens"])]:
+                slot["tokens"] = list(tokens)
+            self._loaded_until = time.monotonic() + _keep_alive_seconds(keep_alive)
+
+
+def _common_prefix(left: List[int], right: List[int]) -> int:
+    size = 0
+    for a, b in zip(left, right):
+        if a != b:
+            break
+        size += 1
+    return size
+
+
+def _keep_alive_seconds(value: Any) -> float:
+    """Ollama的keep_alive: 秒数或 "30m"/"1h"/"10s" 形式的时长, 负数表示常驻, 省略时为5分钟"""
+    if value is None:
+        return 300.0
+    match = _DURATION.match(str(value).strip())
+    if not match:
+        return 300.0
+    number = float(match.group(1))
+    if number < 0:
+        return float("inf")
+    return number * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[match.group(2) or "s"]
+
+
+def _pieces(text: str, size: int = 4) -> Iterator[str]:
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+def _handler(server: FakeLLMServer):
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.1: 默认保持连接, 流式响应使用分块传输编码
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            server._count("connections")
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path != "/stats":
+                self._send_json(404, {"error": "not found"})
+                return
+            with server._lock:
+                self._send_json(200, dict(server.stats, name=server.name))
+
+        def do_POST(self):
+            try:
+                self._post()
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端提前断开(如对冲请求被取消)
+                server._count("disconnects")
+                self.close_connection = True
+
+        def _post(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            openai = self.path.endswith("/chat/completions")
+            if openai:
+                prompt = "".join(message.get("content", "") for message in body.get("messages", []))
+            elif self.path == "/api/generate":
+                prompt = body.get("prompt", "")
+            else:
+                self._send_json(404, {"error": "not found"})
+                return
+
+            plan = server._plan()
+            time.sleep(plan["delay"])
+            if plan["failed"]:
+                server._count("errors")
+                headers = {"Retry-After": "1"} if server.error_status == 429 else {}
+                self._send_json(server.error_status, {"error": {"message": f"{server.name} 模拟错误"}}, headers)
+                return
+
+            answer = server.reply(prompt)
+            if not openai:
+                self._generate(body, prompt, answer)
+            elif not body.get("stream"):
+                self._send_json(200, {"choices": [{"index": 0, "message": {"role": "assistant", "content": answer}}]})
+            else:
+                self._stream(answer, self._openai_chunk, lambda: b"data: [DONE]\n\n", "text/event-stream")
+
+        def _generate(self, body: Dict, prompt: str, answer: str):
+            """Ollama接口: 模拟加载模型和计算提示词, 结束时返回context与计算量统计"""
+            # 上一轮的context(token序列)拼接在本轮提示词之前
+            text = "".join(chr(token) for token in body.get("context") or [])
+            text += prompt if body.get("raw") else _TEMPLATE.format(prompt=prompt)
+            tokens = [ord(char) for char in text]
+            prefill = server._prefill(tokens)
+            time.sleep(prefill["load"] + prefill["eval"])
+
+            started = time.perf_counter()
+            context = tokens + [ord(char) for char in answer]
+            final = {
+                "model": body.get("model"),
+                "response": "",
+                "done": True,
+                "context": context,
+                "load_duration": int(prefill["load"] * 1e9),
+                "prompt_eval_count": prefill["evaluated"],
+                "prompt_eval_duration": int(prefill["eval"] * 1e9),
+                "eval_count": len(answer),
+            }
+            finish = lambda **fields: dict(final, eval_duration=int((time.perf_counter() - started) * 1e9), **fields)
+            try:
+                if not body.get("stream"):
+                    self._send_json(200, finish(response=answer))
+                    return
+                self._stream(
+                    answer,
+                    lambda piece: (json.dumps({"model": body.get("model"), "response": piece, "done": False},
+                                              ensure_ascii=False) + "\n").encode("utf-8"),
+                    lambda: (json.dumps(finish()) + "\n").encode("utf-8"),
+                    "application/x-ndjson"
+                )
+            finally:
+                server._finish(prefill["slot"], context, body.get("keep_alive"))
+
+        def _stream(self, answer: str, encode, done, content_type: str):
+            """分块传输编码逐段输出, 最后输出结束标记done()"""
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, piece in enumerate(_pieces(answer)):
+                if i:
+                    time.sleep(server.token_ms / 1000)
+                self._write_chunk(encode(piece))
+            self._write_chunk(done())
+            self._write_chunk(b"")
+
+        @staticmethod
+        def _openai_chunk(text: str) -> bytes:
+            chunk = {"choices": [{"index": 0, "delta": {"content": text}}]}
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+
+        def _write_chunk(self, data: bytes):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def _send_json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟LLM服务(OpenAI兼容接口与Ollama接口)")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8001, help="监听端口")
+    parser.add_argument("--name", default="fake", help="服务名称(写在回答中)")
+    parser.add_argument("--first-token-ms", type=float, default=50, help="首token延迟(毫秒)")
+    parser.add_argument("--tail-ms", type=float, default=0, help="长尾请求额外增加的首token延迟(毫秒)")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="长尾请求的比例")
+    parser.add_argument("--token-ms", type=float, default=5, help="相邻两段输出的间隔(毫秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回错误的请求比例")
+    parser.add_argument("--error-status", type=int, default=500, help="错误的HTTP状态码")
+    parser.add_argument("--prompt-eval-ms", type=float, default=0, help="Ollama接口每个提示词token的计算耗时(毫秒)")
+    parser.add_argument("--load-ms", type=float, default=0, help="Ollama接口加载模型的耗时(毫秒)")
+    parser.add_argument("--num-parallel", type=int, default=1, help="Ollama接口的KV缓存槽位数")
+    args = parser.parse_args()
+
+    server = FakeLLMServer(
+        name=args.name,
+        host=args.host,
+        port=args.port,
+        first_token_ms=args.first_token_ms,
+        tail_ms=args.tail_ms,
+        tail_rate=args.tail_rate,
+        token_ms=args.token_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        prompt_eval_ms=args.prompt_eval_ms,
+        load_ms=args.load_ms,
+        num_parallel=args.num_parallel
+    )
+    print(f"🧪 模拟LLM服务已启动: {server.url} (OpenAI兼容接口: {server.url}/v1, Ollama接口: {server.url})")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 模拟LLM服务已停止")
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
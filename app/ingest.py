@@ -0,0 +1,104 @@
+"""
+文档流式入库模块
+Streaming Document Ingestion Module
+
+按固定大小的批次对文本块进行嵌入并写入索引, 可选使用sentence-transformers
+多进程池在多个CPU核上并行编码。流水线中同时只保留一个批次的文本和向量。
+"""
+
+import time
+from contextlib import contextmanager
+from itertools import islice
+from typing import Iterable, Iterator, List
+
+import numpy as np
+
+from app.embedding_cache import CachedEmbeddings, LazyEmbeddings
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    """将可迭代对象按固定大小分批"""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class PoolEmbeddings:
+    """使用sentence-transformers多进程池编码文档的嵌入包装器"""
+
+    def __init__(self, model, pool, batch_size: int, normalize: bool):
+        self.model = model
+        self.pool = pool
+        self.batch_size = batch_size
+        self.normalize = normalize
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.model.encode_multi_process(texts, self.pool, batch_size=self.batch_size)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.normalize:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+@contextmanager
+def document_embedder(embeddings, workers: int, batch_size: int):
+    """
+    获取用于批量嵌入文档的对象
+
+    workers大于1且底层是SentenceTransformer模型时启动多进程池,
+    退出时关闭进程池; 否则直接返回原嵌入模型。嵌入缓存会被保留。
+
+    Args:
+        embeddings: RAGRetriever使用的嵌入模型
+        workers: 编码进程数
+        batch_size: 每个进程的编码批大小
+    """
+    if isinstance(embeddings, LazyEmbeddings):
+        embeddings = embeddings.inner
+    base = embeddings.inner if isinstance(embeddings, CachedEmbeddings) else embeddings
+    model = getattr(base, "client", None) or getattr(base, "model", None)
+    if workers <= 1 or not hasattr(model, "start_multi_process_pool"):
+        yield embeddings
+        return
+
+    normalize = getattr(base, "encode_kwargs", {}).get("normalize_embeddings", False)
+    print(f"⚙️  启动 {workers} 个嵌入编码进程...")
+    pool = model.start_multi_process_pool(["cpu"] * workers)
+    try:
+        encoder = PoolEmbeddings(model, pool, batch_size, normalize)
+        if isinstance(embeddings, CachedEmbeddings):
+            yield CachedEmbeddings(encoder, embeddings.cache)
+        else:
+            yield encoder
+    finally:
+        model.stop_multi_process_pool(pool)
+
+
+class IngestProgress:
+    """入库进度与吞吐量(块/秒)报告"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def update(self, n: int):
+        self.count += n
+        print(f"\r   已嵌入 {self.count} 个文本块 ({self.rate:.1f} 块/秒)", end="", flush=True)
+
+    def finish(self):
+        if self.count:
+            print()
+        elapsed = time.perf_counter() - self.started
+        print(f"   共 {self.count} 个文本块, 耗时 {elapsed:.1f} 秒, 平均 {self.rate:.1f} 块/秒")
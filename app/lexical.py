@@ -0,0 +1,264 @@
+"""
+词法检索模块
+Lexical (BM25) Retrieval Module
+
+为中文招聘公告构建BM25倒排索引, 弥补稠密向量检索对岗位名称、日期、
+"博士学位"等精确词语的遗漏。词频存入scipy稀疏矩阵, 查询时只对查询词对应的列
+计算BM25权重并求和, 10万级文本块的查询仍在毫秒级。增量同步时只删除过期行、
+对新增文本块分词(update), 不重新处理整个知识库。
+带元数据过滤条件时只在满足条件的行中取top-k(分区与向量数据库相同, 见app/metadata.py)。
+"""
+
+import os
+import re
+import json
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from app.metadata import PartitionIndex
+
+_TOKEN_PATTERN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[a-z0-9]+")
+_CJK_CHAR = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+
+
+def _bigram_tokenize(text: str) -> List[str]:
+    """中文按字符二元组切分, 英文和数字按词切分"""
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(text.lower()):
+        if _CJK_CHAR.match(run) and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def _jieba_tokenize(text: str) -> List[str]:
+    import jieba
+    return [token for token in jieba.lcut_for_search(text.lower()) if _TOKEN_PATTERN.fullmatch(token)]
+
+
+def resolve_tokenizer(name: str) -> str:
+    """解析分词器名称: auto在安装了jieba时使用jieba, 否则使用字符二元组"""
+    if name != "auto":
+        return name
+    try:
+        import jieba  # noqa: F401
+        return "jieba"
+    except ImportError:
+        return "bigram"
+
+
+def tokenize(text: str, tokenizer: str = "bigram") -> List[str]:
+    """按指定分词器切分文本"""
+    if tokenizer == "jieba":
+        return _jieba_tokenize(text)
+    return _bigram_tokenize(text)
+
+
+class BM25Index:
+    """BM25稀疏倒排索引(行: 文本块, 列: 词, 值: 词频)"""
+
+    MATRIX_FILE = "bm25.npz"
+    LENGTHS_FILE = "bm25_lengths.npy"
+    META_FILE = "bm25.json"
+
+    def __init__(self, counts: sparse.csc_matrix, lengths: np.ndarray, vocab: Dict[str, int], chunk_ids: List[str],
+                 tokenizer: str, partitions: Optional[PartitionIndex] = None, k1: float = 1.5, b: float = 0.75):
+        self.counts = counts.tocsc()
+        self.lengths = np.asarray(lengths, dtype=np.float32)
+        self.vocab = vocab
+        self.chunk_ids = chunk_ids
+        self.tokenizer = tokenizer
+        self.partitions = partitions
+        self.k1 = k1
+        self.b = b
+
+        # idf和长度归一化项依赖整个文本块集合, 随索引一起计算; 词频权重在查询时只对查询词的列计算
+        n_docs = self.counts.shape[0]
+        df = np.diff(self.counts.indptr).astype(np.float32)
+        self.idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+        avg_len = float(self.lengths.mean()) if n_docs else 0.0
+        self.norm = k1 * (1.0 - b + b * self.lengths / max(avg_len, 1e-9))
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    @staticmethod
+    def _count_terms(texts: Sequence[str], tokenizer: str, vocab: Dict[str, int]):
+        """分词并统计词频(新词追加到vocab), 返回(词频矩阵, 文本长度)"""
+        rows, cols, counts = [], [], []
+        lengths = np.zeros(len(texts), dtype=np.float32)
+
+        for row, text in enumerate(texts):
+            term_counts: Dict[int, int] = {}
+            tokens = tokenize(text, tokenizer)
+            for token in tokens:
+                col = vocab.setdefault(token, len(vocab))
+                term_counts[col] = term_counts.get(col, 0) + 1
+            lengths[row] = len(tokens)
+            rows.extend([row] * len(term_counts))
+            cols.extend(term_counts.keys())
+            counts.extend(term_counts.values())
+
+        matrix = sparse.csc_matrix(
+            (np.asarray(counts, dtype=np.float32), (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64))),
+            shape=(len(texts), len(vocab))
+        )
+        return matrix, lengths
+
+    @classmethod
+    def build(
+        cls,
+        chunk_ids: Sequence[str],
+        texts: Sequence[str],
+        tokenizer: str = "bigram",
+        k1: float = 1.5,
+        b: float = 0.75,
+        metadatas: Optional[Iterable[Dict]] = None
+    ) -> "BM25Index":
+        """
+        构建BM25索引
+
+        Args:
+            chunk_ids: 文本块ID
+            texts: 文本块内容
+            tokenizer: 分词器(bigram或jieba)
+            k1: BM25词频饱和参数
+            b: BM25文档长度归一化参数
+            metadatas: 文本块元数据(与texts一一对应), 提供时建立分区以支持过滤检索
+        """
+        vocab: Dict[str, int] = {}
+        counts, lengths = cls._count_terms(texts, tokenizer, vocab)
+        partitions = PartitionIndex.build(metadatas) if metadatas is not None else None
+        return cls(counts, lengths, vocab, list(chunk_ids), tokenizer, partitions, k1, b)
+
+    def update(
+        self,
+        removed_ids: Iterable[str],
+        chunk_ids: Sequence[str],
+        texts: Sequence[str],
+        metadatas: Optional[Sequence[Dict]] = None
+    ) -> "BM25Index":
+        """
+        增量更新: 删除removed_ids对应的行, 追加新的文本块(只对新增文本分词)
+
+        Args:
+            removed_ids: 删除的文本块ID
+            chunk_ids: 新增的文本块ID
+            texts: 新增的文本块内容
+            metadatas: 新增文本块的元数据(索引有分区时需要提供)
+
+        Returns:
+            更新后的新索引(原索引不变)
+        """
+        # 已存在的ID先删除(与向量数据库add的upsert语义一致)
+        removed = set(removed_ids).union(chunk_ids)
+        keep = np.fromiter((chunk_id not in removed for chunk_id in self.chunk_ids), dtype=bool, count=len(self))
+        vocab = dict(self.vocab)
+        added, added_lengths = self._count_terms(texts, self.tokenizer, vocab)
+
+        kept = self.counts.tocsr()[np.flatnonzero(keep)]
+        kept = sparse.csr_matrix((kept.data, kept.indices, kept.indptr), shape=(kept.shape[0], len(vocab)))
+        partitions = None
+        if self.partitions is not None and metadatas is not None:
+            partitions = self.partitions.update(keep, metadatas)
+        return BM25Index(
+            sparse.vstack([kept, added.tocsr()], format="csc"),
+            np.concatenate([self.lengths[keep], added_lengths]),
+            vocab,
+            [chunk_id for chunk_id, kept_row in zip(self.chunk_ids, keep) if kept_row] + list(chunk_ids),
+            self.tokenizer,
+            partitions,
+            self.k1,
+            self.b
+        )
+
+    def search(self, query: str, k: int, filters: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """
+        BM25检索
+
+        Args:
+            query: 查询文本
+            k: 返回结果数
+            filters: 元数据过滤条件(需要构建时提供metadatas)
+
+        Returns:
+            按分数降序排列的(文本块ID, 分数)列表
+        """
+        cols = sorted({self.vocab[token] for token in tokenize(query, self.tokenizer) if token in self.vocab})
+        if not cols or not self.chunk_ids:
+            return []
+
+        # 只取查询词的列: 每个非零元素是一个(文本块, 词)的词频
+        postings = self.counts[:, cols]
+        tf = postings.data
+        doc_rows = postings.indices
+        idf = np.repeat(self.idf[cols], np.diff(postings.indptr))
+        weights = idf * tf * (self.k1 + 1.0) / (tf + self.norm[doc_rows])
+        scores = np.bincount(doc_rows, weights=weights, minlength=len(self.chunk_ids))
+        rows = np.arange(len(scores))
+        if filters:
+            if self.partitions is None:
+                raise ValueError("词法索引没有元数据分区, 不支持过滤检索")
+            rows = self.partitions.rows(filters)
+            scores = scores[rows]
+        if len(rows) == 0:
+            return []
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.chunk_ids[rows[i]], float(scores[i])) for i in top if scores[i] > 0]
+
+    def save(self, directory: str):
+        """保存索引到目录"""
+        os.makedirs(directory, exist_ok=True)
+        sparse.save_npz(os.path.join(directory, self.MATRIX_FILE), self.counts)
+        np.save(os.path.join(directory, self.LENGTHS_FILE), self.lengths)
+        with open(os.path.join(directory, self.META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(
+                {"tokenizer": self.tokenizer, "k1": self.k1, "b": self.b,
+                 "vocab": self.vocab, "chunk_ids": self.chunk_ids},
+                f,
+                ensure_ascii=False
+            )
+        if self.partitions is not None:
+            self.partitions.save(directory)
+
+    @classmethod
+    def load(cls, directory: str) -> "BM25Index":
+        """从目录加载索引"""
+        counts = sparse.load_npz(os.path.join(directory, cls.MATRIX_FILE)).tocsc()
+        lengths = np.load(os.path.join(directory, cls.LENGTHS_FILE))
+        with open(os.path.join(directory, cls.META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        partitions = PartitionIndex.load(directory)
+        if partitions is not None and partitions.count != len(meta["chunk_ids"]):
+            partitions = None
+        return cls(counts, lengths, meta["vocab"], meta["chunk_ids"], meta["tokenizer"], partitions,
+                   meta.get("k1", 1.5), meta.get("b", 0.75))
+
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        # 旧格式(保存预计算的权重, 没有文本长度)视为不存在, 加载时重建
+        return (os.path.exists(os.path.join(directory, cls.META_FILE))
+                and os.path.exists(os.path.join(directory, cls.LENGTHS_FILE)))
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    倒数排名融合(RRF)
+
+    Args:
+        rankings: 多路检索结果的ID列表(各自按相关性降序)
+        k: RRF平滑常数
+
+    Returns:
+        按融合分数降序排列的(ID, 分数)列表
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
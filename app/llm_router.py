@@ -0,0 +1,527 @@
+"""
+LLM路由模块
+LLM Routing Layer: Connection Pooling, Failover, Circuit Breaking & Hedged Requests
+
+把config中已配置的LLM服务(DeepSeek/OpenAI与通义千问的OpenAI兼容接口、Ollama)组合为一个LLM(LLM_TYPE=router):
+
+- 所有服务共享一个httpx连接池(keep-alive), 请求复用已建立的TCP/TLS连接;
+  HTTP请求统一在一个后台事件循环线程中执行, 同步(invoke/stream)与异步(astream)调用共用同一个连接池
+- 每个服务记录首token耗时的EWMA与最近LATENCY_WINDOW个样本的P95, 按EWMA从快到慢选择服务;
+  没有样本或样本已过期(LATENCY_STALE_SECONDS内未被使用)的服务排在最前, 重新测量一次,
+  避免一次偶然的慢请求(如冷启动)让某个服务再也不被选中
+- 熔断: 连续失败LLM_CIRCUIT_FAILURES次后, LLM_CIRCUIT_COOLDOWN秒内跳过该服务;
+  冷却结束后放行一个探测请求(半开), 成功则恢复, 失败则重新计时
+- 故障转移: 连接失败、超时、401/403/429、5xx时改用下一个服务;
+  只在尚未输出任何token时转移, 已输出的内容不会重复
+- 对冲请求(LLM_HEDGE_ENABLED): 首选服务超过其首token耗时P95仍未返回第一个token时,
+  向下一个服务发出同样的请求, 采用先返回第一个token的服务, 取消另一个请求
+
+离线测试可用app/fake_llm_server.py模拟各服务的延迟和故障(python benchmark.py llm)。
+"""
+
+import json
+import time
+import queue
+import asyncio
+import threading
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+from app.config import (
+    OPENAI_API_KEY,
+    OPENAI_API_BASE,
+    OPENAI_CHAT_MODEL,
+    QW_API_KEY,
+    QW_API_BASE_URL,
+    QW_Model,
+    OLLAMA_MODEL,
+    OLLAMA_BASE_URL,
+    OLLAMA_API_KEY,
+    OLLAMA_KEEP_ALIVE,
+    TEMPERATURE,
+    LLM_CONNECT_TIMEOUT,
+    LLM_READ_TIMEOUT,
+    OLLAMA_READ_TIMEOUT,
+    LLM_POOL_SIZE,
+    LLM_KEEPALIVE_EXPIRY,
+    LLM_CIRCUIT_FAILURES,
+    LLM_CIRCUIT_COOLDOWN,
+    LLM_HEDGE_DELAY,
+    LLM_HEDGE_MIN_DELAY
+)
+from app.tracing import tracer
+
+BACKEND_NAMES = ("qw", "openai", "ollama")
+
+# 计算P95的最近样本数; 样本少于HEDGE_MIN_SAMPLES时对冲等待使用LLM_HEDGE_DELAY
+LATENCY_WINDOW = 100
+HEDGE_MIN_SAMPLES = 10
+EWMA_ALPHA = 0.2
+LATENCY_STALE_SECONDS = 30.0
+
+# 视为服务故障(计入熔断并转移到下一个服务)的HTTP状态码; 其余4xx是请求本身的问题, 直接返回给调用方
+_FAULT_STATUS = {401, 403, 408, 429}
+
+
+class LLMBackendError(Exception):
+    """LLM服务返回错误或无法连接"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, backend: str = "",
+                 response: Optional[httpx.Response] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.backend = backend
+        # 保留响应以便调用方读取Retry-After等响应头
+        self.response = response
+
+    @property
+    def is_fault(self) -> bool:
+        """服务故障(连接失败/超时/限流/5xx等), 而不是请求本身有误"""
+        return self.status_code is None or self.status_code in _FAULT_STATUS or self.status_code >= 500
+
+
+class BackendHealth:
+    """单个服务的首token耗时统计与熔断状态(只在I/O线程中更新)"""
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.ewma: Optional[float] = None
+        self.last_sample = 0.0
+        self.samples = deque(maxlen=LATENCY_WINDOW)
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+
+    def state(self, now: float) -> str:
+        """closed(正常) / open(熔断中) / half_open(冷却结束, 等待探测)"""
+        if self.failures < self.failure_threshold:
+            return "closed"
+        return "half_open" if now >= self.open_until else "open"
+
+    def available(self, now: float) -> bool:
+        state = self.state(now)
+        return state == "closed" or (state == "half_open" and not self.probing)
+
+    def begin(self, now: float):
+        """开始一个请求; 半开状态下该请求作为探测, 期间不再放行其他请求"""
+        if self.state(now) == "half_open":
+            self.probing = True
+
+    def observe(self, latency: float, complete: bool = True):
+        """记录首token耗时; complete=False表示请求被取消时已等待的时间(只是下限, 不计入P95)"""
+        self.last_sample = time.monotonic()
+        if complete:
+            self.samples.append(latency)
+        self.ewma = latency if self.ewma is None else EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.ewma
+
+    def record_success(self, latency: float):
+        self.failures = 0
+        self.probing = False
+        self.observe(latency)
+
+    def record_failure(self, now: float):
+        self.failures += 1
+        self.probing = False
+        if self.failures >= self.failure_threshold:
+            self.open_until = now + self.cooldown
+
+    def rank(self, now: float) -> float:
+        """排序用的首token耗时: 没有样本或样本过期时为0(优先重新测量)"""
+        if self.ewma is None or now - self.last_sample > LATENCY_STALE_SECONDS:
+            return 0.0
+        return self.ewma
+
+    def release(self):
+        """请求被取消, 既不算成功也不算失败"""
+        self.probing = False
+
+    def p95(self) -> Optional[float]:
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class Backend:
+    """一个LLM服务: 构造流式请求并解析响应"""
+
+    def __init__(self, name: str, base_url: str, model: str, api_key: str = "",
+                 temperature: float = TEMPERATURE, max_tokens: Optional[int] = None,
+                 read_timeout: float = LLM_READ_TIMEOUT):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.api_key = api_key
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.timeout = httpx.Timeout(read_timeout, connect=LLM_CONNECT_TIMEOUT)
+        self.health = BackendHealth(LLM_CIRCUIT_FAILURES, LLM_CIRCUIT_COOLDOWN)
+
+    def request(self, prompt: str, model: str) -> Tuple[str, Dict[str, str], Dict]:
+        """(URL, 请求头, 请求体)"""
+        raise NotImplementedError
+
+    def parse(self, line: str) -> Tuple[Optional[str], bool]:
+        """解析响应中的一行: (文本片段, 是否结束)"""
+        raise NotImplementedError
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    async def astream(self, client: httpx.AsyncClient, prompt: str, model: str = "") -> AsyncIterator[str]:
+        """发送流式请求并逐个产出文本片段"""
+        url, headers, payload = self.request(prompt, model or self.model)
+        async with client.stream("POST", url, headers=headers, json=payload, timeout=self.timeout) as response:
+            if response.status_code >= 400:
+                body = (await response.aread()).decode("utf-8", "replace")
+                raise LLMBackendError(
+                    f"{self.name} 返回HTTP {response.status_code}: {body[:200]}",
+                    status_code=response.status_code, backend=self.name, response=response
+                )
+            done = False
+            # 结束标记之后继续读到响应末尾, 连接才能放回连接池复用
+            async for line in response.aiter_lines():
+                if done or not line.strip():
+                    continue
+                text, done = self.parse(line)
+                if text:
+                    yield text
+
+
+class OpenAICompatibleBackend(Backend):
+    """OpenAI兼容的 /chat/completions 接口(DeepSeek、通义千问DashScope等), SSE流式输出"""
+
+    def request(self, prompt: str, model: str) -> Tuple[str, Dict[str, str], Dict]:
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": self.temperature,
+            "stream": True,
+        }
+        if self.max_tokens:
+            payload["max_tokens"] = self.max_tokens
+        return f"{self.base_url}/chat/completions", self._headers(), payload
+
+    def parse(self, line: str) -> Tuple[Optional[str], bool]:
+        if not line.startswith("data:"):
+            return None, False
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return None, True
+        choices = json.loads(data).get("choices") or [{}]
+        return (choices[0].get("delta") or {}).get("content"), False
+
+
+class OllamaBackend(Backend):
+    """Ollama的 /api/generate 接口, 逐行JSON流式输出"""
+
+    def request(self, prompt: str, model: str) -> Tuple[str, Dict[str, str], Dict]:
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": {"temperature": self.temperature},
+        }
+        return f"{self.base_url}/api/generate", self._headers(), payload
+
+    def parse(self, line: str) -> Tuple[Optional[str], bool]:
+        data = json.loads(line)
+        if data.get("error"):
+            raise LLMBackendError(f"{self.name} 返回错误: {data['error']}", backend=self.name)
+        return data.get("response"), bool(data.get("done"))
+
+
+def create_backends(names: str) -> List[Backend]:
+    """
+    按优先级创建已配置的服务(缺少API Key或服务地址的跳过)
+
+    Args:
+        names: 逗号分隔的服务名(qw / openai / ollama)
+    """
+    backends = []
+    for name in [name.strip() for name in names.split(",") if name.strip()]:
+        if name == "qw":
+            if QW_API_KEY and QW_API_BASE_URL:
+                backends.append(OpenAICompatibleBackend("qw", QW_API_BASE_URL, QW_Model, QW_API_KEY))
+        elif name == "openai":
+            if OPENAI_API_KEY:
+                backends.append(OpenAICompatibleBackend(
+                    "openai", OPENAI_API_BASE, OPENAI_CHAT_MODEL, OPENAI_API_KEY, max_tokens=1024
+                ))
+        elif name == "ollama":
+            backends.append(OllamaBackend(
+                "ollama", OLLAMA_BASE_URL, OLLAMA_MODEL, OLLAMA_API_KEY, read_timeout=OLLAMA_READ_TIMEOUT
+            ))
+        else:
+            raise ValueError(f"不支持的LLM服务: {name} (可选: {', '.join(BACKEND_NAMES)})")
+    return backends
+
+
+class _Transport:
+    """后台事件循环线程与共享的httpx连接池"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._client: Optional[httpx.AsyncClient] = None
+        threading.Thread(target=self.loop.run_forever, name="llm-io", daemon=True).start()
+
+    def submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def client(self) -> httpx.AsyncClient:
+        """连接池(在I/O线程中首次使用时创建)"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_POOL_SIZE,
+                    max_keepalive_connections=LLM_POOL_SIZE,
+                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+                )
+            )
+        return self._client
+
+
+_transport: Optional[_Transport] = None
+_transport_lock = threading.Lock()
+
+
+def transport() -> _Transport:
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = _Transport()
+    return _transport
+
+
+class _Attempt:
+    """向一个服务发出的请求: 后台任务把输出放入队列, first等待第一项"""
+
+    def __init__(self, backend: Backend, task: asyncio.Task, channel: asyncio.Queue):
+        self.backend = backend
+        self.task = task
+        self.channel = channel
+        self.first = asyncio.ensure_future(channel.get())
+
+    def cancel(self):
+        self.first.cancel()
+        self.task.cancel()
+
+
+class RoutingLLM(LLM):
+    """在多个LLM服务之间路由的LLM(langchain接口: invoke / stream / astream)"""
+
+    backends: List[Any]
+    hedge: bool = False
+    hedge_delay: float = LLM_HEDGE_DELAY
+    # 非空时覆盖各服务的模型名(如CONDENSE_MODEL)
+    model: str = ""
+
+    @property
+    def _llm_type(self) -> str:
+        return "router"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"backends": [backend.name for backend in self.backends], "model": self.model}
+
+    def status(self) -> List[Dict]:
+        """各服务的状态、首token耗时EWMA/P95和连续失败次数"""
+        now = time.monotonic()
+        rows = []
+        for backend in self.backends:
+            health = backend.health
+            p95 = health.p95()
+            rows.append({
+                "backend": backend.name,
+                "model": self.model or backend.model,
+                "state": health.state(now),
+                "ewma_ms": round(health.ewma * 1000, 1) if health.ewma is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "failures": health.failures,
+            })
+        return rows
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None,
+                     run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        return "".join([chunk.text async for chunk in self._astream(prompt, stop, run_manager, **kwargs)])
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        channel: queue.Queue = queue.Queue()
+        future = transport().submit(self._produce(prompt, channel.put))
+        try:
+            while True:
+                kind, value = channel.get()
+                if kind == "backend":
+                    # 在调用方线程中记录, 归入当前链路的llm阶段
+                    tracer.annotate(llm_backend=value)
+                    continue
+                if kind == "error":
+                    raise value
+                if kind == "end":
+                    return
+                chunk = GenerationChunk(text=value)
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+        finally:
+            # 调用方提前停止迭代时取消请求, 连接随之关闭
+            future.cancel()
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        loop = asyncio.get_running_loop()
+        channel: asyncio.Queue = asyncio.Queue()
+        future = transport().submit(
+            self._produce(prompt, lambda item: loop.call_soon_threadsafe(channel.put_nowait, item))
+        )
+        try:
+            while True:
+                kind, value = await channel.get()
+                if kind == "backend":
+                    tracer.annotate(llm_backend=value)
+                    continue
+                if kind == "error":
+                    raise value
+                if kind == "end":
+                    return
+                chunk = GenerationChunk(text=value)
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+        finally:
+            future.cancel()
+
+    async def _produce(self, prompt: str, emit: Callable[[Tuple[str, Any]], None]):
+        try:
+            await self._route(prompt, emit)
+            emit(("end", None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            emit(("error", e))
+
+    def _candidates(self) -> List[Backend]:
+        """可用的服务, 按首token耗时EWMA从快到慢(需要重新测量的排在最前, 相同时保持配置顺序)"""
+        now = time.monotonic()
+        available = [backend for backend in self.backends if backend.health.available(now)]
+        return sorted(available, key=lambda backend: backend.health.rank(now))
+
+    def _hedge_after(self, backend: Backend) -> float:
+        p95 = backend.health.p95()
+        return self.hedge_delay if p95 is None else max(p95, LLM_HEDGE_MIN_DELAY)
+
+    async def _route(self, prompt: str, emit: Callable[[Tuple[str, Any]], None]):
+        """依次尝试各服务(可对冲), 把第一个返回token的服务的输出转发给调用方"""
+        loop = asyncio.get_running_loop()
+        pending = self._candidates()
+        if not pending:
+            raise LLMBackendError("所有LLM服务均处于熔断状态", status_code=503)
+
+        started: List[_Attempt] = []
+        errors: List[LLMBackendError] = []
+        try:
+            while pending:
+                attempts = [self._start(pending.pop(0), prompt, started)]
+                hedge_at = loop.time() + self._hedge_after(attempts[0].backend) if self.hedge and pending else None
+                winner = None
+                while winner is None and attempts:
+                    timeout = None if hedge_at is None else max(hedge_at - loop.time(), 0)
+                    done, _ = await asyncio.wait(
+                        [attempt.first for attempt in attempts], timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if not done:
+                        # 首选服务迟迟没有返回第一个token, 向下一个服务发出同样的请求
+                        hedge_at = None
+                        attempts.append(self._start(pending.pop(0), prompt, started))
+                        tracer.count("chatbot_llm_hedges_total")
+                        continue
+                    for attempt in [attempt for attempt in attempts if attempt.first in done]:
+                        kind, value = attempt.first.result()
+                        if kind != "error":
+                            winner = attempt
+                            break
+                        attempts.remove(attempt)
+                        if not value.is_fault:
+                            raise value
+                        errors.append(value)
+
+                if winner is None:
+                    continue
+                for attempt in attempts:
+                    if attempt is not winner:
+                        attempt.cancel()
+                emit(("backend", winner.backend.name))
+                item = winner.first.result()
+                while item[0] == "token":
+                    emit(item)
+                    item = await winner.channel.get()
+                if item[0] == "error":
+                    raise item[1]
+                return
+        finally:
+            for attempt in started:
+                if not attempt.task.done():
+                    attempt.cancel()
+
+        last = errors[-1]
+        raise LLMBackendError(
+            "所有LLM服务均请求失败: " + "; ".join(str(error) for error in errors),
+            status_code=last.status_code or 503, backend=last.backend, response=last.response
+        )
+
+    def _start(self, backend: Backend, prompt: str, started: List[_Attempt]) -> _Attempt:
+        channel: asyncio.Queue = asyncio.Queue()
+        attempt = _Attempt(backend, asyncio.ensure_future(self._run(backend, prompt, channel)), channel)
+        started.append(attempt)
+        return attempt
+
+    async def _run(self, backend: Backend, prompt: str, channel: asyncio.Queue):
+        """向一个服务发出请求, 把输出放入channel, 并更新该服务的延迟统计与熔断状态"""
+        health = backend.health
+        start = time.monotonic()
+        health.begin(start)
+        received = False
+        try:
+            async for text in backend.astream(transport().client(), prompt, self.model):
+                if not received:
+                    received = True
+                    health.record_success(time.monotonic() - start)
+                    tracer.observe("chatbot_llm_backend_first_token_seconds", time.monotonic() - start,
+                                   backend=backend.name)
+                await channel.put(("token", text))
+            if not received:
+                health.record_success(time.monotonic() - start)
+            tracer.count("chatbot_llm_requests_total", backend=backend.name, result="ok")
+            await channel.put(("end", None))
+        except asyncio.CancelledError:
+            # 对冲请求中落败: 已等待的时间是首token耗时的下限, 计入EWMA使慢服务排到后面
+            if not received:
+                health.observe(time.monotonic() - start, complete=False)
+            health.release()
+            tracer.count("chatbot_llm_requests_total", backend=backend.name, result="cancelled")
+            raise
+        except Exception as e:
+            if isinstance(e, LLMBackendError):
+                error = e
+            else:
+                error = LLMBackendError(f"{backend.name} 请求失败: {type(e).__name__}: {e}", backend=backend.name)
+            if error.is_fault:
+                health.record_failure(time.monotonic())
+            else:
+                health.release()
+            tracer.count("chatbot_llm_requests_total", backend=backend.name, result="error")
+            await channel.put(("error", error))
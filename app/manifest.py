@@ -0,0 +1,163 @@
+"""
+增量索引清单模块
+Incremental Index Manifest Module
+
+记录知识库中每个文件的内容哈希及其文本块ID, 用于判断哪些文档需要
+重新分割/嵌入, 哪些向量已经过期需要从索引中删除。
+"""
+
+import os
+import json
+import hashlib
+from typing import Dict, List, Optional
+
+# 清单格式版本, 格式变化时需要全量重建
+MANIFEST_VERSION = 1
+
+
+def hash_text(text: str) -> str:
+    """计算文本内容的哈希"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def hash_file(file_path: str) -> str:
+    """计算文件内容的哈希"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_chunk_ids(source: str, texts: List[str]) -> List[str]:
+    """
+    根据来源文件和文本内容生成稳定的文本块ID
+
+    同一文件内内容相同的文本块按出现顺序追加序号, 保证ID唯一。
+
+    Args:
+        source: 来源文件路径
+        texts: 文本块内容列表
+
+    Returns:
+        文本块ID列表
+    """
+    ids = []
+    seen: Dict[str, int] = {}
+    for text in texts:
+        base = hash_text(f"{source}\n{text}")[:24]
+        count = seen.get(base, 0)
+        seen[base] = count + 1
+        ids.append(base if count == 0 else f"{base}-{count}")
+    return ids
+
+
+class IndexManifest:
+    """向量数据库的增量索引清单"""
+
+    def __init__(self, path: str, index_config: Dict):
+        """
+        初始化索引清单
+
+        Args:
+            path: 清单文件路径
+            index_config: 影响向量结果的配置(嵌入模型、分块参数等)
+        """
+        self.path = path
+        self.index_config = dict(index_config)
+        self.files: Dict[str, Dict] = {}
+
+    @classmethod
+    def load(cls, path: str) -> Optional["IndexManifest"]:
+        """从磁盘加载清单, 不存在或格式不兼容时返回None"""
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+
+        manifest = cls(path, data.get("index_config", {}))
+        manifest.files = data.get("files", {})
+        return manifest
+
+    def save(self):
+        """原子地保存清单到磁盘"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(
+                {
+                    "version": MANIFEST_VERSION,
+                    "index_config": self.index_config,
+                    "files": self.files,
+                },
+                f,
+                ensure_ascii=False,
+                indent=1
+            )
+        os.replace(tmp_path, self.path)
+
+    def is_compatible(self, index_config: Dict) -> bool:
+        """检查嵌入模型和分块配置是否与清单一致"""
+        return self.index_config == dict(index_config)
+
+    def diff(self, file_paths: List[str]) -> Dict[str, List[str]]:
+        """
+        比较当前知识库文件与清单
+
+        先比较文件大小和修改时间, 只有变化的文件才重新计算内容哈希。
+
+        Args:
+            file_paths: 当前知识库中的文件路径列表
+
+        Returns:
+            包含 added / changed / deleted / unchanged 文件列表的字典
+        """
+        changes = {"added": [], "changed": [], "deleted": [], "unchanged": []}
+        current = set(file_paths)
+
+        for file_path in file_paths:
+            entry = self.files.get(file_path)
+            if entry is None:
+                changes["added"].append(file_path)
+                continue
+
+            stat = os.stat(file_path)
+            if entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+                changes["unchanged"].append(file_path)
+                continue
+
+            if hash_file(file_path) == entry.get("hash"):
+                # 内容未变, 仅刷新文件状态
+                entry["size"] = stat.st_size
+                entry["mtime_ns"] = stat.st_mtime_ns
+                changes["unchanged"].append(file_path)
+            else:
+                changes["changed"].append(file_path)
+
+        changes["deleted"] = sorted(set(self.files) - current)
+        return changes
+
+    def chunk_ids(self, file_path: str) -> List[str]:
+        """获取文件对应的文本块ID"""
+        return list(self.files.get(file_path, {}).get("chunks", []))
+
+    def update_file(self, file_path: str, chunk_ids: List[str]):
+        """记录文件的最新哈希、状态和文本块ID"""
+        stat = os.stat(file_path)
+        self.files[file_path] = {
+            "hash": hash_file(file_path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "chunks": list(chunk_ids),
+        }
+
+    def remove_file(self, file_path: str):
+        """从清单中移除文件"""
+        self.files.pop(file_path, None)
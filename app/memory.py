@@ -0,0 +1,172 @@
+"""
+对话记忆模块
+Token-Budgeted Conversation Memory Module
+
+最近N轮对话原样保留, 更早的对话由LLM压缩为滚动摘要。摘要在后台线程中生成,
+不阻塞当前轮次的回答; 摘要完成前, 待压缩的对话仍以原文参与问题改写。
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from langchain.memory import ChatMessageHistory
+from langchain.prompts import PromptTemplate
+from langchain.schema import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from app.tokens import count_tokens, truncate_tokens
+
+SUMMARY_PROMPT = PromptTemplate(
+    template="""请将以下对话内容合并到已有摘要中, 生成一段新的简洁摘要。
+保留用户关心的单位、岗位、条件、日期等关键信息, 不要编造内容。
+
+已有摘要:
+{summary}
+
+新的对话:
+{new_lines}
+
+新的摘要:""",
+    input_variables=["summary", "new_lines"]
+)
+
+# 所有会话共享的摘要线程池
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+
+
+class TokenBudgetMemory:
+    """按token预算裁剪的对话记忆"""
+
+    memory_key = "chat_history"
+
+    def __init__(self, llm, max_tokens: int, keep_turns: int):
+        """
+        初始化对话记忆
+
+        Args:
+            llm: 用于生成摘要的语言模型
+            max_tokens: 摘要与对话原文的总token预算
+            keep_turns: 原样保留的最近对话轮数
+        """
+        self.llm = llm
+        self.max_tokens = max_tokens
+        self.keep_turns = max(1, keep_turns)
+
+        # chat_memory只保存原样保留的最近对话
+        self.chat_memory = ChatMessageHistory()
+        self.summary = ""
+
+        self._pending: List[Tuple[BaseMessage, BaseMessage]] = []
+        self._future = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, List[BaseMessage]]:
+        return {self.memory_key: self.buffer_messages()}
+
+    def buffer_messages(self) -> List[BaseMessage]:
+        """用于问题改写的对话上下文: 摘要 + 待压缩的对话 + 最近对话"""
+        with self._lock:
+            messages: List[BaseMessage] = []
+            if self.summary:
+                messages.append(SystemMessage(content=f"此前对话摘要: {self.summary}"))
+            for human, ai in self._pending:
+                messages.extend([human, ai])
+            messages.extend(self.chat_memory.messages)
+            return messages
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]):
+        """保存一轮对话, 超出轮数或token预算时把最早的对话移入摘要队列"""
+        human = HumanMessage(content=str(next(iter(inputs.values()), "")))
+        ai = AIMessage(content=str(outputs.get("answer", next(iter(outputs.values()), ""))))
+
+        with self._lock:
+            self.chat_memory.add_message(human)
+            self.chat_memory.add_message(ai)
+
+            messages = self.chat_memory.messages
+            summary_tokens = count_tokens(self.summary)
+            while len(messages) > 2 and (
+                len(messages) > self.keep_turns * 2
+                or summary_tokens + self._count(messages) > self.max_tokens
+            ):
+                self._pending.append((messages[0], messages[1]))
+                del messages[:2]
+
+            self._schedule()
+
+    def _schedule(self):
+        """若有待压缩的对话且没有进行中的摘要任务, 提交后台摘要任务"""
+        if not self._pending or self._future is not None:
+            return
+
+        turns = list(self._pending)
+        self._future = _summary_executor.submit(self._summarize, turns, self.summary, self._generation)
+
+    def _summarize(self, turns: List[Tuple[BaseMessage, BaseMessage]], summary: str, generation: int):
+        """后台生成新的摘要"""
+        new_lines = "\n".join(
+            f"用户: {human.content}\n助手: {ai.content}" for human, ai in turns
+        )
+        # 摘要失败时保留原文拼接, 截断时保留结尾, 避免丢掉最新的对话
+        keep = "start"
+        try:
+            result = self.llm.invoke(SUMMARY_PROMPT.format(summary=summary or "无", new_lines=new_lines))
+            new_summary = getattr(result, "content", result).strip()
+        except Exception:
+            new_summary = f"{summary}\n{new_lines}".strip()
+            keep = "end"
+
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._future = None
+            # 摘要最多占用一半的token预算
+            self.summary = truncate_tokens(new_summary, self.max_tokens // 2, keep=keep)
+            del self._pending[:len(turns)]
+            self._schedule()
+
+    @staticmethod
+    def _count(messages: List[BaseMessage]) -> int:
+        return sum(count_tokens(message.content) for message in messages)
+
+    def token_usage(self) -> Dict[str, int]:
+        """
+        当前记忆的token占用
+
+        Returns:
+            包含summary/pending/recent/total/budget的字典
+        """
+        with self._lock:
+            summary = count_tokens(self.summary)
+            pending = sum(self._count([human, ai]) for human, ai in self._pending)
+            recent = self._count(self.chat_memory.messages)
+        return {
+            "summary": summary,
+            "pending": pending,
+            "recent": recent,
+            "total": summary + pending + recent,
+            "budget": self.max_tokens,
+        }
+
+    def wait(self, timeout: float = None):
+        """等待后台摘要任务完成(用于测试和离线批处理)"""
+        while True:
+            with self._lock:
+                future = self._future
+            if future is None:
+                return
+            future.result(timeout=timeout)
+
+    def clear(self):
+        """清空对话记忆, 丢弃进行中的摘要结果"""
+        with self._lock:
+            self._generation += 1
+            self.chat_memory.clear()
+            self.summary = ""
+            self._pending.clear()
+            self._future = None
@@ -0,0 +1,231 @@
+"""
+公告元数据与分区索引模块
+Announcement Metadata & Partition Index Module
+
+加载文档时从文件名和正文中提取元数据, 随分块复制到每个文本块:
+
+    institution    招聘单位(如"上海大学")
+    batch          招聘批次(如"第六批")
+    deadline       报名截止日期(YYYY-MM-DD)
+    position_type  岗位类型(如"辅导员"、"高层次人才")
+
+PartitionIndex为这些字段(以及source、section)的每个取值预先记录文本块行号,
+过滤检索时先求出满足条件的行号, 再只在这些行中检索(见app/ann.py的search_rows),
+而不是检索全部文本块后对top-k结果二次过滤。
+
+过滤条件为 {字段: 条件} 字典, 各字段之间为"且":
+    "上海大学"                         等于
+    ["上海大学", "上海交通职业技术学院"]  等于其中之一
+    {"$gte": "2025-10-01"}             范围($gt/$gte/$lt/$lte, 按字符串比较, 适用于日期)
+"""
+
+import os
+import re
+import json
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 建立分区的元数据字段
+PARTITION_FIELDS = ("source", "institution", "batch", "deadline", "position_type", "section")
+
+_INSTITUTION = re.compile(r"^(.+?(?:大学|学院|学校|研究院|研究所|医院|中心))")
+_BATCH = re.compile(r"第[一二三四五六七八九十\d]+批")
+_DEADLINE = re.compile(r"(?:截止|截至|至)[^。\n]{0,12}?(\d{4})\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*日")
+_POSITIONS_SECTION = re.compile(r"^#+[^\n]*招聘岗位[^\n]*\n(.*?)(?=^#|\Z)", re.MULTILINE | re.DOTALL)
+
+# 岗位类型关键词, 按优先级排列
+POSITION_TYPES = (
+    ("辅导员", "辅导员"),
+    ("高层次人才", "高层次人才"),
+    ("博士后", "博士后"),
+    ("专任教师", "专任教师"),
+    ("教师", "专任教师"),
+    ("科研", "科研岗"),
+    ("实验", "教辅岗"),
+    ("教辅", "教辅岗"),
+    ("管理", "管理岗"),
+)
+
+_RANGE_OPERATORS = {
+    "$gt": lambda value, bound: value > bound,
+    "$gte": lambda value, bound: value >= bound,
+    "$lt": lambda value, bound: value < bound,
+    "$lte": lambda value, bound: value <= bound,
+}
+
+
+def extract_metadata(text: str, source: str) -> Dict[str, str]:
+    """
+    从公告文件名和正文中提取元数据(提取不到的字段不写入)
+
+    Args:
+        text: 公告全文
+        source: 文件路径, 文件名通常为"单位+年份+公告标题"
+
+    Returns:
+        元数据字典
+    """
+    title = os.path.splitext(os.path.basename(source))[0]
+    metadata = {}
+
+    match = _INSTITUTION.match(title)
+    if match:
+        metadata["institution"] = match.group(1)
+
+    match = _BATCH.search(title) or _BATCH.search(text)
+    if match:
+        metadata["batch"] = match.group(0)
+
+    match = _DEADLINE.search(text)
+    if match:
+        year, month, day = (int(part) for part in match.groups())
+        metadata["deadline"] = f"{year:04d}-{month:02d}-{day:02d}"
+
+    # 岗位类型优先看"招聘岗位"章节, 其次看标题
+    section = _POSITIONS_SECTION.search(text)
+    for candidate in ((section.group(1) if section else ""), title):
+        position_type = next((name for keyword, name in POSITION_TYPES if keyword in candidate), None)
+        if position_type:
+            metadata["position_type"] = position_type
+            break
+    return metadata
+
+
+def _matches(value: str, condition: Any) -> bool:
+    if isinstance(condition, dict):
+        unknown = set(condition) - set(_RANGE_OPERATORS)
+        if unknown:
+            raise ValueError(f"不支持的过滤运算符: {', '.join(sorted(unknown))}")
+        return all(_RANGE_OPERATORS[op](value, str(bound)) for op, bound in condition.items())
+    if isinstance(condition, (list, tuple, set, frozenset)):
+        return value in {str(item) for item in condition}
+    return value == str(condition)
+
+
+def filter_key(filters: Optional[Dict[str, Any]]) -> str:
+    """过滤条件的规范化表示, 条件相同的查询可以合并为一次批量检索"""
+    return json.dumps(filters or {}, sort_keys=True, ensure_ascii=False, default=sorted)
+
+
+class PartitionIndex:
+    """元数据分区: (字段, 取值) -> 该分区文本块的行号(升序)"""
+
+    KEYS_FILE = "partitions.json"
+    ROWS_FILE = "partitions.npz"
+
+    def __init__(self, partitions: Dict[str, Dict[str, np.ndarray]], count: int):
+        self.partitions = partitions
+        self.count = count
+
+    @classmethod
+    def build(cls, metadatas: Iterable[Dict]) -> "PartitionIndex":
+        """按行遍历文本块的元数据建立分区"""
+        rows: Dict[Tuple[str, str], List[int]] = {}
+        count = 0
+        for row, metadata in enumerate(metadatas):
+            count += 1
+            for field in PARTITION_FIELDS:
+                value = metadata.get(field)
+                if isinstance(value, str) and value:
+                    rows.setdefault((field, value), []).append(row)
+
+        partitions: Dict[str, Dict[str, np.ndarray]] = {}
+        for (field, value), field_rows in rows.items():
+            partitions.setdefault(field, {})[value] = np.asarray(field_rows, dtype=np.int64)
+        return cls(partitions, count)
+
+    def update(self, keep: np.ndarray, metadatas: Iterable[Dict]) -> "PartitionIndex":
+        """
+        只保留keep为True的行(其余行号前移, 顺序不变), 并在末尾追加新行的元数据
+
+        Returns:
+            更新后的新分区(原分区不变)
+        """
+        remap = np.cumsum(keep) - 1
+        added = PartitionIndex.build(metadatas)
+        kept_count = int(np.count_nonzero(keep))
+
+        partitions: Dict[str, Dict[str, np.ndarray]] = {}
+        for field in set(self.partitions) | set(added.partitions):
+            old_values = self.partitions.get(field, {})
+            new_values = added.partitions.get(field, {})
+            for value in set(old_values) | set(new_values):
+                old_rows = old_values.get(value, np.empty(0, dtype=np.int64))
+                new_rows = new_values.get(value, np.empty(0, dtype=np.int64)) + kept_count
+                rows = np.concatenate([remap[old_rows[keep[old_rows]]], new_rows]).astype(np.int64)
+                if len(rows):
+                    partitions.setdefault(field, {})[value] = rows
+        return PartitionIndex(partitions, kept_count + added.count)
+
+    def values(self, field: str) -> List[str]:
+        """字段的全部取值"""
+        return sorted(self.partitions.get(field, {}))
+
+    def resolve(self, filters: Dict[str, Any]) -> Dict[str, List[str]]:
+        """把过滤条件展开为各字段满足条件的取值列表(范围条件按已有取值展开)"""
+        unknown = set(filters) - set(PARTITION_FIELDS)
+        if unknown:
+            raise ValueError(f"不支持按以下字段过滤: {', '.join(sorted(unknown))} (可选: {', '.join(PARTITION_FIELDS)})")
+        return {
+            field: [value for value in self.values(field) if _matches(value, condition)]
+            for field, condition in filters.items()
+        }
+
+    def rows(self, filters: Dict[str, Any]) -> np.ndarray:
+        """满足全部过滤条件的行号(升序)"""
+        selected: Optional[np.ndarray] = None
+        for field, values in self.resolve(filters).items():
+            parts = [self.partitions[field][value] for value in values]
+            field_rows = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+            selected = field_rows if selected is None else np.intersect1d(selected, field_rows, assume_unique=True)
+            if len(selected) == 0:
+                break
+        return selected if selected is not None else np.arange(self.count, dtype=np.int64)
+
+    def save(self, directory: str):
+        keys = [[field, value] for field, values in self.partitions.items() for value in values]
+        arrays = [self.partitions[field][value] for field, value in keys]
+        offsets = np.cumsum([0] + [len(rows) for rows in arrays]).astype(np.int64)
+        rows = np.concatenate(arrays) if arrays else np.empty(0, dtype=np.int64)
+
+        os.makedirs(directory, exist_ok=True)
+        np.savez(os.path.join(directory, self.ROWS_FILE), rows=rows, offsets=offsets)
+        # 键文件最后写入, 作为写入完成的标志
+        with open(os.path.join(directory, self.KEYS_FILE), 'w', encoding='utf-8') as f:
+            json.dump({"count": self.count, "keys": keys}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["PartitionIndex"]:
+        """读取已保存的分区(不存在时返回None)"""
+        keys_path = os.path.join(directory, cls.KEYS_FILE)
+        if not os.path.exists(keys_path):
+            return None
+        with open(keys_path, 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        with np.load(os.path.join(directory, cls.ROWS_FILE)) as data:
+            rows, offsets = data["rows"], data["offsets"]
+
+        partitions: Dict[str, Dict[str, np.ndarray]] = {}
+        for i, (field, value) in enumerate(header["keys"]):
+            partitions.setdefault(field, {})[value] = rows[offsets[i]:offsets[i + 1]]
+        return cls(partitions, header["count"])
+
+
+class LazyPartitions:
+    """按需建立并缓存分区, 数据变化后调用invalidate(线程安全)"""
+
+    def __init__(self):
+        self._index: Optional[PartitionIndex] = None
+        self._lock = threading.Lock()
+
+    def get(self, build) -> PartitionIndex:
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = build()
+        return self._index
+
+    def invalidate(self):
+        self._index = None
@@ -0,0 +1,279 @@
+"""
+内存映射向量存储模块
+Memory-Mapped Vector Store Module
+
+向量数据库的磁盘格式, 加载时只做内存映射, 不反序列化:
+
+    chunks/            列式文本块存储: 每列一个数据文件(.bin)和一个偏移文件(.off)
+        header.json    行数与列名
+        id.bin/.off    文本块ID
+        id.order       按ID排序的行号(int64), 按ID查找行号时二分查找
+        text.bin/.off  文本块内容(UTF-8)
+        meta.bin/.off  元数据(每行一个JSON对象)
+    vectors.npy        Flat索引的向量(numpy内存映射, 暴力检索)
+    norms.npy          向量的L2范数平方
+    index.faiss        IVF/HNSW索引(以faiss.IO_FLAG_MMAP读取)
+
+多个工作进程映射同一组文件时共享操作系统页缓存; 文本块只在命中时才解码为Document。
+内存映射的存储是只读的, 需要增删向量时先转换为内存中的可写存储(ChunkTable)。
+"""
+
+import os
+import json
+import mmap
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from langchain.schema import Document
+
+CHUNKS_DIR = "chunks"
+HEADER_FILE = "header.json"
+ID_ORDER_FILE = "id.order"
+VECTORS_FILE = "vectors.npy"
+NORMS_FILE = "norms.npy"
+FAISS_INDEX_FILE = "index.faiss"
+# langchain FAISS.save_local写入的旧格式(pickle)
+LEGACY_DOCSTORE_FILE = "index.pkl"
+
+COLUMNS = ("id", "text", "meta")
+FORMAT_VERSION = 1
+
+
+def _replace_file(path: str, write):
+    """先写临时文件再原子替换, 已映射旧文件的进程不受影响"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _write_column(directory: str, name: str, values: Iterable[bytes]):
+    offsets = [0]
+
+    def write_data(f):
+        for value in values:
+            f.write(value)
+            offsets.append(offsets[-1] + len(value))
+
+    _replace_file(os.path.join(directory, f"{name}.bin"), write_data)
+    _replace_file(
+        os.path.join(directory, f"{name}.off"),
+        lambda f: f.write(np.asarray(offsets, dtype=np.uint64).tobytes())
+    )
+
+
+class ColumnFile:
+    """只读的变长列: 第i行为data[offsets[i]:offsets[i+1]]"""
+
+    def __init__(self, directory: str, name: str):
+        self.offsets = np.memmap(os.path.join(directory, f"{name}.off"), dtype=np.uint64, mode='r')
+        data_path = os.path.join(directory, f"{name}.bin")
+        if os.path.getsize(data_path):
+            with open(data_path, 'rb') as f:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            # 空文件无法映射
+            self.data = b""
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> bytes:
+        return self.data[int(self.offsets[row]):int(self.offsets[row + 1])]
+
+
+class ChunkStore:
+    """列式文本块存储(只读, 内存映射)"""
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, HEADER_FILE), 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        if header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"不支持的文本块存储版本: {header.get('version')}")
+
+        self.columns = {name: ColumnFile(directory, name) for name in COLUMNS}
+        self.count = header["count"]
+        self._order = self._load_order(directory)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.count
+
+    @staticmethod
+    def write(directory: str, ids: Sequence[str], documents: Sequence[Document]):
+        """
+        写入文本块
+
+        Args:
+            directory: 存储目录
+            ids: 文本块ID(与向量索引中的位置一一对应)
+            documents: 文本块
+        """
+        os.makedirs(directory, exist_ok=True)
+        encoded = [chunk_id.encode('utf-8') for chunk_id in ids]
+        _write_column(directory, "id", encoded)
+        order = np.asarray(sorted(range(len(encoded)), key=encoded.__getitem__), dtype=np.int64)
+        _replace_file(os.path.join(directory, ID_ORDER_FILE), lambda f: f.write(order.tobytes()))
+        _write_column(directory, "text", (doc.page_content.encode('utf-8') for doc in documents))
+        _write_column(directory, "meta", (
+            json.dumps({k: v for k, v in doc.metadata.items() if k != "chunk_id"}, ensure_ascii=False).encode('utf-8')
+            for doc in documents
+        ))
+        # 头文件最后写入, 作为写入完成的标志
+        header = {"version": FORMAT_VERSION, "count": len(ids), "columns": list(COLUMNS)}
+        _replace_file(
+            os.path.join(directory, HEADER_FILE),
+            lambda f: f.write(json.dumps(header).encode('utf-8'))
+        )
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, HEADER_FILE))
+
+    def chunk_id(self, row: int) -> str:
+        return self.columns["id"][row].decode('utf-8')
+
+    def metadata(self, row: int) -> Dict:
+        """第row个文本块的元数据(不解码内容)"""
+        return json.loads(self.columns["meta"][row])
+
+    def document(self, row: int) -> Document:
+        """解码第row个文本块"""
+        metadata = self.metadata(row)
+        metadata["chunk_id"] = self.chunk_id(row)
+        return Document(page_content=self.columns["text"][row].decode('utf-8'), metadata=metadata)
+
+    def _load_order(self, directory: str) -> Optional[np.ndarray]:
+        path = os.path.join(directory, ID_ORDER_FILE)
+        if not os.path.exists(path):
+            return None
+        if not os.path.getsize(path):
+            return np.empty(0, dtype=np.int64)
+        return np.memmap(path, dtype=np.int64, mode='r')
+
+    def _id_order(self) -> np.ndarray:
+        # 没有id.order的旧存储在首次查找时排序一次(重新保存后写入文件)
+        if self._order is None:
+            with self._lock:
+                if self._order is None:
+                    column = self.columns["id"]
+                    self._order = np.asarray(sorted(range(self.count), key=column.__getitem__), dtype=np.int64)
+        return self._order
+
+    def position(self, chunk_id: str) -> Optional[int]:
+        """文本块ID对应的行号(在按ID排序的行号上二分查找)"""
+        key = chunk_id.encode('utf-8')
+        order = self._id_order()
+        column = self.columns["id"]
+        i = bisect_left(order, key, key=lambda row: column[row])
+        if i < len(order) and column[order[i]] == key:
+            return int(order[i])
+        return None
+
+
+class ChunkTable:
+    """内存中的可写文本块表, 与ChunkStore提供相同的按行访问接口"""
+
+    def __init__(self, ids: Sequence[str] = (), documents: Sequence[Document] = ()):
+        self._ids: List[str] = list(ids)
+        self._documents: List[Document] = list(documents)
+        self._positions = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+
+    @classmethod
+    def from_store(cls, chunks: ChunkStore) -> "ChunkTable":
+        """把内存映射的文本块全部解码到内存"""
+        return cls(
+            [chunks.chunk_id(row) for row in range(len(chunks))],
+            [chunks.document(row) for row in range(len(chunks))]
+        )
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def chunk_id(self, row: int) -> str:
+        return self._ids[row]
+
+    def metadata(self, row: int) -> Dict:
+        return self._documents[row].metadata
+
+    def document(self, row: int) -> Document:
+        return self._documents[row]
+
+    def position(self, chunk_id: str) -> Optional[int]:
+        return self._positions.get(chunk_id)
+
+    def append(self, ids: Sequence[str], documents: Sequence[Document]):
+        for chunk_id, document in zip(ids, documents):
+            self._positions[chunk_id] = len(self._ids)
+            self._ids.append(chunk_id)
+            self._documents.append(document)
+
+    def remove_rows(self, rows: Iterable[int]):
+        """删除若干行, 其余行保持原有顺序(与faiss Flat索引remove_ids后的位置一致)"""
+        removed = set(rows)
+        keep = [row for row in range(len(self._ids)) if row not in removed]
+        self.__init__([self._ids[row] for row in keep], [self._documents[row] for row in keep])
+
+    def save(self, directory: str):
+        ChunkStore.write(directory, self._ids, self._documents)
+
+
+class MmapFlatIndex:
+    """
+    numpy向量(通常为内存映射)上的精确L2检索, 接口与faiss索引的search一致(只读)
+
+    faiss的IO_FLAG_MMAP只映射IVF倒排表, Flat索引读取时仍会整体复制到内存,
+    因此Flat索引的向量单独保存为.npy文件, 用numpy暴力检索。
+    """
+
+    def __init__(self, vectors: np.ndarray, norms: np.ndarray):
+        self.vectors = vectors
+        self.norms = norms
+        self.d = vectors.shape[1]
+        self.ntotal = vectors.shape[0]
+        self.is_trained = True
+
+    @classmethod
+    def load(cls, directory: str) -> "MmapFlatIndex":
+        return cls(
+            np.load(os.path.join(directory, VECTORS_FILE), mmap_mode='r'),
+            np.load(os.path.join(directory, NORMS_FILE), mmap_mode='r')
+        )
+
+    @staticmethod
+    def save(directory: str, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        norms = np.einsum('ij,ij->i', vectors, vectors)
+        _replace_file(os.path.join(directory, VECTORS_FILE), lambda f: np.save(f, vectors))
+        _replace_file(os.path.join(directory, NORMS_FILE), lambda f: np.save(f, norms))
+
+    def search(self, queries: np.ndarray, k: int):
+        """返回与faiss一致的(距离平方, 位置), 不足k个时以-1填充"""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.d)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        labels = np.full((len(queries), k), -1, dtype=np.int64)
+        if self.ntotal == 0:
+            return distances, labels
+
+        n = min(k, self.ntotal)
+        scores = self.norms[np.newaxis, :] - 2.0 * (queries @ self.vectors.T)
+        top = np.argpartition(scores, n - 1, axis=1)[:, :n]
+        for i, row in enumerate(top):
+            row = row[np.argsort(scores[i, row])]
+            labels[i, :n] = row
+            distances[i, :n] = np.maximum(scores[i, row] + np.dot(queries[i], queries[i]), 0.0)
+        return distances, labels
+
+    def search_rows(self, queries: np.ndarray, k: int, rows: np.ndarray):
+        """只在给定位置(升序)的向量中精确检索, 只读取这些向量"""
+        subset = MmapFlatIndex(np.asarray(self.vectors[rows]), np.asarray(self.norms[rows]))
+        distances, labels = subset.search(queries, k)
+        return distances, np.where(labels >= 0, rows[np.maximum(labels, 0)], -1)
+
+    def describe(self) -> str:
+        return "Flat (内存映射)"
+
+    def reconstruct_n(self, start: int, count: int) -> np.ndarray:
+        return np.array(self.vectors[start:start + count])
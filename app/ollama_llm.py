@@ -0,0 +1,179 @@
+"""
+Ollama本地模型客户端
+Ollama Client with KV-Cache Reuse
+
+直接调用Ollama的 /api/generate 接口(LLM_TYPE=ollama), 尽量让服务端复用已计算的提示词KV缓存:
+
+- keep_alive: 每个请求都要求模型常驻OLLAMA_KEEP_ALIVE, 模型被卸载时KV缓存随之丢失;
+  问答提示词以固定的系统提示词开头, Ollama按最长公共前缀复用这部分KV缓存
+- 每次请求记录提示词的计算量: Ollama返回的prompt_eval_count/prompt_eval_duration是实际计算的token数和耗时,
+  命中缓存的token数 = 输入token总数(context长度 - 回答token数) - 实际计算的token数,
+  节省的时间按本次的计算速度估算
+
+HTTP请求与LLM路由(app/llm_router.py)共用后台事件循环线程和连接池。
+离线测试可用app/fake_llm_server.py(--prompt-eval-ms 模拟提示词计算耗时和前缀缓存)。
+"""
+
+import json
+import queue
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+from app.config import (
+    OLLAMA_MODEL,
+    OLLAMA_BASE_URL,
+    OLLAMA_API_KEY,
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_NUM_CTX,
+    OLLAMA_READ_TIMEOUT,
+    LLM_CONNECT_TIMEOUT,
+    TEMPERATURE
+)
+from app.llm_router import LLMBackendError, transport
+from app.tracing import tracer
+
+
+class OllamaLLM(LLM):
+    """Ollama /api/generate 的流式LLM(langchain接口: invoke / stream / astream)"""
+
+    model: str = OLLAMA_MODEL
+    base_url: str = OLLAMA_BASE_URL
+    api_key: str = OLLAMA_API_KEY
+    temperature: float = TEMPERATURE
+    keep_alive: str = OLLAMA_KEEP_ALIVE
+    num_ctx: int = OLLAMA_NUM_CTX
+    timeout: float = OLLAMA_READ_TIMEOUT
+
+    @property
+    def _llm_type(self) -> str:
+        return "ollama"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model, "base_url": self.base_url}
+
+    def _payload(self, prompt: str, stop: Optional[List[str]]) -> Dict:
+        options: Dict[str, Any] = {"temperature": self.temperature}
+        if self.num_ctx:
+            options["num_ctx"] = self.num_ctx
+        if stop:
+            options["stop"] = stop
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": self.keep_alive,
+            "options": options,
+        }
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None,
+                     run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        return "".join([chunk.text async for chunk in self._astream(prompt, stop, run_manager, **kwargs)])
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        channel: queue.Queue = queue.Queue()
+        future = transport().submit(self._produce(self._payload(prompt, stop), channel.put))
+        try:
+            while True:
+                kind, value = channel.get()
+                if kind == "done":
+                    # 在调用方线程中记录, 归入当前链路的llm阶段
+                    self._record(value)
+                    continue
+                if kind == "error":
+                    raise value
+                if kind == "end":
+                    return
+                chunk = GenerationChunk(text=value)
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+        finally:
+            # 调用方提前停止迭代时取消请求
+            future.cancel()
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        loop = asyncio.get_running_loop()
+        channel: asyncio.Queue = asyncio.Queue()
+        future = transport().submit(self._produce(
+            self._payload(prompt, stop),
+            lambda item: loop.call_soon_threadsafe(channel.put_nowait, item)
+        ))
+        try:
+            while True:
+                kind, value = await channel.get()
+                if kind == "done":
+                    self._record(value)
+                    continue
+                if kind == "error":
+                    raise value
+                if kind == "end":
+                    return
+                chunk = GenerationChunk(text=value)
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+        finally:
+            future.cancel()
+
+    async def _produce(self, payload: Dict, emit: Callable[[Tuple[str, Any]], None]):
+        """在I/O线程中发送请求, 把文本片段、结束时的统计信息和错误放入调用方的队列"""
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        timeout = httpx.Timeout(self.timeout, connect=LLM_CONNECT_TIMEOUT)
+        try:
+            url = f"{self.base_url.rstrip('/')}/api/generate"
+            async with transport().client().stream("POST", url, headers=headers, json=payload,
+                                                   timeout=timeout) as response:
+                if response.status_code >= 400:
+                    body = (await response.aread()).decode("utf-8", "replace")
+                    raise LLMBackendError(
+                        f"ollama 返回HTTP {response.status_code}: {body[:200]}",
+                        status_code=response.status_code, backend="ollama", response=response
+                    )
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise LLMBackendError(f"ollama 返回错误: {data['error']}", backend="ollama")
+                    if data.get("response"):
+                        emit(("token", data["response"]))
+                    if data.get("done"):
+                        emit(("done", data))
+            emit(("end", None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            emit(("error", e))
+
+    def _record(self, data: Dict):
+        """记录提示词的计算量与缓存命中"""
+        # 提示词全部命中缓存时Ollama可能省略prompt_eval_count
+        evaluated = data.get("prompt_eval_count") or 0
+        seconds = (data.get("prompt_eval_duration") or 0) / 1e9
+        attributes = {"prompt_eval_tokens": evaluated, "prompt_eval_ms": round(seconds * 1000, 3)}
+        if data.get("load_duration"):
+            attributes["load_ms"] = round(data["load_duration"] / 1e6, 3)
+
+        context = data.get("context")
+        if context is not None:
+            cached = max(len(context) - (data.get("eval_count") or 0) - evaluated, 0)
+            saved = cached * seconds / evaluated if evaluated else 0.0
+            attributes.update(prompt_cached_tokens=cached, prompt_eval_saved_ms=round(saved * 1000, 3))
+            tracer.count("chatbot_ollama_prompt_tokens_total", cached, state="cached")
+            tracer.count("chatbot_ollama_prompt_eval_seconds_total", saved, kind="saved")
+        tracer.count("chatbot_ollama_prompt_tokens_total", evaluated, state="evaluated")
+        tracer.count("chatbot_ollama_prompt_eval_seconds_total", seconds, kind="evaluated")
+        tracer.annotate(**attributes)
@@ -0,0 +1,205 @@
+"""
+ONNX模型推理模块
+ONNX Runtime Model Inference Module
+
+在CPU上用onnxruntime + tokenizers运行Hugging Face仓库中导出的ONNX模型, 不需要torch:
+
+    OnnxEmbeddings     句向量模型(池化方式与最大长度读取自sentence-transformers配置)
+    create_session     按ONNX_THREADS配置线程数的推理会话, 可选int8动态量化
+
+并发的单条查询嵌入经MicroBatcher合并为一次前向计算。
+"""
+
+import os
+import json
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.batching import MicroBatcher
+from app.config import ONNX_THREADS
+
+# 模型文件与本地量化结果的缓存目录(与嵌入模型一致)
+MODEL_CACHE_DIR = "./.cache"
+QUANTIZED_DIR = "./.cache/onnx"
+
+# 未指定线程数时的算子内线程数(多进程服务的工作进程按核数均分, 见set_default_threads)
+_default_threads = ONNX_THREADS
+
+
+def resolve_model_name(model_name: str) -> str:
+    """与sentence-transformers一致: 不带组织名的模型名称指向sentence-transformers组织"""
+    if os.path.isdir(model_name) or "/" in model_name:
+        return model_name
+    return f"sentence-transformers/{model_name}"
+
+
+def model_file(model_name: str, filename: str) -> str:
+    """模型中的文件路径: 本地目录直接读取, 否则从Hugging Face下载到缓存目录"""
+    if os.path.isdir(model_name):
+        path = os.path.join(model_name, filename)
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        return path
+
+    from huggingface_hub import hf_hub_download
+    return hf_hub_download(repo_id=model_name, filename=filename, cache_dir=MODEL_CACHE_DIR)
+
+
+def _optional_json(model_name: str, filename: str) -> Dict:
+    try:
+        with open(model_file(model_name, filename), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def quantized_model(model_path: str, model_name: str) -> str:
+    """int8动态量化(只在首次使用时执行, 结果缓存在本地)"""
+    target = os.path.join(
+        QUANTIZED_DIR,
+        model_name.strip("/").replace("/", "--"),
+        os.path.basename(model_path).replace(".onnx", "_int8.onnx")
+    )
+    if not os.path.exists(target):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print(f"⚙️  正在量化模型(int8): {target}")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.tmp"
+        quantize_dynamic(model_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, target)
+    return target
+
+
+def set_default_threads(threads: int):
+    """设置之后创建的推理会话的默认算子内线程数"""
+    global _default_threads
+    _default_threads = threads
+
+
+def create_session(model_path: str, threads: Optional[int] = None):
+    """
+    创建CPU推理会话
+
+    Args:
+        model_path: ONNX文件路径
+        threads: 算子内并行线程数(0表示由onnxruntime按物理核数决定, None表示使用默认值)
+    """
+    import onnxruntime as ort
+
+    if threads is None:
+        threads = _default_threads
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    # 单条查询的计算图没有可并行的分支, 并行度全部交给算子内线程
+    options.inter_op_num_threads = 1
+    if threads > 0:
+        options.intra_op_num_threads = threads
+    return ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+
+def load_tokenizer(model_name: str, max_length: int):
+    """读取tokenizer.json, 按批内最长序列填充"""
+    from tokenizers import Tokenizer
+
+    tokenizer = Tokenizer.from_file(model_file(model_name, "tokenizer.json"))
+    tokenizer.enable_truncation(max_length)
+    pad_token = next(
+        (token for token in ("[PAD]", "<pad>") if tokenizer.token_to_id(token) is not None),
+        "[PAD]"
+    )
+    tokenizer.enable_padding(pad_id=tokenizer.token_to_id(pad_token) or 0, pad_token=pad_token)
+    return tokenizer
+
+
+def model_inputs(encodings, input_names) -> Dict[str, np.ndarray]:
+    """tokenizers编码结果转换为模型输入(只保留模型声明的输入)"""
+    inputs = {
+        "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+        "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+        "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+    }
+    return {name: value for name, value in inputs.items() if name in input_names}
+
+
+class OnnxEmbeddings(Embeddings):
+    """onnxruntime推理的句向量模型, 输出与sentence-transformers一致(可选归一化)"""
+
+    def __init__(self, model_name: str, onnx_file: str = "onnx/model.onnx", quantize: bool = True,
+                 normalize: bool = True, batch_size: int = 32, query_batch_size: int = 32,
+                 query_max_wait_ms: float = 2.0, threads: Optional[int] = None):
+        """
+        Args:
+            model_name: 模型名称(Hugging Face仓库)或本地目录
+            onnx_file: 仓库中的ONNX文件
+            quantize: 是否做int8动态量化
+            normalize: 是否L2归一化
+            batch_size: 嵌入文档时每次前向计算的文本数
+            query_batch_size: 并发查询合并的最大批大小
+            query_max_wait_ms: 并发查询合并的最长等待时间(毫秒)
+            threads: 算子内并行线程数(None表示使用默认值)
+        """
+        self.model_name = resolve_model_name(model_name)
+        model_path = model_file(self.model_name, onnx_file)
+        if quantize:
+            model_path = quantized_model(model_path, self.model_name)
+        self.model_path = model_path
+
+        config = _optional_json(self.model_name, "sentence_bert_config.json")
+        self.max_length = config.get("max_seq_length", 512)
+        pooling = _optional_json(self.model_name, "1_Pooling/config.json")
+        self.pooling = "cls" if pooling.get("pooling_mode_cls_token") else "mean"
+
+        self.tokenizer = load_tokenizer(self.model_name, self.max_length)
+        self.session = create_session(model_path, threads)
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        self.output_names = [node.name for node in self.session.get_outputs()]
+        self.normalize = normalize
+        self.batch_size = batch_size
+        self._query_batcher = MicroBatcher(
+            self._encode_batch, max_batch_size=query_batch_size,
+            max_wait_ms=query_max_wait_ms, name="onnx-query-batcher"
+        )
+
+    def describe(self) -> str:
+        return f"onnx: {os.path.basename(self.model_path)}, {self.pooling} pooling"
+
+    def _encode_batch(self, texts: Sequence[str]) -> np.ndarray:
+        """一次前向计算"""
+        encodings = self.tokenizer.encode_batch(list(texts))
+        inputs = model_inputs(encodings, self.input_names)
+        if "sentence_embedding" in self.output_names:
+            vectors = self.session.run(["sentence_embedding"], inputs)[0]
+        else:
+            hidden = self.session.run([self.output_names[0]], inputs)[0]
+            if self.pooling == "cls":
+                vectors = hidden[:, 0]
+            else:
+                mask = inputs["attention_mask"][:, :, np.newaxis].astype(np.float32)
+                vectors = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.normalize:
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """按长度排序后分批编码(批内填充长度接近), 结果按输入顺序返回"""
+        vectors: Optional[np.ndarray] = None
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            encoded = self._encode_batch([texts[i] for i in batch])
+            if vectors is None:
+                vectors = np.zeros((len(texts), encoded.shape[1]), dtype=np.float32)
+            vectors[batch] = encoded
+        return vectors if vectors is not None else np.zeros((0, 0), dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._query_batcher.submit(text).tolist()
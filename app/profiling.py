@@ -0,0 +1,75 @@
+"""
+启动耗时分析模块
+Startup Profiling Module
+
+按阶段记录启动耗时(模块导入、嵌入模型加载、索引加载、LLM客户端初始化、构建对话链),
+通过 python main.py --profile-startup 启用。未启用时phase()只是空的上下文管理器。
+"""
+
+import time
+import threading
+import unicodedata
+from contextlib import contextmanager
+from typing import List, Tuple
+
+
+def _pad(text: str, width: int) -> str:
+    """按终端显示宽度(中文占两列)右侧补空格"""
+    used = sum(2 if unicodedata.east_asian_width(ch) in "WF" else 1 for ch in text)
+    return text + " " * max(0, width - used)
+
+
+class StartupProfiler:
+    """分阶段计时器, 支持阶段嵌套"""
+
+    def __init__(self):
+        self.enabled = False
+        self._phases: List[Tuple[int, str, float]] = []
+        self._depth = 0
+        self._started = 0.0
+        self._lock = threading.Lock()
+
+    def enable(self):
+        """开始记录"""
+        self.enabled = True
+        self._phases.clear()
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        """记录一个阶段的耗时"""
+        if not self.enabled:
+            yield
+            return
+
+        with self._lock:
+            slot = len(self._phases)
+            depth = self._depth
+            self._phases.append((depth, name, 0.0))
+            self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._phases[slot] = (depth, name, elapsed)
+                self._depth -= 1
+
+    def report(self):
+        """打印各阶段耗时"""
+        total = time.perf_counter() - self._started
+        print("\n" + "="*70)
+        print("⏱️  启动耗时分析")
+        print("="*70)
+        for depth, name, elapsed in self._phases:
+            share = f"{elapsed / total:>6.1%}" if depth == 0 and total else ""
+            print(f"  {_pad('  ' * depth + name, 44)}{elapsed * 1000:>10.1f} ms  {share}")
+        print("-"*70)
+        print(f"  {_pad('总计', 44)}{total * 1000:>10.1f} ms")
+        print("="*70)
+        print("💡 模块导入的详细耗时可使用: python -X importtime main.py --profile-startup")
+
+
+# 全局启动计时器
+profiler = StartupProfiler()
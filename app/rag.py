@@ -4,22 +4,120 @@ RAG (Retrieval-Augmented Generation) Module
 """
 
 import os
-from typing import List, Tuple
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import TextLoader
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 from langchain.schema import Document
-import chromadb
+from langchain_core.retrievers import BaseRetriever
+import numpy as np
 
 from app.config import (
     KNOWLEDGE_BASE_PATH,
     EMBEDDING_MODEL,
+    EMBEDDING_BACKEND,
+    EMBEDDING_ONNX_FILE,
+    EMBEDDING_QUANTIZE,
+    EMBED_QUERY_BATCH_SIZE,
+    EMBED_QUERY_MAX_WAIT_MS,
     CHUNK_SIZE,
+    CHUNKER,
     CHUNK_OVERLAP,
     VECTOR_STORE_PATH,
-    TOP_K_RESULTS
+    VECTOR_BACKEND,
+    CHROMA_COLLECTION,
+    INDEX_MANIFEST_FILE,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_CACHE_MEMORY_SIZE,
+    EMBED_BATCH_SIZE,
+    EMBED_WORKERS,
+    VECTOR_INDEX_TYPE,
+    ANN_TRAIN_SAMPLE,
+    IVF_NLIST,
+    IVF_NPROBE,
+    PQ_M,
+    PQ_NBITS,
+    HNSW_M,
+    HNSW_EF_SEARCH,
+    HYBRID_SEARCH,
+    HYBRID_CANDIDATES,
+    RRF_K,
+    LEXICAL_TOKENIZER,
+    LEXICAL_INDEX_DIR,
+    TOP_K_RESULTS,
+    SCORE_THRESHOLD,
+    RERANK_ENABLED,
+    RERANK_CANDIDATES,
+    RERANK_MIN_KEEP,
+    RETRIEVAL_BATCH_ENABLED,
+    RETRIEVAL_BATCH_SIZE,
+    RETRIEVAL_BATCH_MAX_WAIT_MS,
+    METADATA_AUTO_FILTER,
+    FILTER_EXACT_MAX_ROWS
 )
+from app.manifest import IndexManifest, make_chunk_ids
+from app.embedding_cache import EmbeddingCache, CachedEmbeddings, LazyEmbeddings
+from app.ingest import IngestProgress, batched, document_embedder
+from app.metadata import PARTITION_FIELDS, extract_metadata, filter_key
+from app.lexical import BM25Index, reciprocal_rank_fusion, resolve_tokenizer
+from app.batching import MicroBatcher
+from app.chunking import BREAKS, MarkdownChunker
+from app.profiling import profiler
+from app.reranker import CrossEncoderReranker
+from app.tracing import tracer
+from app.vector_stores import SearchHit, create_store, open_store, store_exists
+
+# 文本分割使用的分隔符
+TEXT_SEPARATORS = ["\n\n", "\n", "。", "!", "?", ";", "；", "!", "?", "，", ",", " ", ""]
+CHUNKERS = ("markdown", "recursive")
+
+# 当前上下文中最近一次向量检索的查询向量(见RAGRetriever.retrieve_with_vector)
+_query_vector: ContextVar[Optional[np.ndarray]] = ContextVar("query_vector", default=None)
+
+
+def chunker_config() -> dict:
+    """分块参数(写入索引配置, 修改后触发全量重建)"""
+    if CHUNKER not in CHUNKERS:
+        raise ValueError(f"不支持的分块方式: {CHUNKER} (可选: {', '.join(CHUNKERS)})")
+    if CHUNKER == "markdown":
+        return {"chunker": CHUNKER, "chunk_size": CHUNK_SIZE, "chunk_overlap": 0,
+                "separators": [separator for group in BREAKS for separator in group]}
+    return {"chunker": CHUNKER, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP,
+            "separators": TEXT_SEPARATORS}
+
+
+def describe_chunker() -> str:
+    config = chunker_config()
+    return f"{config['chunker']}, chunk_size={config['chunk_size']}, overlap={config['chunk_overlap']}"
+
+# 向量索引的构建与查询参数
+ANN_PARAMS = {
+    "nlist": IVF_NLIST,
+    "nprobe": IVF_NPROBE,
+    "pq_m": PQ_M,
+    "pq_nbits": PQ_NBITS,
+    "hnsw_m": HNSW_M,
+    "ef_search": HNSW_EF_SEARCH,
+    "filter_exact_rows": FILTER_EXACT_MAX_ROWS,
+}
+
+EMBEDDING_BACKENDS = ("torch", "onnx")
+
+
+def embedding_model_id() -> str:
+    """嵌入模型标识(用于索引清单与嵌入缓存), 不同推理后端/量化设置产生的向量不混用"""
+    if EMBEDDING_BACKEND == "onnx":
+        return f"{EMBEDDING_MODEL}|onnx:{EMBEDDING_ONNX_FILE}" + ("|int8" if EMBEDDING_QUANTIZE else "")
+    return EMBEDDING_MODEL
+
+
+class RAGDocumentRetriever(BaseRetriever):
+    """把RAGRetriever.retrieve包装为langchain检索器, 供对话检索链使用"""
+    
+    rag: Any
+    filters: Optional[Dict[str, Any]] = None
+    
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return self.rag.retrieve(query, filters=self.filters)
 
 
 class RAGRetriever:
@@ -30,59 +128,189 @@ class RAGRetriever:
         self.embeddings = None
         self.vector_store = None
         self.retriever = None
+        self.manifest = None
+        self.lexical_index = None
+        self.reranker = None
+        self.query_batcher = None
+        # 索引内容每次变化时递增, 供回答缓存等判断是否失效
+        self.index_version = 0
         
-    def initialize_chromadb(self):
-        """初始化ChromaDB客户端和集合"""
-        self.chroma_client = chromadb.PersistentClient('./data/vector_store/chroma_db')
-        self.chromadb_collection = self.chroma_client.get_or_create_collection(name="rag_collection")
     def list_files(self, directory: str) -> List[str]:
-        """列出目录下的所有文件"""
+        """列出目录下的所有文件(跳过向量数据库目录)"""
         files = []
-        for root, _, filenames in os.walk(directory):
-            for filename in filenames:
+        store_path = os.path.abspath(VECTOR_STORE_PATH)
+        for root, dirnames, filenames in os.walk(directory):
+            dirnames[:] = sorted(
+                d for d in dirnames
+                if os.path.abspath(os.path.join(root, d)) != store_path
+            )
+            for filename in sorted(filenames):
                 files.append(os.path.join(root, filename))
         return files
     
+    def load_file(self, file_path: str) -> List[Document]:
+        """加载单个知识库文件"""
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"知识库文件不存在: {file_path}")
+        
+        # 文档加载和分割只在构建/同步索引时需要, 延迟导入以加快启动
+        from langchain_community.document_loaders import TextLoader
+        
+        loader = TextLoader(file_path, encoding='utf-8')
+        documents = loader.load()
+        for document in documents:
+            # 单位/批次/截止日期/岗位类型, 分块时复制到每个文本块
+            document.metadata.update(extract_metadata(document.page_content, file_path))
+        return documents
+    
     def load_documents(self) -> List[Document]:
         """加载知识库文档"""
         print(f"📄 正在加载知识库: {KNOWLEDGE_BASE_PATH}")
         documents = []
         for file_path in self.list_files(KNOWLEDGE_BASE_PATH):
             print(f"   - {file_path}")
-            if not os.path.exists(file_path):
-                raise FileNotFoundError(f"知识库文件不存在: {file_path}")
-            
-            loader = TextLoader(file_path, encoding='utf-8')
-            documents.extend(loader.load())
+            documents.extend(self.load_file(file_path))
             
         print(f"✅ 成功加载 {len(documents)} 个文档")
         return documents
     
     def split_documents(self, documents: List[Document]) -> List[Document]:
         """将文档分割成小块"""
-        print(f"✂️  正在分割文档 (chunk_size={CHUNK_SIZE}, overlap={CHUNK_OVERLAP})")
-        
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP,
-            separators=["\n\n", "\n", "。", "!", "?", ";", "；", "!", "?", "，", ",", " ", ""],
-        )
+        print(f"✂️  正在分割文档 ({describe_chunker()})")
         
-        chunks = text_splitter.split_documents(documents)
+        chunks = self._split(documents)
         print(f"✅ 文档已分割成 {len(chunks)} 个文本块")
-        print(chunks)
         return chunks
     
-    def initialize_embeddings(self):
-        """初始化嵌入模型"""
-        print(f"🔧 正在加载嵌入模型: {EMBEDDING_MODEL}")
+    def _split(self, documents: List[Document]) -> List[Document]:
+        """分割文档并分配文本块ID"""
+        if chunker_config()["chunker"] == "markdown":
+            # 按标题切分章节, 文本块带section/heading_path/start_index/end_index
+            text_splitter = MarkdownChunker(CHUNK_SIZE)
+        else:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+            
+            text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=CHUNK_SIZE,
+                chunk_overlap=CHUNK_OVERLAP,
+                separators=TEXT_SEPARATORS,
+                # 记录文本块在原文中的位置, 打包上下文时据此合并重叠的文本块
+                add_start_index=True,
+            )
+        
+        chunks = list(text_splitter.split_documents(documents))
+        self.assign_chunk_ids(chunks)
+        return chunks
+    
+    def iter_chunks(self, file_paths: Iterable[str]) -> Iterator[Document]:
+        """逐个文件惰性加载并分割, 依次产出文本块"""
+        for file_path in file_paths:
+            yield from self._split(self.load_file(file_path))
+    
+    def assign_chunk_ids(self, chunks: List[Document]):
+        """按来源文件为文本块分配基于内容哈希的稳定ID(写入metadata['chunk_id'])"""
+        by_source = {}
+        for chunk in chunks:
+            by_source.setdefault(chunk.metadata.get("source", ""), []).append(chunk)
+        
+        for source, source_chunks in by_source.items():
+            ids = make_chunk_ids(source, [chunk.page_content for chunk in source_chunks])
+            for chunk, chunk_id in zip(source_chunks, ids):
+                chunk.metadata["chunk_id"] = chunk_id
+    
+    def index_config(self) -> dict:
+        """影响向量结果的配置, 任一项变化都需要全量重建"""
+        config = {
+            "embedding_model": embedding_model_id(),
+            "normalize_embeddings": True,
+            **chunker_config(),
+            "metadata_fields": list(PARTITION_FIELDS),
+            "vector_backend": VECTOR_BACKEND,
+        }
+        # 索引类型与构建参数只对faiss后端有效; app.ann依赖faiss, 只在选中时导入
+        if VECTOR_BACKEND == "faiss":
+            from app.ann import build_config
+            config["vector_index"] = build_config(VECTOR_INDEX_TYPE, ANN_PARAMS)
+        return config
+    
+    def manifest_path(self) -> str:
+        """增量索引清单文件路径"""
+        return os.path.join(VECTOR_STORE_PATH, INDEX_MANIFEST_FILE)
+    
+    def vector_store_options(self) -> dict:
+        """VECTOR_BACKEND对应后端的创建参数"""
+        if VECTOR_BACKEND == "faiss":
+            return {"index_type": VECTOR_INDEX_TYPE, "params": ANN_PARAMS, "train_size": ANN_TRAIN_SAMPLE}
+        if VECTOR_BACKEND == "chroma":
+            return {"collection": CHROMA_COLLECTION}
+        return {}
+    
+    def initialize_embeddings(self, lazy: bool = False):
+        """
+        初始化嵌入模型
+        
+        Args:
+            lazy: 是否推迟到首次嵌入时再加载模型(只加载已有向量数据库时无需立即加载)
+        """
+        if lazy:
+            self.embeddings = LazyEmbeddings(self._create_embeddings)
+        else:
+            self.embeddings = self._create_embeddings()
+    
+    def _create_embeddings(self):
+        """加载嵌入模型并包装嵌入缓存"""
+        with profiler.phase("加载嵌入模型"):
+            return self._load_embedding_model()
+    
+    def _load_embedding_model(self):
+        print(f"🔧 正在加载嵌入模型: {EMBEDDING_MODEL} ({EMBEDDING_BACKEND})")
+        
+        if EMBEDDING_BACKEND == "onnx":
+            embeddings, normalize = self._load_onnx_embeddings()
+        elif EMBEDDING_BACKEND == "torch":
+            embeddings, normalize = self._load_torch_embeddings()
+        else:
+            raise ValueError(f"不支持的嵌入后端: {EMBEDDING_BACKEND} (可选: {', '.join(EMBEDDING_BACKENDS)})")
+        
+        # 包装持久化嵌入缓存, 只计算未命中的文本
+        if EMBEDDING_CACHE_ENABLED:
+            cache = EmbeddingCache(
+                EMBEDDING_CACHE_DIR,
+                model_name=embedding_model_id(),
+                normalize=normalize,
+                memory_size=EMBEDDING_CACHE_MEMORY_SIZE
+            )
+            embeddings = CachedEmbeddings(embeddings, cache)
+            print(f"🗃️  嵌入缓存已启用 ({len(cache)} 条)")
+        return embeddings
+    
+    def _load_onnx_embeddings(self):
+        """onnxruntime推理(可选int8量化), 并发查询合并为批量前向计算"""
+        from app.onnx_models import OnnxEmbeddings
         
+        embeddings = OnnxEmbeddings(
+            EMBEDDING_MODEL,
+            onnx_file=EMBEDDING_ONNX_FILE,
+            quantize=EMBEDDING_QUANTIZE,
+            normalize=True,
+            batch_size=EMBED_BATCH_SIZE,
+            query_batch_size=EMBED_QUERY_BATCH_SIZE,
+            query_max_wait_ms=EMBED_QUERY_MAX_WAIT_MS
+        )
+        print(f"✅ 嵌入模型加载完成 ({embeddings.describe()})")
+        return embeddings, True
+    
+    def _load_torch_embeddings(self):
+        """sentence-transformers全精度推理"""
+        normalize = True
         try:
             # 尝试加载模型,设置缓存目录
-            self.embeddings = HuggingFaceEmbeddings(
+            from langchain_community.embeddings import HuggingFaceEmbeddings
+            
+            embeddings = HuggingFaceEmbeddings(
                 model_name=EMBEDDING_MODEL,
                 model_kwargs={'device': 'cpu'},
-                encode_kwargs={'normalize_embeddings': True},
+                encode_kwargs={'normalize_embeddings': normalize},
                 cache_folder="./.cache"  # 使用本地缓存目录
             )
             print("✅ 嵌入模型加载完成")
@@ -105,81 +333,233 @@ class RAGRetriever:
                 def embed_query(self, text):
                     return self.model.encode([text], convert_to_numpy=True)[0].tolist()
             
-            self.embeddings = CustomEmbeddings(model)
+            embeddings = CustomEmbeddings(model)
+            normalize = False
             print("✅ 使用备用方法加载模型成功")
+        return embeddings, normalize
     
-    def build_vector_store(self, chunks: List[Document]):
-        """构建向量数据库"""
-        print("🏗️  正在构建向量数据库...")
+    def build_vector_store(self, chunks: Iterable[Document]):
+        """
+        构建向量数据库
         
-        self.vector_store = FAISS.from_documents(
-            documents=chunks,
-            embedding=self.embeddings
-        )
+        chunks可以是惰性生成器: 文本块按EMBED_BATCH_SIZE分批嵌入并增量写入索引,
+        流水线中同时只保留一个批次, 内存峰值与知识库规模无关(索引本身除外)。
+        IVF/PQ索引需要训练, 会先缓存前ANN_TRAIN_SAMPLE个向量作为训练样本。
+        Chroma后端在已有集合上按文本块ID upsert, 最后删除不再存在的文本块。
+        """
+        print(f"🏗️  正在构建向量数据库 (后端: {VECTOR_BACKEND})...")
+        
+        self.vector_store = create_store(VECTOR_BACKEND, VECTOR_STORE_PATH, **self.vector_store_options())
+        previous_ids = set(self.vector_store.ids())
+        chunk_ids_by_source = self.add_chunks(chunks)
+        
+        new_ids = {chunk_id for ids in chunk_ids_by_source.values() for chunk_id in ids}
+        if previous_ids - new_ids:
+            self.vector_store.delete(list(previous_ids - new_ids))
+        if len(self.vector_store) == 0:
+            raise ValueError(f"知识库中没有可索引的文本块: {KNOWLEDGE_BASE_PATH}")
+        self.index_version += 1
+        self.build_lexical_index()
+        
+        # 记录每个文件的哈希及其文本块ID
+        self.manifest = IndexManifest(self.manifest_path(), self.index_config())
+        for file_path in self.list_files(KNOWLEDGE_BASE_PATH):
+            self.manifest.update_file(file_path, chunk_ids_by_source.get(file_path, []))
         
         print("✅ 向量数据库构建完成")
     
-    def save_vector_store(self):
-        """保存向量数据库到磁盘"""
-        if self.vector_store is None:
+    def add_chunks(self, chunks: Iterable[Document], workers: int = EMBED_WORKERS) -> Dict[str, List[str]]:
+        """
+        分批嵌入文本块并写入向量数据库
+        
+        Args:
+            chunks: 文本块(可为生成器)
+            workers: 嵌入编码进程数
+            
+        Returns:
+            按来源文件分组的已写入文本块ID
+        """
+        progress = IngestProgress()
+        chunk_ids_by_source = {}
+        
+        with document_embedder(self.embeddings, workers, EMBED_BATCH_SIZE) as embedder:
+            for batch in batched(chunks, EMBED_BATCH_SIZE):
+                ids = [chunk.metadata["chunk_id"] for chunk in batch]
+                vectors = np.asarray(embedder.embed_documents([chunk.page_content for chunk in batch]), dtype=np.float32)
+                self.vector_store.add(ids, batch, vectors)
+                
+                for chunk in batch:
+                    chunk_ids_by_source.setdefault(chunk.metadata.get("source", ""), []).append(
+                        chunk.metadata["chunk_id"]
+                    )
+                progress.update(len(batch))
+        
+        # 训练样本不足ANN_TRAIN_SAMPLE时, 用已缓存的全部向量创建索引
+        self.vector_store.flush()
+        progress.finish()
+        return chunk_ids_by_source
+    
+    def _rebuild_without(self, stale_ids: List[str]):
+        """
+        删除过期向量后重建索引
+        
+        IVF/HNSW索引不支持原地删除, 用剩余文本块重新训练并写入索引;
+        剩余文本块的嵌入来自嵌入缓存, 不需要重新计算。
+        """
+        stale = set(stale_ids)
+        remaining = [doc for doc in self.vector_store.documents() if doc.metadata["chunk_id"] not in stale]
+        print(f"🧭 {self.vector_store.describe()} 索引不支持原地删除, 使用剩余 {len(remaining)} 个文本块重建")
+        
+        self.vector_store.reset()
+        self.add_chunks(remaining, workers=1)
+    
+    def sync_vector_store(self) -> bool:
+        """
+        增量同步知识库与向量数据库
+        
+        只对新增或修改的文件重新分割, 只嵌入内容发生变化的文本块,
+        并删除已删除文件或已修改文本块对应的过期向量。
+        
+        Returns:
+            是否有变更写入向量数据库
+        """
+        if self.vector_store is None or self.manifest is None:
             raise ValueError("向量数据库未初始化")
         
-        os.makedirs(os.path.dirname(VECTOR_STORE_PATH), exist_ok=True)
-        self.vector_store.save_local(VECTOR_STORE_PATH)
-        print(f"💾 向量数据库已保存到: {VECTOR_STORE_PATH}")
-    def build_vector_store_chroma(self, chunks: List[Document]):
+        print("🔄 正在检查知识库变更...")
+        changes = self.manifest.diff(self.list_files(KNOWLEDGE_BASE_PATH))
+        if not (changes["added"] or changes["changed"] or changes["deleted"]):
+            print("✅ 知识库无变化")
+            return False
+        
+        print(f"   新增 {len(changes['added'])} 个, 修改 {len(changes['changed'])} 个, "
+              f"删除 {len(changes['deleted'])} 个文件")
+        
+        stale_ids = []
+        new_chunks = []
+        for file_path in changes["deleted"]:
+            stale_ids.extend(self.manifest.chunk_ids(file_path))
+            self.manifest.remove_file(file_path)
+        
+        for file_path in changes["added"] + changes["changed"]:
+            print(f"   - {file_path}")
+            chunks = self._split(self.load_file(file_path))
+            old_ids = set(self.manifest.chunk_ids(file_path))
+            new_ids = [chunk.metadata["chunk_id"] for chunk in chunks]
+            
+            stale_ids.extend(old_ids.difference(new_ids))
+            new_chunks.extend(chunk for chunk in chunks if chunk.metadata["chunk_id"] not in old_ids)
+            self.manifest.update_file(file_path, new_ids)
+        
+        # 删除过期向量(忽略索引中已不存在的ID)
+        existing_ids = set(self.vector_store.ids())
+        stale_ids = [chunk_id for chunk_id in stale_ids if chunk_id in existing_ids]
+        if stale_ids:
+            if self.vector_store.supports_delete:
+                self.vector_store.delete(stale_ids)
+            else:
+                self._rebuild_without(stale_ids)
+        
+        # 只嵌入新增/修改的文本块(少量变更不值得启动多进程池)
+        if new_chunks:
+            self.add_chunks(new_chunks, workers=EMBED_WORKERS if len(new_chunks) >= EMBED_BATCH_SIZE else 1)
+        
+        self.index_version += 1
+        self.update_lexical_index(stale_ids, new_chunks)
+        print(f"✅ 增量更新完成: 新增 {len(new_chunks)} 个文本块, 删除 {len(stale_ids)} 个过期向量")
+        self.save_vector_store()
+        return True
+    
+    def save_vector_store(self):
         """保存向量数据库到磁盘"""
         if self.vector_store is None:
             raise ValueError("向量数据库未初始化")
         
-        for i, (chunk, embedding) in enumerate(zip(chunks, self.embeddings)):
-            chromadb_collection.add(
-                documents=[chunk],
-                embeddings=[embedding],
-                ids=[str(i)]
-            )
-        print(f"💾 向量数据库已保存到: data/vector_store/chroma_db")
+        os.makedirs(VECTOR_STORE_PATH, exist_ok=True)
+        self.vector_store.save()
+        
+        if self.lexical_index is not None:
+            self.lexical_index.save(os.path.join(VECTOR_STORE_PATH, LEXICAL_INDEX_DIR))
+        if self.manifest is not None:
+            self.manifest.save()
+        print(f"💾 向量数据库已保存到: {VECTOR_STORE_PATH}")
+    
     def load_vector_store(self):
         """从磁盘加载向量数据库"""
-        if not os.path.exists(VECTOR_STORE_PATH):
-            raise FileNotFoundError(f"向量数据库不存在: {VECTOR_STORE_PATH}")
+        if not store_exists(VECTOR_BACKEND, VECTOR_STORE_PATH):
+            raise FileNotFoundError(f"向量数据库不存在: {VECTOR_STORE_PATH} (后端: {VECTOR_BACKEND})")
         
         print(f"📂 正在加载向量数据库: {VECTOR_STORE_PATH}")
-        self.initialize_embeddings()
+        self.initialize_embeddings(lazy=True)
         
-        self.vector_store = FAISS.load_local(
-            VECTOR_STORE_PATH,
-            self.embeddings,
-            # allow_dangerous_deserialization=True
-        )
+        with profiler.phase("加载向量索引"):
+            self.vector_store = open_store(VECTOR_BACKEND, VECTOR_STORE_PATH, **self.vector_store_options())
+        
+        # 加载词法索引(不存在或分词器不一致时从文本块重建)
+        if HYBRID_SEARCH:
+            with profiler.phase("加载BM25索引"):
+                lexical_path = os.path.join(VECTOR_STORE_PATH, LEXICAL_INDEX_DIR)
+                if BM25Index.exists(lexical_path):
+                    self.lexical_index = BM25Index.load(lexical_path)
+                if (self.lexical_index is None or self.lexical_index.partitions is None
+                        or self.lexical_index.tokenizer != resolve_tokenizer(LEXICAL_TOKENIZER)):
+                    self.build_lexical_index()
+                    self.lexical_index.save(lexical_path)
         
         print("✅ 向量数据库加载完成")
-        def load_vector_store_from_chromas(self):
-            """从磁盘加载向量数据库"""
-            if not os.path.exists(VECTOR_STORE_PATH):
-                raise FileNotFoundError(f"向量数据库不存在: {VECTOR_STORE_PATH}")
-            
-            print(f"📂 正在加载向量数据库: {VECTOR_STORE_PATH}")
-            self.initialize_embeddings()
-            
-            self.vector_store = FAISS.load_local(
-                VECTOR_STORE_PATH,
-                self.embeddings,
-                # allow_dangerous_deserialization=True
-            )
-            
-            print("✅ 向量数据库加载完成")
+    
+    def build_lexical_index(self):
+        """根据向量数据库中的文本块构建BM25词法索引(未启用混合检索时跳过)"""
+        if not HYBRID_SEARCH:
+            return
         
+        chunk_ids = []
+        texts = []
+        metadatas = []
+        for doc in self.vector_store.documents():
+            chunk_ids.append(doc.metadata["chunk_id"])
+            texts.append(doc.page_content)
+            metadatas.append(doc.metadata)
+        self.lexical_index = BM25Index.build(
+            chunk_ids, texts, tokenizer=resolve_tokenizer(LEXICAL_TOKENIZER), metadatas=metadatas
+        )
+        print(f"🔤 词法索引已构建 ({len(self.lexical_index.vocab)} 个词, 分词器: {self.lexical_index.tokenizer})")
+    
+    def update_lexical_index(self, removed_ids: List[str], chunks: List[Document]):
+        """增量同步后更新BM25词法索引: 只删除过期的行并对新增文本块分词"""
+        if not HYBRID_SEARCH:
+            return
+        if self.lexical_index is None or self.lexical_index.partitions is None:
+            self.build_lexical_index()
+            return
+        self.lexical_index = self.lexical_index.update(
+            removed_ids,
+            [chunk.metadata["chunk_id"] for chunk in chunks],
+            [chunk.page_content for chunk in chunks],
+            [chunk.metadata for chunk in chunks]
+        )
+        print(f"🔤 词法索引已更新 (删除 {len(removed_ids)} 个, 新增 {len(chunks)} 个文本块)")
+    
     def setup_retriever(self):
         """设置检索器"""
         if self.vector_store is None:
             raise ValueError("向量数据库未初始化")
         
-        self.retriever = self.vector_store.as_retriever(
-            search_kwargs={"k": TOP_K_RESULTS}
-        )
+        self.retriever = RAGDocumentRetriever(rag=self)
+        if RETRIEVAL_BATCH_ENABLED and self.query_batcher is None:
+            self.query_batcher = MicroBatcher(
+                self._dense_search_batch, max_batch_size=RETRIEVAL_BATCH_SIZE,
+                max_wait_ms=RETRIEVAL_BATCH_MAX_WAIT_MS, name="retrieval-batcher"
+            )
+        if RERANK_ENABLED and self.reranker is None:
+            # 模型在首次检索时才加载
+            self.reranker = CrossEncoderReranker()
         
-        print(f"🔍 检索器已配置 (top_k={TOP_K_RESULTS})")
+        mode = "混合检索(向量+BM25)" if self.lexical_index is not None else "向量检索"
+        print(f"🔍 检索器已配置 (top_k={TOP_K_RESULTS}, {mode}, 索引: {self.vector_store.describe()})")
+        if self.reranker is not None:
+            print(f"🎯 重排序已启用: {self.reranker.describe()}, "
+                  f"候选 {RERANK_CANDIDATES} 个, 相关度下限 {SCORE_THRESHOLD}")
     
     def initialize(self, force_rebuild: bool = False):
         """
@@ -191,34 +571,57 @@ class RAGRetriever:
         print("🚀 初始化RAG检索系统...")
         
         # 检查是否需要重建向量数据库
-        if force_rebuild or not os.path.exists(VECTOR_STORE_PATH):
+        rebuild = force_rebuild or not os.path.exists(VECTOR_STORE_PATH)
+        if not rebuild:
+            self.manifest = IndexManifest.load(self.manifest_path())
+            if self.manifest is None:
+                print("⚠️  未找到增量索引清单, 需要全量重建")
+                rebuild = True
+            elif not self.manifest.is_compatible(self.index_config()):
+                print("⚠️  嵌入模型、分块或向量索引配置已变化, 需要全量重建")
+                rebuild = True
+        
+        if rebuild:
             print("📚 开始构建新的向量数据库...")
             
-            # 加载和处理文档
-            documents = self.load_documents()
-            chunks = self.split_documents(documents)
-            
             # 初始化嵌入模型
             self.initialize_embeddings()
             
-            # 构建并保存向量数据库
-            self.build_vector_store(chunks)
-            self.save_vector_store()
+            # 流式加载、分割、嵌入并构建向量数据库
+            print(f"📄 正在加载知识库: {KNOWLEDGE_BASE_PATH}")
+            print(f"✂️  分块参数 ({describe_chunker()}), 批大小 {EMBED_BATCH_SIZE}")
+            with profiler.phase("构建向量数据库"):
+                self.build_vector_store(self.iter_chunks(self.list_files(KNOWLEDGE_BASE_PATH)))
+                self.save_vector_store()
         else:
-            # 加载现有向量数据库
+            # 加载现有向量数据库, 并增量同步变更的文档
             self.load_vector_store()
+            with profiler.phase("检查知识库变更"):
+                self.sync_vector_store()
         
         # 设置检索器
         self.setup_retriever()
         
         print("✅ RAG检索系统初始化完成!\n")
     
-    def retrieve(self, query: str) -> List[Document]:
+    def warmup(self):
+        """立即加载嵌入模型与重排序模型(加载已有向量数据库时默认推迟到首次查询)"""
+        if isinstance(self.embeddings, LazyEmbeddings):
+            self.embeddings.ensure_loaded()
+        if self.reranker is not None:
+            self.reranker.ensure_loaded()
+    
+    def retrieve(self, query: str, k: int = TOP_K_RESULTS, filters: Optional[Dict[str, Any]] = None) -> List[Document]:
         """
         检索相关文档
         
+        启用重排序时先检索RERANK_CANDIDATES个候选, 重排序后最多返回k个。
+        
         Args:
             query: 查询文本
+            k: 返回的文档数
+            filters: 元数据过滤条件(如 {"institution": "上海大学"}, 见app/metadata.py),
+                只在满足条件的文本块中检索; 为None且启用METADATA_AUTO_FILTER时按问题中的单位名称过滤
             
         Returns:
             相关文档列表
@@ -226,9 +629,217 @@ class RAGRetriever:
         if self.retriever is None:
             raise ValueError("检索器未初始化")
         
-        results = self.retriever.get_relevant_documents(query)
+        if filters is None and METADATA_AUTO_FILTER:
+            filters = self.infer_filters(query)
+        
+        with tracer.span("retrieve", k=k) as span:
+            if filters:
+                span.set(filters=filter_key(filters))
+            docs = self._retrieve_candidates(query, k, filters)
+            span.set(docs=len(docs))
+        return docs
+    
+    def retrieve_with_vector(
+        self, query: str, k: int = TOP_K_RESULTS, filters: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Document], Optional[np.ndarray]]:
+        """
+        检索相关文档, 同时返回向量检索时计算的查询向量(供语义回答缓存复用, 无需再次嵌入)
+        
+        Returns:
+            (相关文档列表, 查询向量); 未进行向量检索时查询向量为None
+        """
+        token = _query_vector.set(None)
+        try:
+            docs = self.retrieve(query, k, filters)
+            return docs, _query_vector.get()
+        finally:
+            _query_vector.reset(token)
+    
+    def retrieve_batch(
+        self, queries: List[str], k: int = TOP_K_RESULTS,
+        filters: Optional[List[Optional[Dict[str, Any]]]] = None
+    ) -> List[List[Document]]:
+        """
+        批量检索(离线批量问答)
+        
+        每EMBED_BATCH_SIZE个查询一次嵌入, 过滤条件相同的查询合并为一次批量向量检索,
+        之后逐个查询做BM25融合和重排序; 结果与逐个调用retrieve相同。
+        
+        Args:
+            queries: 查询文本列表
+            k: 每个查询返回的文档数
+            filters: 与queries一一对应的过滤条件, 为None的条目按retrieve的规则自动推断
+            
+        Returns:
+            与queries一一对应的文档列表
+        """
+        if self.retriever is None:
+            raise ValueError("检索器未初始化")
+        
+        filters = list(filters) if filters is not None else [None] * len(queries)
+        if len(filters) != len(queries):
+            raise ValueError("filters与queries的数量不一致")
+        if METADATA_AUTO_FILTER:
+            filters = [self.infer_filters(query) if f is None else f for query, f in zip(queries, filters)]
+        
+        dense_k = self._dense_candidates(k)
+        results = []
+        for start in range(0, len(queries), EMBED_BATCH_SIZE):
+            end = start + EMBED_BATCH_SIZE
+            requests = [(query, dense_k, f) for query, f in zip(queries[start:end], filters[start:end])]
+            with tracer.span("vector_search", batch_size=len(requests)):
+                batch_hits = self._dense_search_batch(requests)
+            for (query, _, query_filters), (dense_hits, _, _) in zip(requests, batch_hits):
+                results.append(self._retrieve_candidates(query, k, query_filters, dense_hits))
         return results
     
+    def _dense_candidates(self, k: int) -> int:
+        """返回k个文档时向量检索需要的候选数(重排序与混合检索都会放大候选数)"""
+        candidates = max(k, RERANK_CANDIDATES) if self.reranker is not None else k
+        return max(candidates, HYBRID_CANDIDATES) if self.lexical_index is not None else candidates
+    
+    def _retrieve_candidates(
+        self, query: str, k: int, filters: Optional[Dict[str, Any]],
+        dense_hits: Optional[List[SearchHit]] = None
+    ) -> List[Document]:
+        """混合检索或向量检索取候选, 启用重排序时重排序后最多保留k个"""
+        candidates = max(k, RERANK_CANDIDATES) if self.reranker is not None else k
+        if self.lexical_index is not None:
+            docs = self.hybrid_search(query, candidates, filters, dense_hits)
+        else:
+            docs = [doc for doc, _ in self.similarity_search_with_score(query, candidates, filters, dense_hits)]
+        if self.reranker is not None:
+            docs = [doc for doc, _ in self.rerank(query, docs, k)]
+        return docs
+    
+    def infer_filters(self, query: str) -> Optional[Dict[str, Any]]:
+        """问题中出现知识库里的单位名称时, 只检索这些单位的公告"""
+        institutions = [name for name in self.institutions() if name in query]
+        return {"institution": institutions} if institutions else None
+    
+    def institutions(self) -> List[str]:
+        """知识库中出现的招聘单位名称(来自元数据分区)"""
+        return self.vector_store.partitions().values("institution")
+    
+    def hybrid_search(
+        self, query: str, k: int, filters: Optional[Dict[str, Any]] = None,
+        dense_hits: Optional[List[SearchHit]] = None
+    ) -> List[Document]:
+        """
+        混合检索: 向量检索与BM25各取HYBRID_CANDIDATES个候选, 按倒数排名融合
+        
+        Args:
+            query: 查询文本
+            k: 返回的文档数
+            filters: 元数据过滤条件
+            dense_hits: 已批量完成的向量检索结果(见retrieve_batch), 为None时在此检索
+            
+        Returns:
+            按融合分数排序的文档列表
+        """
+        candidates = max(k, HYBRID_CANDIDATES)
+        
+        # 候选阶段只取ID, 融合后只解码最终返回的k个文本块
+        if dense_hits is None:
+            dense_hits = self.dense_search(query, candidates, filters)
+        dense_hits = dense_hits[:candidates]
+        dense_ids = [hit.chunk_id for hit in dense_hits]
+        with tracer.span("lexical_search"):
+            lexical_ids = [chunk_id for chunk_id, _ in self.lexical_index.search(query, candidates, filters)]
+        
+        with tracer.span("load_chunks"):
+            fused = reciprocal_rank_fusion([dense_ids, lexical_ids], k=RRF_K)[:k]
+            # 向量检索命中的文本块按行号读取, 只有词法检索命中的按ID查找
+            dense_by_id = {hit.chunk_id: hit for hit in dense_hits}
+            return self.vector_store.get_hits([
+                dense_by_id.get(chunk_id) or SearchHit(chunk_id, float("inf")) for chunk_id, _ in fused
+            ])
+    
+    def rerank(self, query: str, docs: List[Document], k: int) -> List[Tuple[Document, float]]:
+        """
+        交叉编码器重排序, 丢弃相关度低于SCORE_THRESHOLD的文本块
+        
+        Args:
+            query: 查询文本
+            docs: 候选文档
+            k: 最多保留的文档数
+        
+        Returns:
+            (文档, 相关度)元组列表, 相关度越高越相关
+        """
+        with tracer.span("rerank", candidates=len(docs)) as span:
+            ranked = self.reranker.rerank(query, docs, k, threshold=SCORE_THRESHOLD, min_keep=RERANK_MIN_KEEP)
+            span.set(kept=len(ranked), top_score=round(ranked[0][1], 4) if ranked else None)
+        return ranked
+    
+    def dense_search(self, query: str, k: int, filters: Optional[Dict[str, Any]] = None) -> List[SearchHit]:
+        """
+        嵌入查询并检索向量索引
+        
+        启用微批处理时与其他线程同时到达的查询合并为一次嵌入和一次批量检索。
+        过滤条件在索引内生效(只计算满足条件的向量), 不是对top-k结果二次过滤。
+        
+        Returns:
+            最近的k个检索结果(文本块ID, L2距离平方, 行号)
+        """
+        if self.query_batcher is None:
+            vector = self._embed_query(query)
+            _query_vector.set(vector)
+            with tracer.span("vector_search"):
+                return self.vector_store.search(vector, k, filters)
+        
+        with tracer.span("vector_search") as span:
+            hits, vector, batch_size = self.query_batcher.submit((query, k, filters))
+            span.set(batch_size=batch_size)
+        _query_vector.set(vector)
+        return hits
+    
+    def _dense_search_batch(
+        self, requests: List[Tuple[str, int, Optional[Dict[str, Any]]]]
+    ) -> List[Tuple[List[SearchHit], np.ndarray, int]]:
+        """微批处理: 一次嵌入全部查询, 过滤条件相同的查询按最大k批量检索后截断"""
+        # 查询向量不写入磁盘嵌入缓存(见app/embedding_cache.py)
+        embed = getattr(self.embeddings, "embed_queries", self.embeddings.embed_documents)
+        vectors = np.asarray(embed([query for query, _, _ in requests]), dtype=np.float32)
+        groups = {}
+        for i, (_, _, filters) in enumerate(requests):
+            groups.setdefault(filter_key(filters), []).append(i)
+        
+        results = [None] * len(requests)
+        for positions in groups.values():
+            filters = requests[positions[0]][2]
+            hits = self.vector_store.search_batch(vectors[positions], max(requests[i][1] for i in positions), filters)
+            for i, group_hits in zip(positions, hits):
+                results[i] = group_hits[:requests[i][1]]
+        tracer.count("chatbot_retrieval_batches_total")
+        tracer.count("chatbot_retrieval_batched_queries_total", len(requests))
+        return [(hits, vector, len(requests)) for hits, vector in zip(results, vectors)]
+    
+    def _embed_query(self, query: str) -> np.ndarray:
+        with tracer.span("embed_query"):
+            return np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+    
+    def similarity_search_with_score(
+        self, query: str, k: int, filters: Optional[Dict[str, Any]] = None,
+        dense_hits: Optional[List[SearchHit]] = None
+    ) -> List[Tuple[Document, float]]:
+        """
+        向量检索
+        
+        Args:
+            query: 查询文本
+            k: 返回的文档数
+            filters: 元数据过滤条件
+            dense_hits: 已批量完成的向量检索结果(见retrieve_batch), 为None时在此检索
+            
+        Returns:
+            (文档, L2距离平方)元组列表, 距离越小越相似
+        """
+        hits = self.dense_search(query, k, filters) if dense_hits is None else dense_hits[:k]
+        with tracer.span("load_chunks"):
+            documents = {doc.metadata["chunk_id"]: doc for doc in self.vector_store.get_hits(hits)}
+        return [(documents[hit.chunk_id], hit.distance) for hit in hits if hit.chunk_id in documents]
+    
     def retrieve_with_scores(self, query: str) -> List[Tuple[Document, float]]:
         """
         检索相关文档及其相似度分数
@@ -242,9 +853,4 @@ class RAGRetriever:
         if self.vector_store is None:
             raise ValueError("向量数据库未初始化")
         
-        results = self.vector_store.similarity_search_with_score(
-            query,
-            k=TOP_K_RESULTS
-        )
-        
-        return results
+        return self.similarity_search_with_score(query, TOP_K_RESULTS)
@@ -0,0 +1,171 @@
+"""
+交叉编码器重排序模块
+Cross-Encoder Re-ranking Module
+
+向量/混合检索先低成本地召回RERANK_CANDIDATES个候选, 交叉编码器再对每个(问题, 文本块)
+逐对打分, 只把最相关的几个文本块放进提示词; 相关度(0~1)低于SCORE_THRESHOLD的文本块被丢弃。
+
+推理后端:
+    onnx   onnxruntime + tokenizers(见app/onnx_models.py), 读取模型仓库中导出的ONNX文件, 不需要torch;
+           可选用仓库自带的量化文件, 或设置RERANK_QUANTIZE在本地做int8动态量化
+    torch  sentence-transformers CrossEncoder
+    auto   安装了onnxruntime且模型提供ONNX文件时使用onnx, 否则使用torch
+"""
+
+import os
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+from app.config import (
+    RERANK_MODEL,
+    RERANK_BACKEND,
+    RERANK_ONNX_FILE,
+    RERANK_QUANTIZE,
+    RERANK_BATCH_SIZE,
+    RERANK_MAX_LENGTH,
+)
+from app.onnx_models import create_session, load_tokenizer, model_file, model_inputs, quantized_model
+from app.profiling import profiler
+
+RERANK_BACKENDS = ("auto", "onnx", "torch")
+
+
+def _sigmoid(logits: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-logits))
+
+
+class OnnxCrossEncoder:
+    """onnxruntime推理的交叉编码器(输出相关度logit)"""
+
+    def __init__(self, model_name: str, onnx_file: str, max_length: int, quantize: bool = False):
+        model_path = model_file(model_name, onnx_file)
+        if quantize:
+            model_path = quantized_model(model_path, model_name)
+
+        self.tokenizer = load_tokenizer(model_name, max_length)
+        self.session = create_session(model_path)
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        self.model_path = model_path
+
+    def predict(self, pairs: Sequence[Tuple[str, str]]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(list(pairs))
+        logits = self.session.run(None, model_inputs(encodings, self.input_names))[0]
+        return _sigmoid(logits.reshape(len(pairs), -1)[:, 0])
+
+
+class TorchCrossEncoder:
+    """sentence-transformers的CrossEncoder(单输出模型默认经过sigmoid)"""
+
+    def __init__(self, model_name: str, max_length: int, batch_size: int):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        self.batch_size = batch_size
+
+    def predict(self, pairs: Sequence[Tuple[str, str]]) -> np.ndarray:
+        return np.asarray(
+            self.model.predict(list(pairs), batch_size=self.batch_size, show_progress_bar=False),
+            dtype=np.float32
+        )
+
+
+class CrossEncoderReranker:
+    """
+    交叉编码器重排序器
+
+    模型在首次打分时才加载(不影响启动耗时), 之后在多个线程间共享。
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, backend: str = RERANK_BACKEND,
+                 batch_size: int = RERANK_BATCH_SIZE, max_length: int = RERANK_MAX_LENGTH,
+                 onnx_file: str = RERANK_ONNX_FILE, quantize: bool = RERANK_QUANTIZE):
+        if backend not in RERANK_BACKENDS:
+            raise ValueError(f"不支持的重排序后端: {backend} (可选: {', '.join(RERANK_BACKENDS)})")
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.onnx_file = onnx_file
+        self.quantize = quantize
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    with profiler.phase("加载重排序模型"):
+                        self._model = self._load()
+        return self._model
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def ensure_loaded(self):
+        """立即加载模型(默认推迟到首次重排序)"""
+        return self.model
+
+    def _load(self):
+        print(f"🔧 正在加载重排序模型: {self.model_name}")
+        if self.backend in ("auto", "onnx"):
+            try:
+                model = OnnxCrossEncoder(self.model_name, self.onnx_file, self.max_length, self.quantize)
+                print(f"✅ 重排序模型加载完成 (onnx: {os.path.basename(model.model_path)})")
+                return model
+            except Exception as e:
+                if self.backend == "onnx":
+                    raise
+                print(f"⚠️  ONNX模型不可用({str(e)[:100]}), 改用sentence-transformers")
+
+        model = TorchCrossEncoder(self.model_name, self.max_length, self.batch_size)
+        print("✅ 重排序模型加载完成 (torch)")
+        return model
+
+    def describe(self) -> str:
+        return f"{self.model_name} ({self.backend})"
+
+    def score(self, query: str, texts: Sequence[str]) -> np.ndarray:
+        """
+        计算问题与各文本的相关度
+
+        按文本长度排序后分批推理, 同一批内的填充长度接近, 减少无效计算。
+
+        Returns:
+            与texts一一对应的相关度(0~1)
+        """
+        scores = np.zeros(len(texts), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            scores[batch] = self.model.predict([(query, texts[i]) for i in batch])
+        return scores
+
+    def rerank(self, query: str, documents: Sequence[Document], top_k: int,
+               threshold: Optional[float] = None, min_keep: int = 0) -> List[Tuple[Document, float]]:
+        """
+        重排序
+
+        Args:
+            query: 查询文本
+            documents: 候选文档
+            top_k: 最多保留的文档数
+            threshold: 相关度下限(为None时不过滤)
+            min_keep: 全部低于下限时仍保留的文档数
+
+        Returns:
+            按相关度从高到低排序的(文档, 相关度)列表
+        """
+        if not documents:
+            return []
+
+        scores = self.score(query, [doc.page_content for doc in documents])
+        ranked = [(documents[i], float(scores[i])) for i in np.argsort(-scores, kind="stable")[:top_k]]
+        if threshold is None:
+            return ranked
+        kept = [(doc, score) for doc, score in ranked if score >= threshold]
+        return kept if len(kept) >= min_keep else ranked[:min_keep]
@@ -0,0 +1,343 @@
+"""
+异步HTTP服务模块
+Async HTTP/SSE Server Module
+
+基于asyncio的轻量HTTP服务: 所有请求共享同一个RAGRetriever和LLM客户端,
+每个会话(session_id)持有独立的对话记忆, 并通过信号量限制同时发往LLM的请求数。
+
+接口:
+    GET  /health        健康检查
+    GET  /stats         会话数、回答缓存统计与LLM路由中各服务的状态
+    GET  /metrics       Prometheus格式的各阶段耗时、token数与缓存命中指标
+    POST /chat          {"message": "...", "session_id": "...", "show_sources": false} -> JSON回答
+    POST /chat/stream   同上, 以SSE(text/event-stream)逐个推送token, 出错时推送error事件
+    POST /reset         {"session_id": "..."} 清空会话历史
+
+多进程模式(SERVER_WORKERS>1)见app/workers.py: 每个工作进程运行一个ChatServer, 由前端路由进程按会话转发请求。
+"""
+
+import os
+import re
+import json
+import time
+import socket
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.chatbot import GovernmentChatbot
+from app.tracing import tracer
+
+# 请求体大小上限
+MAX_BODY_SIZE = 1 << 20
+# 客户端提供的session_id格式(会写入响应头X-Session-Id)
+SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+_STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+    503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    """请求处理错误, 携带HTTP状态码"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict, bytes]]:
+    """读取并解析一个HTTP请求, 连接关闭时返回None"""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+
+    try:
+        method, target, _ = request_line.decode('latin-1').split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "无效的请求行")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode('latin-1').partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", "0") or 0)
+    except ValueError:
+        raise HTTPError(400, "无效的Content-Length")
+    if length < 0:
+        raise HTTPError(400, "无效的Content-Length")
+    if length > MAX_BODY_SIZE:
+        raise HTTPError(413, "请求体过大")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target.split("?", 1)[0], headers, body
+
+
+def parse_json(body: bytes) -> Dict:
+    """解析JSON对象请求体"""
+    try:
+        payload = json.loads(body.decode('utf-8') or "{}")
+    except (UnicodeDecodeError, ValueError):
+        raise HTTPError(400, "请求体不是有效的JSON")
+    if not isinstance(payload, dict):
+        raise HTTPError(400, "请求体必须是JSON对象")
+    return payload
+
+
+def session_id_from(payload: Dict) -> Optional[str]:
+    """请求体中的session_id(未提供时为None), 格式无效时返回400"""
+    session_id = payload.get("session_id")
+    if session_id is None or session_id == "":
+        return None
+    if isinstance(session_id, int) and not isinstance(session_id, bool):
+        session_id = str(session_id)
+    if not isinstance(session_id, str) or not SESSION_ID_PATTERN.fullmatch(session_id):
+        raise HTTPError(400, "session_id只能包含字母、数字、下划线和连字符(1~64个字符)")
+    return session_id
+
+
+async def send_json(writer: asyncio.StreamWriter, status: int, payload: Dict, keep_alive: bool):
+    """发送JSON响应"""
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    writer.write(
+        f"HTTP/1.1 {status} {_STATUS_TEXT.get(status, '')}\r\n"
+        f"Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1')
+        + body
+    )
+    await writer.drain()
+
+
+class Session:
+    """单个会话的状态"""
+
+    def __init__(self, memory):
+        self.memory = memory
+        # 同一会话的请求按顺序处理, 保证对话记忆一致
+        self.lock = asyncio.Lock()
+        self.last_seen = time.monotonic()
+
+
+class SessionStore:
+    """会话存储: 按最近使用顺序淘汰, 空闲超时自动过期"""
+
+    def __init__(self, chatbot: GovernmentChatbot, max_sessions: int, ttl_seconds: float):
+        self.chatbot = chatbot
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> Session:
+        """获取会话, 不存在时创建"""
+        self._expire()
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = Session(self.chatbot.new_memory())
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        session.last_seen = time.monotonic()
+        return session
+
+    def reset(self, session_id: str) -> bool:
+        """清空会话历史"""
+        session = self._sessions.pop(session_id, None)
+        return session is not None
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_seen <= self.ttl_seconds:
+                break
+            self._sessions.pop(session_id)
+
+
+class AsyncHTTPServer:
+    """基于asyncio streams的HTTP/1.1连接处理, 子类实现_dispatch"""
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个连接上的请求(支持HTTP/1.1 keep-alive)"""
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as e:
+                    await send_json(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    keep_alive = await self._dispatch(writer, method, path, body, keep_alive)
+                except HTTPError as e:
+                    await send_json(writer, e.status, {"error": str(e)}, keep_alive)
+                except Exception as e:
+                    await send_json(writer, 500, {"error": f"处理请求时出错: {e}"}, keep_alive)
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, writer, method: str, path: str, body: bytes, keep_alive: bool) -> bool:
+        """路由请求, 返回连接是否保持"""
+        raise NotImplementedError
+
+
+class ChatServer(AsyncHTTPServer):
+    """政务客服HTTP/SSE服务"""
+
+    def __init__(
+        self,
+        chatbot: GovernmentChatbot,
+        host: str,
+        port: int,
+        max_concurrency: int,
+        max_sessions: int,
+        session_ttl: float,
+        worker_id: Optional[int] = None
+    ):
+        """
+        初始化服务
+
+        Args:
+            chatbot: 共享的聊天机器人实例(持有RAG检索器和LLM客户端)
+            host: 监听地址
+            port: 监听端口
+            max_concurrency: 同时进行中的LLM请求上限
+            max_sessions: 保留的会话数上限
+            session_ttl: 会话空闲过期时间(秒)
+            worker_id: 多进程模式(app/workers.py)下的工作进程编号, 单进程时为None
+        """
+        self.chatbot = chatbot
+        self.host = host
+        self.port = port
+        self.max_concurrency = max_concurrency
+        self.worker_id = worker_id
+        self.sessions = SessionStore(chatbot, max_sessions, session_ttl)
+        self._llm_slots: Optional[asyncio.Semaphore] = None
+
+    async def serve_forever(self, sock: Optional[socket.socket] = None):
+        """
+        启动服务并持续运行
+
+        Args:
+            sock: 已绑定的监听套接字(多进程模式下由主进程创建), 为None时监听host:port
+        """
+        self._llm_slots = asyncio.Semaphore(self.max_concurrency)
+        if sock is not None:
+            server = await asyncio.start_server(self._handle_connection, sock=sock)
+            print(f"👷 工作进程 {self.worker_id} 已启动 (pid {os.getpid()}, LLM并发上限 {self.max_concurrency})")
+        else:
+            server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+            print(f"🌐 服务已启动: http://{self.host}:{self.port} (LLM并发上限 {self.max_concurrency})")
+        async with server:
+            await server.serve_forever()
+
+    async def _dispatch(self, writer, method: str, path: str, body: bytes, keep_alive: bool) -> bool:
+        """路由请求, 返回连接是否保持"""
+        if path == "/health":
+            await send_json(writer, 200, {"status": "ok"}, keep_alive)
+            return keep_alive
+
+        if path == "/stats":
+            stats = {
+                "sessions": len(self.sessions),
+                "answer_cache": self.chatbot.get_cache_stats(),
+                "condense": self.chatbot.get_condense_stats(),
+                "llm": self.chatbot.get_llm_status(),
+            }
+            if self.worker_id is not None:
+                stats.update(worker=self.worker_id, pid=os.getpid())
+            await send_json(writer, 200, stats, keep_alive)
+            return keep_alive
+
+        if path == "/metrics":
+            body = tracer.render_metrics().encode('utf-8')
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                + f"Content-Length: {len(body)}\r\n"
+                  f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1')
+                + body
+            )
+            await writer.drain()
+            return keep_alive
+
+        if path not in ("/chat", "/chat/stream", "/reset"):
+            raise HTTPError(404, f"未知路径: {path}")
+        if method != "POST":
+            raise HTTPError(405, "只支持POST请求")
+
+        payload = parse_json(body)
+        session_id = session_id_from(payload) or uuid.uuid4().hex
+
+        if path == "/reset":
+            self.sessions.reset(session_id)
+            await send_json(writer, 200, {"session_id": session_id, "reset": True}, keep_alive)
+            return keep_alive
+
+        message = str(payload.get("message", ""))
+        show_sources = bool(payload.get("show_sources", False))
+        session = self.sessions.get(session_id)
+
+        if path == "/chat":
+            response = {}
+            async with session.lock, self._llm_slots:
+                async for event in self.chatbot.astream_chat(message, show_sources, memory=session.memory):
+                    if event["type"] == "end":
+                        response = event
+            response.pop("type", None)
+            await send_json(writer, 200, {"session_id": session_id, **response}, keep_alive)
+            return keep_alive
+
+        # SSE流式输出, 结束后关闭连接
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream; charset=utf-8\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: close\r\n"
+            + f"X-Session-Id: {session_id}\r\n\r\n".encode('latin-1')
+        )
+        await writer.drain()
+        try:
+            async with session.lock, self._llm_slots:
+                async for event in self.chatbot.astream_chat(message, show_sources, memory=session.memory):
+                    if event["type"] == "end":
+                        event = {**event, "session_id": session_id}
+                    self._write_event(writer, event)
+                    await writer.drain()
+        except ConnectionError:
+            raise
+        except Exception as e:
+            # 响应头已发送, 错误只能作为事件写入事件流
+            self._write_event(writer, {"type": "error", "error": f"处理请求时出错: {e}", "session_id": session_id})
+            await writer.drain()
+        return False
+
+    @staticmethod
+    def _write_event(writer: asyncio.StreamWriter, event: Dict):
+        data = json.dumps(event, ensure_ascii=False)
+        writer.write(f"event: {event['type']}\ndata: {data}\n\n".encode('utf-8'))
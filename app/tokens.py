@@ -0,0 +1,85 @@
+"""
+Token计数模块
+Token Counting Module
+
+优先使用tiktoken(langchain-openai的依赖)计数; 编码文件不可用(如离线环境)时
+退化为本地估算: 每个中日韩字符计1个token, 其余字符每4个计1个token。
+"""
+
+import re
+import threading
+from typing import Optional
+
+from app.config import TOKENIZER_ENCODING
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+_encoding = None
+_encoding_loaded = False
+_lock = threading.Lock()
+
+
+def _get_encoding() -> Optional[object]:
+    """惰性加载tiktoken编码, 失败时返回None并不再重试"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+                except Exception:
+                    _encoding = None
+                _encoding_loaded = True
+    return _encoding
+
+
+def _estimate(text: str) -> int:
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_tokens(text: str) -> int:
+    """计算文本的token数"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return _estimate(text)
+
+
+def truncate_tokens(text: str, max_tokens: int, keep: str = "start") -> str:
+    """
+    将文本截断到不超过max_tokens个token
+
+    Args:
+        text: 原文本
+        max_tokens: token上限
+        keep: "start"保留开头, "end"保留结尾(最新内容在末尾时使用)
+    """
+    if keep not in ("start", "end"):
+        raise ValueError(f"不支持的截断方式: {keep}")
+    if max_tokens <= 0:
+        return ""
+    from_end = keep == "end"
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        kept = tokens[-max_tokens:] if from_end else tokens[:max_tokens]
+        return encoding.decode(kept)
+
+    if _estimate(text) <= max_tokens:
+        return text
+    # 二分查找满足预算的最长前缀(或后缀)
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        part = text[len(text) - mid:] if from_end else text[:mid]
+        if _estimate(part) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[len(text) - low:] if from_end else text[:low]
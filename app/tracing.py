@@ -0,0 +1,338 @@
+"""
+对话链路追踪模块
+Per-Turn Tracing and Metrics Module
+
+每轮对话记录一条链路(trace), 各阶段为其中的span:
+
+    chat
+      condense           问题改写(path: no_history / standalone / condensed)
+      retrieve           RAGRetriever.retrieve
+        embed_query      查询嵌入(embedding_cache: hit / miss)
+        vector_search    向量检索(启用检索微批处理时包含查询嵌入, batch_size为合并的查询数)
+        lexical_search   BM25检索
+        load_chunks      融合排序并读取文本块
+        rerank           交叉编码器重排序(candidates, kept, top_score)
+      answer_cache       语义回答缓存查询(hit)
+      build_prompt       拼接提示词(prompt_tokens)
+      llm                生成回答(ttft_ms首token耗时, completion_tokens)
+
+span耗时同时汇总为Prometheus直方图, 可通过HTTP服务的 GET /metrics 读取,
+或写入METRICS_FILE(供node_exporter textfile collector采集);
+设置TRACE_LOG_FILE时每轮链路以一行JSON追加写入。
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.config import TRACING_ENABLED, TRACE_LOG_FILE, METRICS_FILE
+
+# 耗时直方图的桶上界(秒)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# METRICS_FILE的最短写入间隔(秒)
+METRICS_FILE_INTERVAL = 1.0
+
+_METRIC_HELP = {
+    "chatbot_stage_seconds": ("histogram", "各阶段耗时(秒)"),
+    "chatbot_turn_seconds": ("histogram", "每轮对话总耗时(秒)"),
+    "chatbot_llm_first_token_seconds": ("histogram", "LLM首token耗时(秒)"),
+    "chatbot_tokens_total": ("counter", "提示词与回答的token数"),
+    "chatbot_context_tokens_total": ("counter", "提示词上下文的token数(retrieved为检索结果, packed为打包后)"),
+    "chatbot_cache_total": ("counter", "缓存命中/未命中次数"),
+    "chatbot_retrieval_batches_total": ("counter", "检索微批处理的批次数"),
+    "chatbot_retrieval_batched_queries_total": ("counter", "经检索微批处理的查询数"),
+    "chatbot_batch_retries_total": ("counter", "批量问答重试LLM调用的次数"),
+    "chatbot_llm_requests_total": ("counter", "LLM路由向各服务发出的请求数(按结果)"),
+    "chatbot_llm_hedges_total": ("counter", "LLM路由发出的对冲请求数"),
+    "chatbot_llm_backend_first_token_seconds": ("histogram", "各LLM服务的首token耗时(秒)"),
+    "chatbot_ollama_prompt_tokens_total": ("counter", "Ollama提示词token数(evaluated为实际计算, cached为命中KV缓存)"),
+    "chatbot_ollama_prompt_eval_seconds_total": ("counter", "Ollama提示词计算耗时(evaluated为实际耗时, saved为缓存节省的估算值)"),
+}
+
+
+class Span:
+    """链路中的一个阶段"""
+
+    __slots__ = ("name", "parent", "start", "duration", "attributes")
+
+    def __init__(self, name: str, parent: Optional[str], start: float):
+        self.name = name
+        self.parent = parent
+        self.start = start
+        self.duration = 0.0
+        self.attributes: Dict = {}
+
+    def set(self, **attributes):
+        """记录属性(token数、缓存命中等)"""
+        self.attributes.update(attributes)
+
+    def elapsed(self) -> float:
+        """span开始至今的秒数"""
+        return time.perf_counter() - self.start
+
+
+class _NullSpan:
+    """追踪未启用时使用的空span/链路"""
+
+    def set(self, **attributes):
+        pass
+
+    def elapsed(self) -> float:
+        return 0.0
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    """一轮对话的链路"""
+
+    def __init__(self, name: str, attributes: Dict):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.timestamp = time.time()
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.attributes = dict(attributes)
+        self.spans: List[Span] = []
+        self._stack: List[Span] = []
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "timestamp": self.timestamp,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "spans": [
+                {
+                    "name": span.name,
+                    "parent": span.parent,
+                    "offset_ms": round((span.start - self.start) * 1000, 3),
+                    "duration_ms": round(span.duration * 1000, 3),
+                    **({"attributes": span.attributes} if span.attributes else {}),
+                }
+                for span in self.spans
+            ],
+        }
+
+
+class MetricsRegistry:
+    """Prometheus文本格式的计数器与直方图(线程安全)"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._histograms: Dict[Tuple[str, Tuple], List] = {}
+        # 附加到每个序列的标签(如多进程模式下的worker)
+        self.constant_labels: Tuple = ()
+        self._lock = threading.Lock()
+
+    def set_constant_labels(self, **labels):
+        self.constant_labels = tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            # [各桶计数..., 总和, 总数]
+            histogram = self._histograms.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    @staticmethod
+    def _labels(labels: Tuple, extra: str = "") -> str:
+        parts = [f'{name}="{value}"' for name, value in labels]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> str:
+        """导出为Prometheus文本格式"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(value)) for key, value in self._histograms.items())
+
+        lines = []
+        described = set()
+
+        def describe(name: str):
+            if name not in described and name in _METRIC_HELP:
+                kind, text = _METRIC_HELP[name]
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+                described.add(name)
+
+        for (name, labels), value in counters:
+            describe(name)
+            labels = self.constant_labels + labels
+            lines.append(f"{name}{self._labels(labels)} {value:g}")
+        for (name, labels), histogram in histograms:
+            describe(name)
+            labels = self.constant_labels + labels
+            for bound, count in zip(self.buckets, histogram):
+                le = f'le="{bound:g}"'
+                lines.append(f"{name}_bucket{self._labels(labels, le)} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{name}_bucket{self._labels(labels, le)} {histogram[-1]}")
+            lines.append(f"{name}_sum{self._labels(labels)} {histogram[-2]:.6f}")
+            lines.append(f"{name}_count{self._labels(labels)} {histogram[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+class Tracer:
+    """链路追踪器: 当前链路保存在contextvar中, 检索等内部阶段无需传递trace对象"""
+
+    def __init__(self, enabled: bool = True, log_path: str = "", metrics_path: str = ""):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.metrics_path = metrics_path
+        self.metrics = MetricsRegistry()
+        self.last_trace: Optional[Trace] = None
+        self._current: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+        self._file_lock = threading.Lock()
+        self._metrics_written = 0.0
+
+    def current(self) -> Optional[Trace]:
+        return self._current.get()
+
+    @contextmanager
+    def trace(self, name: str, **attributes) -> Iterator[Trace]:
+        """开始一轮对话的链路(结束时汇总指标并写入日志)"""
+        if not self.enabled:
+            yield _NULL_SPAN
+            return
+
+        trace = Trace(name, attributes)
+        self._current.set(trace)
+        try:
+            yield trace
+        finally:
+            trace.duration = time.perf_counter() - trace.start
+            # 不使用token.reset: 异步生成器可能在其他上下文中结束
+            self._current.set(None)
+            self._finish(trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """
+        记录一个阶段
+
+        有当前链路时加入链路; 没有时(如基准测试直接调用retrieve)只汇总到指标。
+        """
+        if not self.enabled:
+            yield _NULL_SPAN
+            return
+
+        trace = self._current.get()
+        parent = trace._stack[-1].name if trace is not None and trace._stack else None
+        span = Span(name, parent, time.perf_counter())
+        span.attributes.update(attributes)
+        if trace is not None:
+            trace.spans.append(span)
+            trace._stack.append(span)
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - span.start
+            if trace is not None and trace._stack and trace._stack[-1] is span:
+                trace._stack.pop()
+            self.metrics.observe("chatbot_stage_seconds", span.duration, stage=name)
+
+    def annotate(self, **attributes):
+        """为当前最内层的span记录属性(不在链路中时忽略)"""
+        trace = self._current.get() if self.enabled else None
+        if trace is not None and trace._stack:
+            trace._stack[-1].set(**attributes)
+
+    def count(self, name: str, value: float = 1, **labels):
+        if self.enabled:
+            self.metrics.inc(name, value, **labels)
+
+    def observe(self, name: str, value: float, **labels):
+        if self.enabled:
+            self.metrics.observe(name, value, **labels)
+
+    def render_metrics(self) -> str:
+        return self.metrics.render()
+
+    def _finish(self, trace: Trace):
+        self.last_trace = trace
+        self.metrics.observe(
+            "chatbot_turn_seconds", trace.duration, cached=str(bool(trace.attributes.get("cached"))).lower()
+        )
+
+        if self.log_path:
+            line = json.dumps(trace.to_dict(), ensure_ascii=False) + "\n"
+            with self._file_lock:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+
+        if self.metrics_path and time.monotonic() - self._metrics_written >= METRICS_FILE_INTERVAL:
+            self.write_metrics_file()
+
+    def write_metrics_file(self):
+        """原子写入METRICS_FILE"""
+        if not self.metrics_path:
+            return
+        with self._file_lock:
+            self._metrics_written = time.monotonic()
+            tmp_path = f"{self.metrics_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.render_metrics())
+            os.replace(tmp_path, self.metrics_path)
+
+
+def format_trace(trace: Trace) -> List[str]:
+    """链路的可读摘要(每个span一行, 按层级缩进)"""
+    depth = {}
+    lines = []
+    for span in trace.spans:
+        depth[span.name] = depth.get(span.parent, -1) + 1 if span.parent else 0
+        details = ", ".join(f"{key}={value}" for key, value in span.attributes.items())
+        lines.append(f"{'  ' * depth[span.name]}{span.name}: {span.duration * 1000:.1f} ms" + (f" ({details})" if details else ""))
+    lines.append(f"总计: {trace.duration * 1000:.1f} ms")
+    return lines
+
+
+def merge_metrics(texts: List[str]) -> str:
+    """合并多个进程导出的Prometheus文本(各进程的序列带不同的常量标签), 同一指标的序列放在一起"""
+    families: Dict[str, List[str]] = {}
+    for text in texts:
+        for line in text.splitlines():
+            if not line:
+                continue
+            if line.startswith("#"):
+                # "# HELP name ..." / "# TYPE name ..."
+                family = line.split(" ", 3)[2]
+                lines = families.setdefault(family, [])
+                if line not in lines:
+                    lines.append(line)
+                continue
+            family = line.split("{", 1)[0].split(" ", 1)[0]
+            for suffix in ("_bucket", "_sum", "_count"):
+                if family.endswith(suffix) and family[:-len(suffix)] in _METRIC_HELP:
+                    family = family[:-len(suffix)]
+                    break
+            families.setdefault(family, []).append(line)
+    return "\n".join(line for lines in families.values() for line in lines) + "\n"
+
+
+# 全局追踪器
+tracer = Tracer(TRACING_ENABLED, TRACE_LOG_FILE, METRICS_FILE)
@@ -0,0 +1,628 @@
+"""
+向量数据库后端模块
+Pluggable Vector Store Backends Module
+
+RAGRetriever通过统一接口使用以下后端(由VECTOR_BACKEND选择):
+
+    faiss   FAISS索引(Flat/IVF/HNSW, 见app/ann.py), 内存映射格式保存
+    numpy   进程内numpy暴力检索, 无额外依赖, 适合小规模知识库
+    chroma  ChromaDB持久化集合, 按文本块ID批量upsert
+
+所有后端以文本块ID(metadata['chunk_id'])为主键, search返回SearchHit(ID, L2距离平方(越小越相似),
+行号), 不解码文本块; 命中的文本块通过get_hits按行号读取, 其他ID通过get_many读取。
+
+search/search_batch可以带元数据过滤条件(见app/metadata.py): faiss/numpy按预先计算的分区
+取得行号后只在这些向量中检索, chroma转换为where条件, 都不是对top-k结果二次过滤。
+"""
+
+import os
+import json
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+from app.config import FILTER_EXACT_MAX_ROWS
+from app.metadata import LazyPartitions, PartitionIndex
+from app.mmap_store import (
+    CHUNKS_DIR,
+    FAISS_INDEX_FILE,
+    LEGACY_DOCSTORE_FILE,
+    NORMS_FILE,
+    VECTORS_FILE,
+    ChunkStore,
+    ChunkTable,
+    MmapFlatIndex,
+)
+
+BACKENDS = ("faiss", "numpy", "chroma")
+
+
+class SearchHit(NamedTuple):
+    """向量检索结果; row为本地后端中的行号(chroma为None), 读取文本块时不再按ID查找"""
+
+    chunk_id: str
+    distance: float
+    row: Optional[int] = None
+
+
+class VectorStore:
+    """向量数据库后端基类"""
+
+    name = ""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    @property
+    def supports_delete(self) -> bool:
+        """是否支持按ID删除向量(不支持时由调用方重建)"""
+        return True
+
+    def add(self, ids: Sequence[str], documents: Sequence[Document], vectors: np.ndarray):
+        """写入文本块及其向量(ID已存在时覆盖)"""
+        raise NotImplementedError
+
+    def flush(self):
+        """写入缓冲中的向量(需要训练的索引会先缓存训练样本)"""
+
+    def delete(self, ids: Sequence[str]):
+        raise NotImplementedError
+
+    def search(self, vector: np.ndarray, k: int, filters: Optional[Dict[str, Any]] = None) -> List[SearchHit]:
+        """返回最近的k个检索结果, filters为元数据过滤条件"""
+        return self.search_batch(np.asarray(vector, dtype=np.float32).reshape(1, -1), k, filters)[0]
+
+    def search_batch(
+        self, vectors: np.ndarray, k: int, filters: Optional[Dict[str, Any]] = None
+    ) -> List[List[SearchHit]]:
+        """一次检索多个查询向量(每行一个, 过滤条件相同), 返回每个查询最近的k个检索结果"""
+        raise NotImplementedError
+
+    def partitions(self) -> PartitionIndex:
+        """元数据分区(首次调用时建立)"""
+        raise NotImplementedError
+
+    def get_many(self, ids: Sequence[str]) -> List[Document]:
+        """按ID读取文本块(顺序与ids一致, 跳过不存在的ID)"""
+        raise NotImplementedError
+
+    def get_hits(self, hits: Sequence[SearchHit]) -> List[Document]:
+        """读取检索结果对应的文本块(顺序与hits一致)"""
+        return self.get_many([hit.chunk_id for hit in hits])
+
+    def documents(self) -> Iterator[Document]:
+        """按存储顺序遍历所有文本块"""
+        raise NotImplementedError
+
+    def ids(self) -> List[str]:
+        return [doc.metadata["chunk_id"] for doc in self.documents()]
+
+    def reset(self):
+        """清空所有向量"""
+        raise NotImplementedError
+
+    def save(self):
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        return self.name
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        raise NotImplementedError
+
+    @classmethod
+    def load(cls, path: str, **options) -> "VectorStore":
+        raise NotImplementedError
+
+
+class LocalVectorStore(VectorStore):
+    """
+    本地文件后端的公共部分: 文本块按行存放, 第i行对应向量索引中的第i个向量
+
+    加载时文本块为内存映射的ChunkStore, 第一次写入时转换为可写的ChunkTable。
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.chunks = ChunkTable()
+        self._partitions = LazyPartitions()
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def partitions(self) -> PartitionIndex:
+        return self._partitions.get(self._load_partitions)
+
+    def _load_partitions(self) -> PartitionIndex:
+        # 内存映射的存储优先读取保存时写入的分区, 避免解析全部元数据
+        if isinstance(self.chunks, ChunkStore):
+            saved = PartitionIndex.load(self.path)
+            if saved is not None and saved.count == len(self.chunks):
+                return saved
+        return PartitionIndex.build(self.chunks.metadata(row) for row in range(len(self.chunks)))
+
+    def _filter_rows(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """满足过滤条件的行号, 没有过滤条件时为None"""
+        return self.partitions().rows(filters) if filters else None
+
+    def _make_writable(self):
+        if isinstance(self.chunks, ChunkStore):
+            self.chunks = ChunkTable.from_store(self.chunks)
+
+    def _rows(self, ids: Sequence[str]) -> List[int]:
+        rows = (self.chunks.position(chunk_id) for chunk_id in ids)
+        return [row for row in rows if row is not None]
+
+    def _hits(self, distances: np.ndarray, rows: np.ndarray) -> List[SearchHit]:
+        return [
+            SearchHit(self.chunks.chunk_id(int(row)), float(distance), int(row))
+            for distance, row in zip(distances, rows) if row != -1
+        ]
+
+    def get_many(self, ids: Sequence[str]) -> List[Document]:
+        return [self.chunks.document(row) for row in self._rows(ids)]
+
+    def get_hits(self, hits: Sequence[SearchHit]) -> List[Document]:
+        rows = (hit.row if hit.row is not None else self.chunks.position(hit.chunk_id) for hit in hits)
+        return [self.chunks.document(row) for row in rows if row is not None]
+
+    def documents(self) -> Iterator[Document]:
+        for row in range(len(self.chunks)):
+            yield self.chunks.document(row)
+
+    def ids(self) -> List[str]:
+        return [self.chunks.chunk_id(row) for row in range(len(self.chunks))]
+
+    def _save_chunks(self):
+        os.makedirs(self.path, exist_ok=True)
+        if isinstance(self.chunks, ChunkTable):
+            self.partitions().save(self.path)
+            self.chunks.save(os.path.join(self.path, CHUNKS_DIR))
+
+    def _remove_files(self, filenames: Sequence[str]):
+        for filename in filenames:
+            path = os.path.join(self.path, filename)
+            if os.path.exists(path):
+                os.remove(path)
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return ChunkStore.exists(os.path.join(path, CHUNKS_DIR))
+
+
+class FAISSVectorStore(LocalVectorStore):
+    """FAISS后端: Flat索引的向量保存为.npy并内存映射, IVF/HNSW保存为faiss格式"""
+
+    name = "faiss"
+    # IVF/HNSW索引以内存映射方式加载时为False, 写入前需要重新完整读取
+    _writable = True
+
+    def __init__(self, path: str, index_type: str = "flat", params: Optional[Dict] = None, train_size: int = 0):
+        """
+        Args:
+            path: 存储目录
+            index_type: flat / ivf_flat / ivf_pq / hnsw
+            params: 索引构建与查询参数(见app/ann.py)
+            train_size: IVF索引在创建前缓存的训练样本数
+        """
+        super().__init__(path)
+        self.index_type = index_type
+        self.params = params or {}
+        self.train_size = train_size if index_type.startswith("ivf") else 0
+        self.index = None
+        # 向量维度(删除全部文本块后仍需要用它创建空索引)
+        self.dim: Optional[int] = None
+        self._pending: List[Tuple[Sequence[str], Sequence[Document], np.ndarray]] = []
+
+    @property
+    def supports_delete(self) -> bool:
+        from app.ann import supports_remove
+        # faiss Flat的remove_ids会压缩位置, 与文本块行号保持一致; IVF/HNSW不满足
+        return self.index is None or isinstance(self.index, MmapFlatIndex) or supports_remove(self.index)
+
+    def _make_writable(self):
+        import faiss
+        from app.ann import set_search_params
+
+        super()._make_writable()
+        if isinstance(self.index, MmapFlatIndex):
+            index = faiss.IndexFlatL2(self.index.d)
+            index.add(np.ascontiguousarray(self.index.vectors))
+            self.index = index
+        elif self.index is not None and not self._writable:
+            self.index = faiss.read_index(os.path.join(self.path, FAISS_INDEX_FILE))
+            set_search_params(self.index, self.params)
+        self._writable = True
+
+    def add(self, ids: Sequence[str], documents: Sequence[Document], vectors: np.ndarray):
+        self._make_writable()
+        # 已存在的ID先删除, 保持upsert语义
+        existing = [chunk_id for chunk_id in ids if self.chunks.position(chunk_id) is not None]
+        if existing:
+            self.delete(existing)
+
+        if self.index is None:
+            self._pending.append((ids, documents, vectors))
+            if sum(len(item[0]) for item in self._pending) >= self.train_size:
+                self.flush()
+            return
+
+        self.index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+        self.chunks.append(ids, documents)
+        self._partitions.invalidate()
+
+    def flush(self):
+        """用缓存的向量训练并创建索引"""
+        if self.index is not None or (not self._pending and self.dim is None):
+            return
+        from app.ann import build_index
+
+        pending, self._pending = self._pending, []
+        if pending:
+            vectors = np.concatenate([item[2] for item in pending]).astype(np.float32)
+            self.dim = vectors.shape[1]
+        else:
+            vectors = np.empty((0, self.dim), dtype=np.float32)
+        self.index, spec = build_index(vectors, self.dim, self.index_type, self.params)
+        if spec.startswith("IVF"):
+            print(f"🧭 向量索引: {spec} (训练样本 {len(vectors)} 个)")
+        elif spec != "Flat" or self.index_type != "flat":
+            print(f"🧭 向量索引: {spec}")
+
+        self.index.add(vectors)
+        for ids, documents, _ in pending:
+            self.chunks.append(ids, documents)
+        self._partitions.invalidate()
+
+    def delete(self, ids: Sequence[str]):
+        if not self.supports_delete:
+            raise NotImplementedError(f"{self.describe()} 不支持原地删除")
+        self._make_writable()
+        rows = self._rows(ids)
+        if rows and self.index is not None:
+            self.index.remove_ids(np.asarray(rows, dtype=np.int64))
+            self.chunks.remove_rows(rows)
+            self._partitions.invalidate()
+
+    def search_batch(
+        self, vectors: np.ndarray, k: int, filters: Optional[Dict[str, Any]] = None
+    ) -> List[List[SearchHit]]:
+        from app.ann import search_rows
+
+        selected = self._filter_rows(filters) if self.index is not None else None
+        if self.index is None or len(self.chunks) == 0 or (selected is not None and len(selected) == 0):
+            return [[] for _ in range(len(vectors))]
+        queries = np.asarray(vectors, dtype=np.float32).reshape(-1, self.index.d)
+        if selected is None:
+            distances, rows = self.index.search(queries, k)
+        else:
+            exact_max_rows = self.params.get("filter_exact_rows", FILTER_EXACT_MAX_ROWS)
+            distances, rows = search_rows(self.index, queries, k, selected, exact_max_rows)
+        return [self._hits(d, r) for d, r in zip(distances, rows)]
+
+    def reset(self):
+        if self.index is not None:
+            self.dim = self.index.d
+        self.chunks = ChunkTable()
+        self.index = None
+        self._pending = []
+        self._writable = True
+        self._partitions.invalidate()
+
+    def save(self):
+        import faiss
+
+        self.flush()
+        if self.index is None:
+            raise ValueError("向量数据库为空")
+        self._save_chunks()
+
+        # Flat索引保存为numpy向量(可内存映射), 其他索引使用faiss格式
+        if self.supports_delete:
+            if not isinstance(self.index, MmapFlatIndex):
+                MmapFlatIndex.save(self.path, self.index.reconstruct_n(0, self.index.ntotal).reshape(-1, self.index.d))
+            stale_files = [FAISS_INDEX_FILE]
+        else:
+            if self._writable:
+                tmp_path = os.path.join(self.path, f"{FAISS_INDEX_FILE}.tmp")
+                faiss.write_index(self.index, tmp_path)
+                os.replace(tmp_path, os.path.join(self.path, FAISS_INDEX_FILE))
+            stale_files = [VECTORS_FILE, NORMS_FILE]
+        self._remove_files(stale_files + [LEGACY_DOCSTORE_FILE])
+
+    def describe(self) -> str:
+        from app.ann import describe_index
+        return f"FAISS {describe_index(self.index)}" if self.index is not None else "FAISS (空)"
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return super().exists(path) or os.path.exists(os.path.join(path, LEGACY_DOCSTORE_FILE))
+
+    @classmethod
+    def load(cls, path: str, **options) -> "FAISSVectorStore":
+        """只做内存映射: 向量和文本块在查询命中时才从页缓存读取"""
+        import faiss
+        from app.ann import set_search_params
+
+        store = cls(path, **options)
+        if not super().exists(path):
+            return cls._load_legacy(store)
+
+        store.chunks = ChunkStore(os.path.join(path, CHUNKS_DIR))
+        if os.path.exists(os.path.join(path, VECTORS_FILE)):
+            store.index = MmapFlatIndex.load(path)
+        else:
+            store.index = faiss.read_index(os.path.join(path, FAISS_INDEX_FILE), faiss.IO_FLAG_MMAP)
+            # 查询参数不影响索引内容, 每次加载时按当前配置设置
+            set_search_params(store.index, store.params)
+            store._writable = False
+        return store
+
+    @staticmethod
+    def _load_legacy(store: "FAISSVectorStore") -> "FAISSVectorStore":
+        """读取langchain FAISS.save_local生成的旧格式(index.faiss + index.pkl)并转换"""
+        import faiss
+        import pickle
+        from app.ann import set_search_params
+
+        print("⚠️  检测到旧格式(pickle)的向量数据库, 加载后转换为内存映射格式")
+        with open(os.path.join(store.path, LEGACY_DOCSTORE_FILE), 'rb') as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        ids = [index_to_docstore_id[i] for i in range(len(index_to_docstore_id))]
+        store.chunks = ChunkTable(ids, [docstore.search(chunk_id) for chunk_id in ids])
+        store.index = faiss.read_index(os.path.join(store.path, FAISS_INDEX_FILE))
+        set_search_params(store.index, store.params)
+        store.save()
+        return store
+
+
+class NumpyVectorStore(LocalVectorStore):
+    """numpy暴力检索后端: 精确检索, 不依赖faiss; 保存格式与FAISS Flat相同"""
+
+    name = "numpy"
+
+    def __init__(self, path: str, **options):
+        super().__init__(path)
+        self._batches: List[np.ndarray] = []
+        self._index: Optional[MmapFlatIndex] = None
+
+    def _flat_index(self) -> Optional[MmapFlatIndex]:
+        """合并追加的向量批次(只在查询/保存时合并一次)"""
+        if self._batches:
+            parts = ([np.asarray(self._index.vectors)] if self._index is not None else []) + self._batches
+            vectors = np.concatenate(parts).astype(np.float32)
+            self._index = MmapFlatIndex(vectors, np.einsum('ij,ij->i', vectors, vectors))
+            self._batches = []
+        return self._index
+
+    def add(self, ids: Sequence[str], documents: Sequence[Document], vectors: np.ndarray):
+        self._make_writable()
+        existing = [chunk_id for chunk_id in ids if self.chunks.position(chunk_id) is not None]
+        if existing:
+            self.delete(existing)
+        self._batches.append(np.asarray(vectors, dtype=np.float32))
+        self.chunks.append(ids, documents)
+        self._partitions.invalidate()
+
+    def delete(self, ids: Sequence[str]):
+        self._make_writable()
+        rows = self._rows(ids)
+        index = self._flat_index()
+        if rows and index is not None:
+            keep = np.ones(index.ntotal, dtype=bool)
+            keep[rows] = False
+            vectors = np.asarray(index.vectors)[keep]
+            self._index = MmapFlatIndex(vectors, np.asarray(index.norms)[keep])
+            self.chunks.remove_rows(rows)
+            self._partitions.invalidate()
+
+    def search_batch(
+        self, vectors: np.ndarray, k: int, filters: Optional[Dict[str, Any]] = None
+    ) -> List[List[SearchHit]]:
+        index = self._flat_index()
+        selected = self._filter_rows(filters) if index is not None else None
+        if index is None or index.ntotal == 0 or (selected is not None and len(selected) == 0):
+            return [[] for _ in range(len(vectors))]
+        if selected is None:
+            distances, rows = index.search(vectors, k)
+        else:
+            distances, rows = index.search_rows(np.asarray(vectors, dtype=np.float32).reshape(-1, index.d), k, selected)
+        return [self._hits(d, r) for d, r in zip(distances, rows)]
+
+    def reset(self):
+        self.chunks = ChunkTable()
+        self._batches = []
+        self._index = None
+        self._partitions.invalidate()
+
+    def save(self):
+        index = self._flat_index()
+        if index is None:
+            raise ValueError("向量数据库为空")
+        self._save_chunks()
+        if isinstance(self.chunks, ChunkTable):
+            MmapFlatIndex.save(self.path, np.asarray(index.vectors))
+        self._remove_files([FAISS_INDEX_FILE, LEGACY_DOCSTORE_FILE])
+
+    def describe(self) -> str:
+        return "NumPy 暴力检索"
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return super().exists(path) and os.path.exists(os.path.join(path, VECTORS_FILE))
+
+    @classmethod
+    def load(cls, path: str, **options) -> "NumpyVectorStore":
+        store = cls(path)
+        store.chunks = ChunkStore(os.path.join(path, CHUNKS_DIR))
+        store._index = MmapFlatIndex.load(path)
+        return store
+
+
+class ChromaVectorStore(VectorStore):
+    """
+    ChromaDB后端: 持久化集合, 以稳定的文本块ID批量upsert
+
+    全量构建会重新upsert每个文本块, 同一ID只会覆盖不会重复;
+    增量重建由清单同步(RAGRetriever.sync_vector_store)只写入变化的文本块。
+    """
+
+    name = "chroma"
+    # Chroma的持久化目录(位于VECTOR_STORE_PATH下)
+    DIRECTORY = "chroma_db"
+
+    def __init__(self, path: str, collection: str = "rag_collection", **options):
+        import chromadb
+
+        super().__init__(path)
+        self.collection_name = collection
+        self.client = chromadb.PersistentClient(path=os.path.join(path, self.DIRECTORY))
+        self.collection = self._open_collection()
+        self.batch_size = self.client.get_max_batch_size()
+        self._partitions = LazyPartitions()
+
+    def _open_collection(self):
+        # 向量由RAGRetriever计算后传入, 不使用Chroma自带的嵌入函数; 距离使用L2与其他后端一致
+        return self.client.get_or_create_collection(
+            name=self.collection_name,
+            metadata={"hnsw:space": "l2"},
+            embedding_function=None
+        )
+
+    def __len__(self) -> int:
+        return self.collection.count()
+
+    @staticmethod
+    def _clean_metadata(metadata: Dict) -> Dict:
+        """Chroma元数据只支持标量和列表, 其他类型转为JSON字符串"""
+        cleaned = {}
+        for key, value in metadata.items():
+            if value is None or isinstance(value, (str, int, float, bool)):
+                cleaned[key] = value
+            elif isinstance(value, (list, tuple)) and all(isinstance(v, (str, int, float, bool)) for v in value):
+                cleaned[key] = list(value)
+            else:
+                cleaned[key] = json.dumps(value, ensure_ascii=False)
+        return cleaned
+
+    def add(self, ids: Sequence[str], documents: Sequence[Document], vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        for start in range(0, len(ids), self.batch_size):
+            end = start + self.batch_size
+            self.collection.upsert(
+                ids=list(ids[start:end]),
+                embeddings=vectors[start:end],
+                documents=[doc.page_content for doc in documents[start:end]],
+                metadatas=[self._clean_metadata(doc.metadata) for doc in documents[start:end]]
+            )
+        self._partitions.invalidate()
+
+    def delete(self, ids: Sequence[str]):
+        ids = list(ids)
+        for start in range(0, len(ids), self.batch_size):
+            self.collection.delete(ids=ids[start:start + self.batch_size])
+        self._partitions.invalidate()
+
+    def partitions(self) -> PartitionIndex:
+        # 行号对应documents()的遍历顺序; chroma只用分区展开过滤条件的取值
+        return self._partitions.get(lambda: PartitionIndex.build(doc.metadata for doc in self.documents()))
+
+    def _where(self, filters: Dict[str, Any]) -> Optional[Dict]:
+        """过滤条件转换为Chroma的where条件, 没有满足条件的取值时返回None"""
+        clauses = []
+        for field, values in self.partitions().resolve(filters).items():
+            if not values:
+                return None
+            clauses.append({field: {"$in": values}})
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def search_batch(
+        self, vectors: np.ndarray, k: int, filters: Optional[Dict[str, Any]] = None
+    ) -> List[List[SearchHit]]:
+        where = self._where(filters) if filters else None
+        if k <= 0 or len(vectors) == 0 or (filters and where is None):
+            return [[] for _ in range(len(vectors))]
+        result = self.collection.query(
+            query_embeddings=np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1),
+            n_results=k,
+            where=where,
+            include=["distances"]
+        )
+        return [
+            [SearchHit(chunk_id, float(distance)) for chunk_id, distance in zip(ids, distances)]
+            for ids, distances in zip(result["ids"], result["distances"])
+        ]
+
+    def get_many(self, ids: Sequence[str]) -> List[Document]:
+        if not ids:
+            return []
+        result = self.collection.get(ids=list(ids), include=["documents", "metadatas"])
+        found = {
+            chunk_id: Document(page_content=text, metadata=dict(metadata or {}, chunk_id=chunk_id))
+            for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])
+        }
+        # Chroma不保证返回顺序
+        return [found[chunk_id] for chunk_id in ids if chunk_id in found]
+
+    def documents(self) -> Iterator[Document]:
+        offset = 0
+        while True:
+            result = self.collection.get(include=["documents", "metadatas"], limit=self.batch_size, offset=offset)
+            if not result["ids"]:
+                return
+            for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"]):
+                yield Document(page_content=text, metadata=dict(metadata or {}, chunk_id=chunk_id))
+            offset += len(result["ids"])
+
+    def ids(self) -> List[str]:
+        return self.collection.get(include=[])["ids"]
+
+    def reset(self):
+        self.client.delete_collection(self.collection_name)
+        self.collection = self._open_collection()
+        self._partitions.invalidate()
+
+    def save(self):
+        """PersistentClient写入时已持久化"""
+
+    def describe(self) -> str:
+        return f"Chroma ({self.collection_name})"
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return os.path.exists(os.path.join(path, cls.DIRECTORY))
+
+    @classmethod
+    def load(cls, path: str, **options) -> "ChromaVectorStore":
+        return cls(path, **options)
+
+
+def _backend_class(backend: str):
+    classes = {"faiss": FAISSVectorStore, "numpy": NumpyVectorStore, "chroma": ChromaVectorStore}
+    if backend not in classes:
+        raise ValueError(f"不支持的向量数据库后端: {backend} (可选: {', '.join(BACKENDS)})")
+    return classes[backend]
+
+
+def create_store(backend: str, path: str, **options) -> VectorStore:
+    """
+    创建向量数据库
+
+    faiss/numpy创建空的内存存储(save时写入path); chroma打开path下已有的集合,
+    构建时按稳定ID upsert全部文本块(不会产生重复条目, 增量更新见清单同步)。
+    """
+    return _backend_class(backend)(path, **options)
+
+
+def open_store(backend: str, path: str, **options) -> VectorStore:
+    """从path加载已保存的向量数据库"""
+    return _backend_class(backend).load(path, **options)
+
+
+def store_exists(backend: str, path: str) -> bool:
+    return _backend_class(backend).exists(path)
@@ -0,0 +1,420 @@
+"""
+多进程服务模块
+Pre-fork Multi-Worker Server Module
+
+单个Python进程中查询嵌入、向量检索、分词等CPU计算受GIL限制只能串行,
+多进程模式(python main.py --serve --workers N)让吞吐量随CPU核数扩展, 而索引和模型只加载一次:
+
+    主进程   加载向量数据库、BM25索引和嵌入模型后fork出各子进程, 之后只负责重启退出的子进程
+    路由进程 监听host:port, 按session_id的哈希把请求转发到固定的工作进程(Unix套接字),
+             没有session_id的请求分配新ID; /health、/stats、/metrics汇总所有工作进程
+    工作进程 各自运行一个ChatServer(对话记忆、回答缓存、LLM客户端都在进程内)
+
+内存共享:
+- 向量数据库为内存映射文件(app/mmap_store.py)时, 所有进程共享操作系统页缓存
+- 主进程加载的torch模型权重、FAISS索引等数据在fork后写时复制(copy-on-write)共享,
+  fork前gc.freeze()把已有对象移出垃圾回收的扫描范围, 避免子进程回收时写入对象头导致页面被复制
+- 嵌入缓存(app/embedding_cache.py)的磁盘文件由各进程共同读写(追加时加文件锁)
+
+线程池在fork后的子进程中不可用, 因此:
+- 主进程不做推理; 如果主进程重建或同步索引时已运行过嵌入模型, fork前重新加载一个未使用过的模型
+- onnxruntime推理会话在创建时启动线程池, ONNX模型(EMBEDDING_BACKEND=onnx、ONNX重排序模型)
+  由每个工作进程在启动时各自加载; torch模型在主进程加载, 权重共享
+- LLM客户端、后台事件循环和微批处理线程都在子进程中首次使用时创建
+- 每个工作进程的推理/检索线程数默认为 CPU核数 / 工作进程数(WORKER_THREADS), 避免线程数超过核数
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import uuid
+import zlib
+import signal
+import socket
+import asyncio
+import shutil
+import tempfile
+import threading
+import multiprocessing
+import multiprocessing.connection
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.config import EMBEDDING_BACKEND, ONNX_THREADS
+from app.server import AsyncHTTPServer, ChatServer, HTTPError, parse_json, send_json, session_id_from
+from app.tracing import tracer, merge_metrics
+
+# 子进程启动后不到该秒数就退出时, 等待这么久再重启(避免反复崩溃时占满CPU)
+RESTART_DELAY = 1.0
+# 路由进程查询工作进程/health、/stats、/metrics的超时(秒)
+ADMIN_TIMEOUT = 5.0
+LISTEN_BACKLOG = 1024
+# 按会话转发的路径, 其余路径转发到0号工作进程
+SESSION_PATHS = ("/chat", "/chat/stream", "/reset")
+
+
+def worker_threads(workers: int) -> int:
+    """每个工作进程的推理/检索线程数(CPU核数按工作进程数均分)"""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def route(session_id: str, workers: int) -> int:
+    """会话固定分配到的工作进程编号(各进程计算结果一致)"""
+    return zlib.crc32(session_id.encode('utf-8')) % workers
+
+
+def prepare_for_fork(rag):
+    """
+    主进程在fork前加载可共享的模型, 并冻结已有对象
+
+    Args:
+        rag: 已初始化的RAGRetriever
+    """
+    from app.embedding_cache import LazyEmbeddings
+
+    embeddings = rag.embeddings
+    if not isinstance(embeddings, LazyEmbeddings) or embeddings.loaded:
+        # 重建或同步索引时已在主进程中运行过推理, 其线程池无法带入子进程
+        print("🔄 嵌入模型已在主进程中使用过, 为工作进程重新加载")
+        rag.embeddings = LazyEmbeddings(rag._create_embeddings)
+    if EMBEDDING_BACKEND == "torch":
+        rag.embeddings.ensure_loaded()
+    if rag.reranker is not None and rag.reranker.backend == "torch":
+        rag.reranker.ensure_loaded()
+
+    if threading.active_count() > 1:
+        names = ", ".join(thread.name for thread in threading.enumerate() if thread is not threading.current_thread())
+        print(f"⚠️  fork前主进程中已有后台线程({names}), 子进程中这些线程不存在")
+
+    gc.collect()
+    gc.freeze()
+
+
+def configure_worker(worker_id: int, threads: int):
+    """工作进程启动时调用: 设置线程数与指标标签"""
+    tracer.metrics.set_constant_labels(worker=str(worker_id))
+    if tracer.metrics_path:
+        # 每个工作进程写入各自的指标文件(node_exporter textfile collector会读取目录中的全部.prom文件)
+        root, ext = os.path.splitext(tracer.metrics_path)
+        tracer.metrics_path = f"{root}.worker{worker_id}{ext}"
+
+    if ONNX_THREADS == 0:
+        from app.onnx_models import set_default_threads
+        set_default_threads(threads)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+    if "faiss" in sys.modules:
+        sys.modules["faiss"].omp_set_num_threads(threads)
+
+
+async def _open(path: str, method: str, target: str, body: bytes) -> Tuple[
+        asyncio.StreamReader, asyncio.StreamWriter, bytes, List[bytes], Optional[int]]:
+    """
+    向工作进程发送请求并读取响应头
+
+    Returns:
+        (reader, writer, 状态行, 除Connection外的响应头行, Content-Length(流式响应为None))
+    """
+    reader, writer = await asyncio.open_unix_connection(path)
+    try:
+        writer.write(
+            f"{method} {target} HTTP/1.1\r\n"
+            f"Host: worker\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode('latin-1')
+            + body
+        )
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("工作进程关闭了连接")
+        headers = []
+        length = None
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode('latin-1').partition(":")
+            name = name.strip().lower()
+            if name == "connection":
+                continue
+            if name == "content-length":
+                length = int(value.strip())
+            headers.append(line)
+        return reader, writer, status_line, headers, length
+    except Exception:
+        writer.close()
+        raise
+
+
+class SessionRouter(AsyncHTTPServer):
+    """路由进程: 按会话把请求转发到固定的工作进程"""
+
+    def __init__(self, socket_paths: List[str]):
+        """
+        Args:
+            socket_paths: 各工作进程监听的Unix套接字路径(下标为工作进程编号)
+        """
+        self.socket_paths = socket_paths
+
+    async def serve_forever(self, sock: socket.socket):
+        server = await asyncio.start_server(self._handle_connection, sock=sock)
+        async with server:
+            await server.serve_forever()
+
+    async def _fetch(self, worker: int, target: str) -> Tuple[int, bytes]:
+        """GET工作进程的管理接口, 返回(状态码, 响应体)"""
+        async def fetch():
+            reader, writer, status_line, _, length = await _open(self.socket_paths[worker], "GET", target, b"")
+            try:
+                body = await reader.readexactly(length) if length else await reader.read()
+                return int(status_line.split()[1]), body
+            finally:
+                writer.close()
+
+        return await asyncio.wait_for(fetch(), ADMIN_TIMEOUT)
+
+    async def _fetch_all(self, target: str) -> List[Optional[Tuple[int, bytes]]]:
+        results = await asyncio.gather(
+            *(self._fetch(worker, target) for worker in range(len(self.socket_paths))),
+            return_exceptions=True
+        )
+        return [None if isinstance(result, BaseException) else result for result in results]
+
+    async def _dispatch(self, writer, method: str, path: str, body: bytes, keep_alive: bool) -> bool:
+        if path == "/health" and method == "GET":
+            results = await self._fetch_all("/health")
+            unavailable = [worker for worker, result in enumerate(results) if result is None or result[0] != 200]
+            if unavailable:
+                await send_json(writer, 503, {"status": "degraded", "unavailable_workers": unavailable}, keep_alive)
+            else:
+                await send_json(writer, 200, {"status": "ok", "workers": len(results)}, keep_alive)
+            return keep_alive
+
+        if path == "/stats" and method == "GET":
+            workers = []
+            for worker, result in enumerate(await self._fetch_all("/stats")):
+                if result is not None and result[0] == 200:
+                    workers.append(json.loads(result[1]))
+                else:
+                    workers.append({"worker": worker, "error": "不可用"})
+            sessions = sum(stats.get("sessions", 0) for stats in workers)
+            await send_json(writer, 200, {"sessions": sessions, "workers": workers}, keep_alive)
+            return keep_alive
+
+        if path == "/metrics" and method == "GET":
+            texts = [result[1].decode('utf-8') for result in await self._fetch_all("/metrics")
+                     if result is not None and result[0] == 200]
+            body = merge_metrics(texts).encode('utf-8')
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                + f"Content-Length: {len(body)}\r\n"
+                  f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1')
+                + body
+            )
+            await writer.drain()
+            return keep_alive
+
+        worker = 0
+        if path in SESSION_PATHS and method == "POST":
+            payload = parse_json(body)
+            session_id = session_id_from(payload)
+            if session_id is None:
+                # 新会话在这里分配ID, 工作进程使用同一个ID
+                payload["session_id"] = session_id = uuid.uuid4().hex
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            worker = route(session_id, len(self.socket_paths))
+        return await self._forward(worker, method, path, body, writer, keep_alive)
+
+    async def _forward(self, worker: int, method: str, path: str, body: bytes, writer, keep_alive: bool) -> bool:
+        """转发请求并把响应原样写回客户端, 返回连接是否保持"""
+        try:
+            reader, upstream, status_line, headers, length = await _open(self.socket_paths[worker], method, path, body)
+        except (OSError, ValueError) as e:
+            raise HTTPError(502, f"工作进程 {worker} 不可用: {e}")
+
+        try:
+            if length is None:
+                # SSE: 逐块转发直到工作进程关闭连接
+                writer.write(status_line + b"".join(headers) + b"Connection: close\r\n\r\n")
+                while True:
+                    chunk = await reader.read(1 << 16)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+                    await writer.drain()
+                return False
+
+            try:
+                response = await reader.readexactly(length)
+            except asyncio.IncompleteReadError:
+                raise HTTPError(502, f"工作进程 {worker} 在响应完成前关闭了连接")
+            writer.write(
+                status_line + b"".join(headers)
+                + f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1')
+                + response
+            )
+            await writer.drain()
+            return keep_alive
+        finally:
+            upstream.close()
+
+
+class PreforkServer:
+    """多进程HTTP服务: 主进程加载索引后fork出路由进程和工作进程, 并在子进程退出时重启"""
+
+    def __init__(
+        self,
+        rag,
+        host: str,
+        port: int,
+        workers: int,
+        max_concurrency: int,
+        max_sessions: int,
+        session_ttl: float,
+        threads: int = 0,
+        chatbot_factory: Optional[Callable] = None
+    ):
+        """
+        初始化多进程服务
+
+        Args:
+            rag: 已初始化的RAGRetriever(由所有工作进程共享)
+            host: 监听地址
+            port: 监听端口
+            workers: 工作进程数
+            max_concurrency: 每个工作进程同时进行中的LLM请求上限
+            max_sessions: 每个工作进程保留的会话数上限
+            session_ttl: 会话空闲过期时间(秒)
+            threads: 每个工作进程的推理/检索线程数(0为按CPU核数均分)
+            chatbot_factory: 在工作进程中创建聊天机器人的函数(参数为rag), 默认为GovernmentChatbot
+        """
+        self.rag = rag
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.threads = threads or worker_threads(workers)
+        self.chatbot_factory = chatbot_factory
+        self._listener: Optional[socket.socket] = None
+        self._worker_sockets: List[socket.socket] = []
+        self._socket_dir = ""
+
+    def serve_forever(self):
+        """启动服务并持续运行(阻塞), Ctrl+C或SIGTERM时停止所有子进程"""
+        prepare_for_fork(self.rag)
+
+        # 监听套接字在主进程中创建: 子进程重启期间新连接在队列中等待, 不会被拒绝
+        self._listener = socket.create_server((self.host, self.port), backlog=LISTEN_BACKLOG)
+        self._socket_dir = tempfile.mkdtemp(prefix="chatbot-workers-")
+        socket_paths = []
+        for worker in range(self.workers):
+            path = os.path.join(self._socket_dir, f"worker-{worker}.sock")
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.bind(path)
+            sock.listen(LISTEN_BACKLOG)
+            self._worker_sockets.append(sock)
+            socket_paths.append(path)
+
+        context = multiprocessing.get_context("fork")
+        starters: Dict[str, Callable[[], multiprocessing.Process]] = {
+            "router": lambda: context.Process(target=self._run_router, args=(socket_paths,),
+                                              name="chat-router", daemon=True),
+        }
+        for worker in range(self.workers):
+            starters[f"worker-{worker}"] = (
+                lambda worker=worker: context.Process(target=self._run_worker, args=(worker,),
+                                                      name=f"chat-worker-{worker}", daemon=True)
+            )
+
+        previous = signal.signal(signal.SIGTERM, _raise_shutdown)
+        processes: Dict[str, Tuple[multiprocessing.Process, float]] = {}
+        try:
+            for name, starter in starters.items():
+                processes[name] = (self._start(starter), time.monotonic())
+            print(f"🌐 服务已启动: http://{self.host}:{self.port} "
+                  f"({self.workers} 个工作进程, 每个 {self.threads} 线程, LLM并发上限 {self.max_concurrency}/进程)")
+
+            while True:
+                sentinels = {process.sentinel: name for name, (process, _) in processes.items()}
+                for sentinel in multiprocessing.connection.wait(list(sentinels)):
+                    name = sentinels[sentinel]
+                    process, started = processes[name]
+                    process.join()
+                    print(f"⚠️  {process.name} (pid {process.pid}) 已退出 (退出码 {process.exitcode}), 正在重启")
+                    if time.monotonic() - started < RESTART_DELAY:
+                        time.sleep(RESTART_DELAY)
+                    processes[name] = (self._start(starters[name]), time.monotonic())
+        except (KeyboardInterrupt, SystemExit):
+            print("\n🛑 正在停止工作进程...")
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+            for process, _ in processes.values():
+                if process.is_alive():
+                    process.terminate()
+            for process, _ in processes.values():
+                process.join()
+            self._close()
+
+    @staticmethod
+    def _start(starter: Callable[[], multiprocessing.Process]) -> multiprocessing.Process:
+        process = starter()
+        # 未输出的缓冲内容会被复制到子进程中重复输出
+        sys.stdout.flush()
+        sys.stderr.flush()
+        process.start()
+        return process
+
+    def _close(self):
+        for sock in [self._listener, *self._worker_sockets]:
+            if sock is not None:
+                sock.close()
+        self._worker_sockets = []
+        if self._socket_dir:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+
+    def _run_router(self, socket_paths: List[str]):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        for sock in self._worker_sockets:
+            sock.close()
+        try:
+            asyncio.run(SessionRouter(socket_paths).serve_forever(self._listener))
+        except KeyboardInterrupt:
+            pass
+
+    def _run_worker(self, worker: int):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        self._listener.close()
+        configure_worker(worker, self.threads)
+
+        if self.chatbot_factory is not None:
+            chatbot = self.chatbot_factory(self.rag)
+        else:
+            from app.chatbot import GovernmentChatbot
+            chatbot = GovernmentChatbot(self.rag)
+        # ONNX模型在这里加载, 避免第一个请求等待
+        self.rag.warmup()
+
+        server = ChatServer(
+            chatbot,
+            host=self.host,
+            port=self.port,
+            max_concurrency=self.max_concurrency,
+            max_sessions=self.max_sessions,
+            session_ttl=self.session_ttl,
+            worker_id=worker
+        )
+        try:
+            asyncio.run(server.serve_forever(sock=self._worker_sockets[worker]))
+        except KeyboardInterrupt:
+            pass
+
+
+def _raise_shutdown(signum, frame):
+    raise SystemExit(0)
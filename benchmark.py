@@ -0,0 +1,1330 @@
+"""
+性能基准测试工具
+Benchmark Tool
+
+    python benchmark.py ann                           使用当前向量数据库的文本块
+    python benchmark.py ann --synthetic 100000        使用合成的聚类向量
+    python benchmark.py backends --synthetic 100000   对比向量数据库后端
+    python benchmark.py retrieval --json baseline.json 检索质量与性能基准
+    python benchmark.py embeddings                    ONNX/int8嵌入与PyTorch的一致性检查
+    python benchmark.py llm                           LLM路由(故障转移/熔断/对冲请求)对比
+    python benchmark.py ollama                        Ollama keep_alive与KV缓存复用对比
+    python benchmark.py workers                       多进程检索吞吐量与内存对比
+
+ann: 对比Flat(精确检索)与IVF-Flat、IVF-PQ、HNSW索引在不同nprobe/efSearch下的
+召回率(recall@k, 以Flat结果为真值)、单条查询延迟和每个向量的内存占用。
+
+backends: 对比FAISS、NumPy、Chroma后端的构建耗时、加载耗时、查询延迟、
+召回率(以NumPy暴力检索为真值)、内存和磁盘占用。每个后端的构建和查询分别在
+独立子进程中运行, 内存数据互不影响。
+
+retrieval: 在data/知识库(标注集见benchmarks/retrieval_labels.json)和合成语料上
+按当前配置(CHUNKER、CHUNK_SIZE、EMBEDDING_MODEL、TOP_K_RESULTS等)构建索引,
+报告recall@k、hit@k、MRR、查询延迟P50/P95/P99、构建耗时、索引大小和内存峰值;
+--baseline与之前保存的JSON比较, 出现回归时返回非零退出码。
+--embeddings hash 与 --chat(使用fake LLM)可完全离线运行。
+
+embeddings: 用PyTorch(参照)与ONNX Runtime(全精度/int8量化)分别嵌入知识库文本块和标注问题,
+比较同一文本的余弦相似度与前k个检索结果的重合度, 超出容差时返回非零退出码;
+同时报告文档嵌入吞吐量、单条查询延迟与多线程并发查询吞吐量(体现查询微批处理的效果)。
+
+llm: 启动两个本地模拟LLM服务(app/fake_llm_server.py, 不访问网络): 首选服务首token较快但有长尾延迟
+和偶发5xx错误, 备用服务稍慢但稳定; 对比只用首选服务、LLM路由(故障转移+熔断)、LLM路由+对冲请求
+三种方式的首token延迟P50/P95/P99、失败率、发往各服务的请求数和建立的TCP连接数(体现连接复用)。
+
+ollama: 启动模拟Ollama服务(模拟提示词计算耗时、KV缓存槽位和keep_alive), 用知识库(哈希嵌入, 离线)
+和标注问题进行一段多轮对话, 对比keep_alive=30m与keep_alive=0两种方式每轮实际计算的提示词token数、
+命中缓存的token数(固定的系统提示词前缀)、提示词计算耗时、缓存节省的估算耗时和首token延迟。
+
+workers: 在合成语料上构建索引, 像多进程服务(--workers)的主进程一样加载一次索引和嵌入模型,
+分别fork出1、2、CPU核数个工作进程同时检索, 报告总吞吐量、相对单进程的加速比,
+以及各工作进程的RSS合计(重复计算共享页)、PSS合计(均摊共享页)和私有内存合计。
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import unicodedata
+import itertools
+import multiprocessing
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+from app.config import (
+    ANN_TRAIN_SAMPLE,
+    EMBED_BATCH_SIZE,
+    HYBRID_CANDIDATES,
+    VECTOR_INDEX_TYPE,
+    VECTOR_BACKEND,
+    KNOWLEDGE_BASE_PATH,
+    EMBEDDING_MODEL,
+    EMBEDDING_ONNX_FILE,
+    EMBEDDING_CACHE_ENABLED,
+    EMBED_QUERY_BATCH_SIZE,
+    EMBED_QUERY_MAX_WAIT_MS,
+    CHUNK_SIZE,
+    TOP_K_RESULTS,
+    HYBRID_SEARCH,
+    LEXICAL_INDEX_DIR,
+    RERANK_ENABLED,
+    RERANK_MODEL,
+    RETRIEVAL_BATCH_ENABLED,
+    CONTEXT_PACKING,
+    CONTEXT_MAX_TOKENS,
+)
+from app.ann import INDEX_TYPES, build_index, set_search_params
+from app.rag import ANN_PARAMS, chunker_config, embedding_model_id
+from app.vector_stores import BACKENDS, create_store, open_store
+
+
+def synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """生成归一化的聚类向量, 近似真实文本嵌入的分布(每个主题约100个文本块)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 100), dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), size=n)
+    vectors = centers[labels] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def store_documents() -> Tuple[List[Document], np.ndarray]:
+    """读取当前向量数据库中所有文本块及其嵌入(命中嵌入缓存时不需要重新计算)"""
+    from app.rag import RAGRetriever
+
+    rag = RAGRetriever()
+    rag.load_vector_store()
+    documents = list(rag.vector_store.documents())
+    texts = [doc.page_content for doc in documents]
+
+    vectors = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        vectors.extend(rag.embeddings.embed_documents(texts[start:start + EMBED_BATCH_SIZE]))
+    return documents, np.asarray(vectors, dtype=np.float32)
+
+
+def store_vectors() -> np.ndarray:
+    return store_documents()[1]
+
+
+def synthetic_documents(n: int) -> List[Document]:
+    return [
+        Document(page_content=f"合成文本块 {i}", metadata={"source": "synthetic", "chunk_id": f"synthetic-{i}"})
+        for i in range(n)
+    ]
+
+
+def search_one_by_one(index, queries: np.ndarray, k: int) -> Tuple[np.ndarray, List[float]]:
+    """逐条查询(与在线对话一致), 返回结果ID与每条查询的耗时(毫秒)"""
+    results = np.empty((len(queries), k), dtype=np.int64)
+    latencies = []
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results[i] = ids[0]
+    return results, latencies
+
+
+def recall_at_k(results: np.ndarray, truth: np.ndarray) -> float:
+    """recall@k: 近似结果与精确结果的平均重合比例"""
+    hits = sum(len(set(found) & set(expected)) for found, expected in zip(results, truth))
+    return hits / truth.size
+
+
+def benchmark_ann(vectors: np.ndarray, n_queries: int, k: int, index_types: List[str], sweeps: Dict) -> List[Dict]:
+    """
+    召回率与延迟对比
+
+    Args:
+        vectors: 全部向量, 随机留出n_queries个作为查询, 其余作为索引内容
+        n_queries: 查询数
+        k: 每次查询返回的结果数
+        index_types: 参与对比的索引类型
+        sweeps: 查询参数取值, {"nprobe": [...], "ef_search": [...]}
+
+    Returns:
+        每个(索引类型, 查询参数)组合的结果
+    """
+    import faiss
+
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(vectors))
+    queries = vectors[order[:n_queries]]
+    base = vectors[order[n_queries:]]
+    dim = base.shape[1]
+    train = base[:ANN_TRAIN_SAMPLE]
+    k = min(k, len(base))
+
+    rows = []
+    truth = None
+    for index_type in ["flat"] + [t for t in index_types if t != "flat"]:
+        start = time.perf_counter()
+        index, spec = build_index(train, dim, index_type, ANN_PARAMS)
+        index.add(base)
+        build_seconds = time.perf_counter() - start
+        bytes_per_vector = len(faiss.serialize_index(index)) / len(base)
+
+        if spec.startswith("IVF"):
+            sweep_name, values = "nprobe", sweeps["nprobe"]
+        elif spec.startswith("HNSW"):
+            sweep_name, values = "ef_search", sweeps["ef_search"]
+        else:
+            sweep_name, values = None, [None]
+
+        for value in values:
+            if sweep_name:
+                set_search_params(index, {**ANN_PARAMS, sweep_name: value})
+            results, latencies = search_one_by_one(index, queries, k)
+            if truth is None:
+                truth = results
+            rows.append({
+                "index_type": index_type,
+                "spec": spec,
+                "param": f"{sweep_name}={value}" if sweep_name else "",
+                "recall": recall_at_k(results, truth),
+                "mean_ms": float(np.mean(latencies)),
+                "p95_ms": float(np.percentile(latencies, 95)),
+                "build_seconds": build_seconds,
+                "bytes_per_vector": bytes_per_vector,
+            })
+    return rows
+
+
+def print_ann_report(rows: List[Dict], n_base: int, dim: int, k: int):
+    """打印召回率-延迟对比表"""
+    print("\n" + "="*86)
+    print(f"📊 向量索引对比: {n_base} 个向量, {dim} 维, recall@{k} (以Flat为真值)")
+    print("="*86)
+    print(f"{'索引':<20}{'查询参数':<14}{'召回率':>8}{'平均(ms)':>11}{'P95(ms)':>10}{'构建(s)':>10}{'字节/向量':>11}")
+    print("-"*86)
+    for row in rows:
+        print(
+            f"{row['spec']:<20}{row['param']:<14}{row['recall']:>9.3f}{row['mean_ms']:>11.3f}"
+            f"{row['p95_ms']:>10.3f}{row['build_seconds']:>10.2f}{row['bytes_per_vector']:>11.1f}"
+        )
+    print("="*86)
+
+
+def run_ann(args) -> int:
+    """ann子命令"""
+    if args.synthetic:
+        print(f"🧪 生成合成向量: {args.synthetic} 个, {args.dim} 维")
+        vectors = synthetic_vectors(args.synthetic, args.dim)
+    else:
+        vectors = store_vectors()
+
+    if len(vectors) <= args.queries:
+        print(f"❌ 向量数({len(vectors)})不足, 至少需要多于查询数({args.queries})")
+        return 1
+
+    sweeps = {
+        "nprobe": [int(v) for v in args.nprobe.split(",")],
+        "ef_search": [int(v) for v in args.ef_search.split(",")],
+    }
+    rows = benchmark_ann(vectors, args.queries, args.k, args.types.split(","), sweeps)
+    print_ann_report(rows, len(vectors) - args.queries, vectors.shape[1], min(args.k, len(vectors) - args.queries))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"benchmark": "ann", "vectors": len(vectors), "dim": vectors.shape[1],
+                       "queries": args.queries, "k": args.k, "results": rows}, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存到: {args.json}")
+    return 0
+
+
+def _rss_mb() -> Optional[float]:
+    """当前进程的常驻内存(MB), 仅Linux可用"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return None
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """当前进程的内存峰值(MB)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Linux下ru_maxrss单位为KB, macOS为字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def _directory_mb(path: str) -> float:
+    total = 0
+    for root, _, filenames in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, filename)) for filename in filenames)
+    return total / 2**20
+
+
+def _store_options(backend: str) -> Dict:
+    if backend == "faiss":
+        return {"index_type": VECTOR_INDEX_TYPE, "params": ANN_PARAMS, "train_size": ANN_TRAIN_SAMPLE}
+    return {}
+
+
+def _build_backend(backend: str, directory: str, data_path: str) -> Dict:
+    """子进程: 分批写入向量并保存"""
+    with open(os.path.join(data_path, "documents.json"), encoding="utf-8") as f:
+        documents = [Document(page_content=text, metadata=metadata) for text, metadata in json.load(f)]
+    vectors = np.load(os.path.join(data_path, "base.npy"))
+    baseline = _rss_mb()
+
+    start = time.perf_counter()
+    store = create_store(backend, directory, **_store_options(backend))
+    for offset in range(0, len(documents), EMBED_BATCH_SIZE):
+        batch = documents[offset:offset + EMBED_BATCH_SIZE]
+        store.add([doc.metadata["chunk_id"] for doc in batch], batch, vectors[offset:offset + EMBED_BATCH_SIZE])
+    store.flush()
+    store.save()
+    return {
+        "build_seconds": time.perf_counter() - start,
+        "build_peak_mb": _peak_rss_mb(),
+        "build_baseline_mb": baseline,
+        "disk_mb": _directory_mb(directory),
+    }
+
+
+def _query_backend(backend: str, directory: str, data_path: str, k: int) -> Dict:
+    """子进程: 加载已保存的向量数据库并逐条查询"""
+    queries = np.load(os.path.join(data_path, "queries.npy"))
+    baseline = _rss_mb()
+
+    start = time.perf_counter()
+    store = open_store(backend, directory, **_store_options(backend))
+    load_ms = (time.perf_counter() - start) * 1000
+    loaded = _rss_mb()
+
+    results = []
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        hits = store.search(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append([hit.chunk_id for hit in hits])
+    queried = _rss_mb()
+
+    return {
+        "describe": store.describe(),
+        "load_ms": load_ms,
+        "load_rss_mb": loaded - baseline if baseline is not None else None,
+        "query_rss_mb": queried - baseline if baseline is not None else None,
+        "mean_ms": float(np.mean(latencies)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "results": results,
+    }
+
+
+def benchmark_backends(documents: List[Document], vectors: np.ndarray, n_queries: int, k: int,
+                       backends: List[str]) -> List[Dict]:
+    """
+    向量数据库后端对比
+
+    Args:
+        documents: 文本块(与vectors一一对应)
+        vectors: 全部向量, 随机留出n_queries个作为查询, 其余写入后端
+        n_queries: 查询数
+        k: 每次查询返回的结果数
+        backends: 参与对比的后端
+
+    Returns:
+        每个后端的结果
+    """
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(vectors))
+    queries = vectors[order[:n_queries]]
+    base_rows = np.sort(order[n_queries:])
+    base = vectors[base_rows]
+
+    # spawn: 子进程不继承父进程已分配的内存, 内存统计只包含该后端
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    truth = None
+    with tempfile.TemporaryDirectory(prefix="benchmark_backends_") as workdir:
+        data_path = os.path.join(workdir, "data")
+        os.makedirs(data_path)
+        np.save(os.path.join(data_path, "base.npy"), base)
+        np.save(os.path.join(data_path, "queries.npy"), queries)
+        with open(os.path.join(data_path, "documents.json"), "w", encoding="utf-8") as f:
+            json.dump([(documents[i].page_content, documents[i].metadata) for i in base_rows], f, ensure_ascii=False)
+
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            for backend in ["numpy"] + [b for b in backends if b != "numpy"]:
+                print(f"⏳ 正在测试后端: {backend}")
+                directory = os.path.join(workdir, backend)
+                build = pool.apply(_build_backend, (backend, directory, data_path))
+                query = pool.apply(_query_backend, (backend, directory, data_path, k))
+
+                results = query.pop("results")
+                if truth is None:
+                    truth = results
+                hits = sum(len(set(found) & set(expected)) for found, expected in zip(results, truth))
+                rows.append({
+                    "backend": backend,
+                    **query,
+                    **build,
+                    "recall": hits / max(1, sum(len(expected) for expected in truth)),
+                })
+    return [row for row in rows if row["backend"] in backends]
+
+
+def _display_pad(text: str, width: int, right: bool = False) -> str:
+    """按终端显示宽度(中文占两列)补空格"""
+    padding = " " * max(0, width - sum(2 if unicodedata.east_asian_width(ch) in "WF" else 1 for ch in text))
+    return padding + text if right else text + padding
+
+
+def print_backend_report(rows: List[Dict], n_base: int, dim: int, k: int):
+    """打印后端对比表"""
+    def mb(value):
+        return f"{value:>9.1f}" if value is not None else f"{'-':>9}"
+
+    headers = [("构建(s)", 9), ("加载(ms)", 10), ("平均(ms)", 10), ("P95(ms)", 9), ("召回率", 9),
+               ("构建峰值MB", 12), ("加载MB", 9), ("磁盘MB", 9)]
+
+    print("\n" + "="*104)
+    print(f"📊 向量数据库后端对比: {n_base} 个向量, {dim} 维, recall@{k} (以NumPy暴力检索为真值)")
+    print("="*104)
+    print(_display_pad("后端", 30) + "".join(_display_pad(name, width, right=True) for name, width in headers))
+    print("-"*104)
+    for row in rows:
+        print(
+            f"{_display_pad(row['describe'][:24], 30)}{row['build_seconds']:>9.2f}{row['load_ms']:>10.1f}{row['mean_ms']:>10.3f}"
+            f"{row['p95_ms']:>9.3f}{row['recall']:>9.3f}   {mb(row['build_peak_mb'])}{mb(row['load_rss_mb'])}"
+            f"{mb(row['disk_mb'])}"
+        )
+    print("="*104)
+    print("💡 加载MB为加载后常驻内存的增量; 内存映射的文件在查询命中前不计入")
+
+
+def run_backends(args) -> int:
+    """backends子命令"""
+    if args.synthetic:
+        print(f"🧪 生成合成向量: {args.synthetic} 个, {args.dim} 维")
+        vectors = synthetic_vectors(args.synthetic, args.dim)
+        documents = synthetic_documents(len(vectors))
+    else:
+        documents, vectors = store_documents()
+
+    if len(vectors) <= args.queries:
+        print(f"❌ 向量数({len(vectors)})不足, 至少需要多于查询数({args.queries})")
+        return 1
+
+    backends = args.backends.split(",")
+    unknown = [backend for backend in backends if backend not in BACKENDS]
+    if unknown:
+        print(f"❌ 不支持的后端: {', '.join(unknown)} (可选: {', '.join(BACKENDS)})")
+        return 1
+
+    k = min(args.k, len(vectors) - args.queries)
+    rows = benchmark_backends(documents, vectors, args.queries, k, backends)
+    print_backend_report(rows, len(vectors) - args.queries, vectors.shape[1], k)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"benchmark": "backends", "vectors": len(vectors), "dim": vectors.shape[1],
+                       "queries": args.queries, "k": k, "results": rows}, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存到: {args.json}")
+    return 0
+
+
+DEFAULT_LABELS = os.path.join("benchmarks", "retrieval_labels.json")
+
+
+def _with_chunk_ids(rag, documents: Iterable[Document]) -> Iterator[Document]:
+    """按来源分组分配文本块ID(合成语料同一单位的文本块相邻)"""
+    for _, group in itertools.groupby(documents, key=lambda doc: doc.metadata["source"]):
+        chunks = list(group)
+        rag.assign_chunk_ids(chunks)
+        yield from chunks
+
+
+def _concurrent_throughput(rag, questions: List[str], k: int, threads: int, rounds: int = 5) -> Dict:
+    """多线程并发检索的吞吐量(查询/秒), 分别测量启用与关闭检索微批处理"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    queries = questions * rounds
+    batcher = rag.query_batcher
+    result = {"threads": threads, "queries": len(queries)}
+    for name, query_batcher in (("batched_qps", batcher), ("unbatched_qps", None)):
+        if name == "batched_qps" and batcher is None:
+            continue
+        rag.query_batcher = query_batcher
+        with ThreadPoolExecutor(threads) as pool:
+            start = time.perf_counter()
+            list(pool.map(lambda question: rag.retrieve(question, k), queries))
+            result[name] = len(queries) / (time.perf_counter() - start)
+    rag.query_batcher = batcher
+    if batcher is not None:
+        result["mean_batch_size"] = batcher.mean_batch_size
+    return result
+
+
+def _run_retrieval(corpus: str, n_chunks: int, labels_path: str, n_questions: int, ks: List[int],
+                   embeddings: str, chat: bool, concurrency: int, directory: str) -> Dict:
+    """
+    子进程: 构建索引并逐条检索标注问题
+
+    Args:
+        corpus: "data"(知识库目录) 或 "synthetic"
+        n_chunks: 合成语料的文本块数
+        labels_path: data语料的标注集
+        n_questions: 合成语料的问题数
+        ks: recall@k的k值
+        embeddings: "model"(EMBEDDING_MODEL) 或 "hash"(离线哈希嵌入)
+        chat: 是否同时测量完整对话(fake LLM)的延迟
+        concurrency: 大于1时测量该并发线程数下的检索吞吐量
+        directory: 索引保存目录(用于统计索引大小)
+    """
+    from app.rag import RAGRetriever
+    from app.evaluation import HashingEmbeddings, evaluate, latency_summary, load_labels, synthetic_corpus, synthetic_labels
+
+    rag = RAGRetriever()
+    if embeddings == "hash":
+        rag.embeddings = HashingEmbeddings()
+    else:
+        rag.initialize_embeddings()
+    rag.vector_store = create_store(VECTOR_BACKEND, directory, **rag.vector_store_options())
+
+    if corpus == "data":
+        labels = load_labels(labels_path)
+        chunks = rag.iter_chunks(rag.list_files(KNOWLEDGE_BASE_PATH))
+    else:
+        labels = synthetic_labels(n_chunks, n_questions)
+        chunks = _with_chunk_ids(rag, synthetic_corpus(n_chunks, chunk_chars=CHUNK_SIZE))
+    baseline = _rss_mb()
+
+    start = time.perf_counter()
+    rag.add_chunks(chunks)
+    rag.build_lexical_index()
+    build_seconds = time.perf_counter() - start
+
+    os.makedirs(directory, exist_ok=True)
+    rag.vector_store.save()
+    if rag.lexical_index is not None:
+        rag.lexical_index.save(os.path.join(directory, LEXICAL_INDEX_DIR))
+    rag.setup_retriever()
+
+    # 首次查询包含惰性初始化, 不计入延迟
+    k = max(ks)
+    rag.retrieve(labels[0]["question"], k)
+    results = []
+    latencies = []
+    for label in labels:
+        start = time.perf_counter()
+        results.append(rag.retrieve(label["question"], k))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    run = {
+        "corpus": corpus if corpus == "data" else f"synthetic-{n_chunks}",
+        "chunks": len(rag.vector_store),
+        "questions": len(labels),
+        "index": rag.vector_store.describe(),
+        "build_seconds": build_seconds,
+        "index_mb": _directory_mb(directory),
+        "baseline_rss_mb": baseline,
+        "peak_rss_mb": _peak_rss_mb(),
+        "quality": evaluate(results, labels, ks),
+        "latency": latency_summary(latencies),
+        "context": _context_stats([docs[:TOP_K_RESULTS] for docs in results]),
+    }
+    if concurrency > 1:
+        run["throughput"] = _concurrent_throughput(rag, [label["question"] for label in labels], k, concurrency)
+
+    if chat:
+        from app.chatbot import GovernmentChatbot
+
+        chatbot = GovernmentChatbot(rag, llm_type="fake")
+        latencies = []
+        for label in labels:
+            start = time.perf_counter()
+            # 每个问题使用新的对话记忆, 只测量检索+生成, 不触发问题改写
+            chatbot.chat(label["question"], memory=chatbot.new_memory())
+            latencies.append((time.perf_counter() - start) * 1000)
+        run["chat_latency"] = latency_summary(latencies)
+    return run
+
+
+def _context_stats(results: List[List]) -> Dict:
+    """每个问题前TOP_K_RESULTS个检索结果打包前后的平均文本块数与token数"""
+    from app.context import pack_context
+
+    totals = {"chunks_before": 0, "chunks_after": 0, "tokens_before": 0, "tokens_after": 0}
+    for docs in results:
+        _, stats = pack_context(docs, CONTEXT_MAX_TOKENS)
+        for key in totals:
+            totals[key] += stats[key]
+    return {key: value / max(len(results), 1) for key, value in totals.items()}
+
+
+def benchmark_retrieval(corpora: List[Tuple[str, int]], labels_path: str, n_questions: int, ks: List[int],
+                        embeddings: str, chat: bool, concurrency: int = 0) -> Dict:
+    """
+    检索基准测试, 每个语料在独立子进程中构建和查询(内存峰值互不影响)
+
+    Returns:
+        {"config": 影响结果的配置, "runs": 每个语料的结果}
+    """
+    context = multiprocessing.get_context("spawn")
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="benchmark_retrieval_") as workdir:
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            for corpus, n_chunks in corpora:
+                print(f"⏳ 正在测试语料: {corpus if corpus == 'data' else f'synthetic-{n_chunks}'}")
+                directory = os.path.join(workdir, f"{corpus}-{n_chunks}")
+                runs.append(pool.apply(
+                    _run_retrieval,
+                    (corpus, n_chunks, labels_path, n_questions, ks, embeddings, chat, concurrency, directory)
+                ))
+
+    return {
+        "benchmark": "retrieval",
+        "config": {
+            "embedding_model": embedding_model_id() if embeddings == "model" else "hashing",
+            "embedding_cache": EMBEDDING_CACHE_ENABLED and embeddings == "model",
+            "chunker": chunker_config()["chunker"],
+            "chunk_size": CHUNK_SIZE,
+            "chunk_overlap": chunker_config()["chunk_overlap"],
+            "top_k": TOP_K_RESULTS,
+            "vector_backend": VECTOR_BACKEND,
+            "vector_index": VECTOR_INDEX_TYPE,
+            "hybrid_search": HYBRID_SEARCH,
+            "retrieval_batching": RETRIEVAL_BATCH_ENABLED,
+            "rerank": RERANK_MODEL if RERANK_ENABLED else None,
+            "context_max_tokens": CONTEXT_MAX_TOKENS if CONTEXT_PACKING else None,
+            "ks": ks,
+        },
+        "runs": runs,
+    }
+
+
+def print_retrieval_report(result: Dict):
+    """打印检索基准结果"""
+    config = result["config"]
+    top_k = config["top_k"]
+    print("\n" + "="*70)
+    print(f"📊 检索基准 (模型: {config['embedding_model']}, chunk_size={config['chunk_size']}, "
+          f"overlap={config['chunk_overlap']}, top_k={config['top_k']})")
+    print("="*70)
+    for run in result["runs"]:
+        quality = run["quality"]
+        latency = run["latency"]
+        peak = f"{run['peak_rss_mb']:.0f} MB" if run["peak_rss_mb"] is not None else "-"
+        print(f"📚 {run['corpus']}: {run['chunks']} 个文本块, {run['questions']} 个问题, 索引: {run['index']}")
+        print(f"   构建: {run['build_seconds']:.2f} s, 索引大小 {run['index_mb']:.1f} MB, 内存峰值 {peak}")
+        print(f"   检索延迟: P50 {latency['p50_ms']:.2f} ms, P95 {latency['p95_ms']:.2f} ms, P99 {latency['p99_ms']:.2f} ms")
+        if "throughput" in run:
+            throughput = run["throughput"]
+            batched = (f"微批处理 {throughput['batched_qps']:.1f} QPS (平均批大小 {throughput['mean_batch_size']:.1f}), "
+                       if "batched_qps" in throughput else "")
+            print(f"   并发{throughput['threads']}线程: {batched}逐条 {throughput['unbatched_qps']:.1f} QPS")
+        context = run["context"]
+        print(f"   提示词上下文(上限 {CONTEXT_MAX_TOKENS} tokens): 平均 {context['chunks_before']:.1f} 块 "
+              f"{context['tokens_before']:.0f} tokens -> 打包后 {context['chunks_after']:.1f} 块 "
+              f"{context['tokens_after']:.0f} tokens")
+        if "chat_latency" in run:
+            chat = run["chat_latency"]
+            print(f"   对话延迟(fake LLM): P50 {chat['p50_ms']:.2f} ms, P95 {chat['p95_ms']:.2f} ms, "
+                  f"P99 {chat['p99_ms']:.2f} ms")
+        print("   " + " | ".join(
+            [f"recall@{k} {quality[f'recall@{k}']:.3f}" for k in config["ks"]]
+            + [f"hit@{top_k} {quality[f'hit@{top_k}']:.3f}", f"MRR {quality['mrr']:.3f}"]
+        ))
+        if quality["misses"]:
+            print(f"   未命中 {len(quality['misses'])} 个问题: {'; '.join(quality['misses'][:5])}"
+                  + (" ..." if len(quality["misses"]) > 5 else ""))
+    print("="*70)
+
+
+def _parse_ints(text: str) -> List[int]:
+    return [int(value) for value in text.split(",") if value.strip()]
+
+
+def run_retrieval(args) -> int:
+    """retrieval子命令"""
+    from app.evaluation import compare_to_baseline
+
+    ks = sorted(set(_parse_ints(args.k) + [TOP_K_RESULTS]))
+    corpora = ([] if args.skip_data else [("data", 0)]) + [("synthetic", n) for n in _parse_ints(args.synthetic)]
+    if not corpora:
+        print("❌ 没有需要测试的语料(--skip-data 时需要指定 --synthetic)")
+        return 1
+
+    result = benchmark_retrieval(corpora, args.labels, args.questions, ks, args.embeddings, args.chat, args.concurrency)
+    print_retrieval_report(result)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存到: {args.json}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(result, baseline, args.max_recall_drop, args.max_latency_increase)
+        if regressions:
+            print(f"❌ 与基线 {args.baseline} 相比出现回归:")
+            for regression in regressions:
+                print(f"   - {regression}")
+            return 1
+        print(f"✅ 与基线 {args.baseline} 相比无回归")
+    return 0
+
+
+EMBEDDING_VARIANTS = ("torch", "onnx", "onnx-int8")
+
+
+def _load_variant(variant: str):
+    """创建不经嵌入缓存的嵌入模型(torch: sentence-transformers; onnx/onnx-int8: onnxruntime)"""
+    if variant == "torch":
+        from app.rag import RAGRetriever
+        return RAGRetriever()._load_torch_embeddings()[0]
+
+    from app.onnx_models import OnnxEmbeddings
+    return OnnxEmbeddings(
+        EMBEDDING_MODEL,
+        onnx_file=EMBEDDING_ONNX_FILE,
+        quantize=variant == "onnx-int8",
+        batch_size=EMBED_BATCH_SIZE,
+        query_batch_size=EMBED_QUERY_BATCH_SIZE,
+        query_max_wait_ms=EMBED_QUERY_MAX_WAIT_MS
+    )
+
+
+def _measure_embeddings(model, texts: List[str], queries: List[str], threads: int) -> Tuple[np.ndarray, np.ndarray, Dict]:
+    """嵌入文档与查询, 并测量文档吞吐量、单条查询延迟和并发查询吞吐量"""
+    from concurrent.futures import ThreadPoolExecutor
+    from app.evaluation import latency_summary
+
+    start = time.perf_counter()
+    docs = np.asarray(model.embed_documents(texts), dtype=np.float32)
+    doc_seconds = time.perf_counter() - start
+
+    # 首次查询包含会话初始化, 不计入延迟
+    model.embed_query(queries[0])
+    query_vectors = []
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        query_vectors.append(model.embed_query(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(model.embed_query, queries))
+    concurrent_seconds = time.perf_counter() - start
+
+    stats = {
+        "docs_per_second": len(texts) / doc_seconds if doc_seconds > 0 else 0.0,
+        "sequential_qps": len(queries) / (sum(latencies) / 1000) if sum(latencies) > 0 else 0.0,
+        "concurrent_qps": len(queries) / concurrent_seconds if concurrent_seconds > 0 else 0.0,
+        **latency_summary(latencies),
+    }
+    return docs, np.asarray(query_vectors, dtype=np.float32), stats
+
+
+def benchmark_embeddings(texts: List[str], queries: List[str], reference: str, variants: List[str],
+                         k: int, threads: int) -> Dict:
+    """
+    嵌入推理后端一致性与速度对比
+
+    每个后端嵌入同一组文本块与问题, 与参照后端比较余弦相似度和检索结果(前k个)的重合度。
+    """
+    from app.evaluation import embedding_parity
+
+    results = {}
+    for variant in [reference] + [v for v in variants if v != reference]:
+        print(f"⏳ 正在测试嵌入后端: {variant}")
+        docs, query_vectors, stats = _measure_embeddings(_load_variant(variant), texts, queries, threads)
+        results[variant] = {"docs": docs, "queries": query_vectors, "speed": stats}
+
+    base = results[reference]
+    rows = []
+    for variant, result in results.items():
+        rows.append({
+            "variant": variant,
+            "speed": result["speed"],
+            "parity": embedding_parity(base["docs"], base["queries"], result["docs"], result["queries"], k),
+        })
+    return {
+        "benchmark": "embeddings",
+        "config": {
+            "embedding_model": EMBEDDING_MODEL,
+            "onnx_file": EMBEDDING_ONNX_FILE,
+            "reference": reference,
+            "texts": len(texts),
+            "queries": len(queries),
+            "k": k,
+            "threads": threads,
+        },
+        "rows": rows,
+    }
+
+
+def print_embedding_report(result: Dict):
+    """打印嵌入后端对比表"""
+    config = result["config"]
+    k = config["k"]
+    headers = [("余弦均值", 10), ("余弦最小", 10), (f"重合@{k}", 9), ("首位一致", 10),
+               ("文档/秒", 10), ("查询P50(ms)", 13), ("串行QPS", 10), ("并发QPS", 10)]
+
+    print("\n" + "="*94)
+    print(f"📊 嵌入后端对比 (模型: {config['embedding_model']}, 参照: {config['reference']}, "
+          f"{config['texts']} 个文本块, {config['queries']} 个查询, 并发 {config['threads']})")
+    print("="*94)
+    print(_display_pad("后端", 12) + "".join(_display_pad(name, width, right=True) for name, width in headers))
+    print("-"*94)
+    for row in result["rows"]:
+        parity = row["parity"]
+        speed = row["speed"]
+        print(
+            f"{row['variant']:<12}{parity['cosine_mean']:>10.4f}{parity['cosine_min']:>10.4f}"
+            f"{parity[f'overlap@{k}']:>9.3f}{parity['top1_agreement']:>10.3f}{speed['docs_per_second']:>10.1f}"
+            f"{speed['p50_ms']:>13.2f}{speed['sequential_qps']:>10.1f}{speed['concurrent_qps']:>10.1f}"
+        )
+    print("="*94)
+
+
+def run_embeddings(args) -> int:
+    """embeddings子命令: 检查ONNX/int8嵌入与参照后端的一致性, 超出容差时返回非零退出码"""
+    from app.evaluation import load_labels
+    from app.rag import RAGRetriever
+
+    variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+    unknown = [v for v in variants + [args.reference] if v not in EMBEDDING_VARIANTS]
+    if unknown:
+        print(f"❌ 不支持的嵌入后端: {', '.join(unknown)} (可选: {', '.join(EMBEDDING_VARIANTS)})")
+        return 1
+
+    rag = RAGRetriever()
+    texts = [chunk.page_content for chunk in rag.iter_chunks(rag.list_files(KNOWLEDGE_BASE_PATH))]
+    questions = [label["question"] for label in load_labels(args.labels)]
+    queries = list(itertools.islice(itertools.cycle(questions), max(args.queries, len(questions))))
+
+    result = benchmark_embeddings(texts, queries, args.reference, variants, args.k, args.threads)
+    print_embedding_report(result)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存到: {args.json}")
+
+    failures = []
+    for row in result["rows"]:
+        parity = row["parity"]
+        if parity["cosine_min"] < args.min_cosine:
+            failures.append(f"{row['variant']}: 最小余弦相似度 {parity['cosine_min']:.4f} < {args.min_cosine}")
+        if parity[f"overlap@{args.k}"] < args.min_overlap:
+            failures.append(f"{row['variant']}: 检索重合度 {parity[f'overlap@{args.k}']:.3f} < {args.min_overlap}")
+    if failures:
+        print(f"❌ 与 {args.reference} 的差异超出容差:")
+        for failure in failures:
+            print(f"   - {failure}")
+        return 1
+    print(f"✅ 各后端与 {args.reference} 的嵌入和检索结果一致(在容差范围内)")
+    return 0
+
+
+LLM_SCENARIOS = (
+    ("single", "只用首选服务"),
+    ("failover", "路由(故障转移)"),
+    ("hedged", "路由+对冲请求"),
+)
+
+
+def _llm_request(llm, prompt: str) -> Tuple[Optional[float], Optional[float]]:
+    """流式调用一次, 返回(首token耗时, 总耗时); 失败时返回(None, None)"""
+    start = time.perf_counter()
+    first = None
+    try:
+        for chunk in llm.stream(prompt):
+            if first is None and chunk:
+                first = time.perf_counter() - start
+    except Exception:
+        return None, None
+    return first, time.perf_counter() - start
+
+
+def benchmark_llm(n_requests: int, concurrency: int, first_token_ms: float, tail_ms: float, tail_rate: float,
+                  error_rate: float, hedge_delay: float) -> Dict:
+    """
+    LLM路由对比(本地模拟服务)
+
+    每种方式使用新启动的模拟服务(相同随机种子)和新的路由状态, 以concurrency个线程发出n_requests个请求。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from app.fake_llm_server import FakeLLMServer
+    from app.llm_router import OllamaBackend, OpenAICompatibleBackend, RoutingLLM
+
+    rows = []
+    for scenario, label in LLM_SCENARIOS:
+        primary = FakeLLMServer("primary", first_token_ms=first_token_ms, tail_ms=tail_ms, tail_rate=tail_rate,
+                                error_rate=error_rate, error_status=503, seed=1).start()
+        secondary = FakeLLMServer("secondary", first_token_ms=first_token_ms * 2, seed=2).start()
+        try:
+            backends = [OpenAICompatibleBackend("primary", f"{primary.url}/v1", "fake")]
+            if scenario != "single":
+                backends.append(OllamaBackend("secondary", secondary.url, "fake"))
+            llm = RoutingLLM(backends=backends, hedge=scenario == "hedged", hedge_delay=hedge_delay)
+
+            print(f"⏳ 正在测试: {label}")
+            prompts = [f"问题{i}" for i in range(n_requests)]
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = list(executor.map(lambda prompt: _llm_request(llm, prompt), prompts))
+        finally:
+            primary.stop()
+            secondary.stop()
+
+        first_tokens = [first for first, _ in results if first is not None]
+        rows.append({
+            "scenario": scenario,
+            "label": label,
+            "p50_ms": float(np.percentile(first_tokens, 50)) * 1000 if first_tokens else None,
+            "p95_ms": float(np.percentile(first_tokens, 95)) * 1000 if first_tokens else None,
+            "p99_ms": float(np.percentile(first_tokens, 99)) * 1000 if first_tokens else None,
+            "error_rate": 1 - len(first_tokens) / n_requests,
+            "primary_requests": primary.stats["requests"],
+            "secondary_requests": secondary.stats["requests"],
+            "connections": primary.stats["connections"] + secondary.stats["connections"],
+            "backends": llm.status(),
+        })
+    return {
+        "benchmark": "llm",
+        "config": {
+            "requests": n_requests,
+            "concurrency": concurrency,
+            "first_token_ms": first_token_ms,
+            "tail_ms": tail_ms,
+            "tail_rate": tail_rate,
+            "error_rate": error_rate,
+            "hedge_delay": hedge_delay,
+        },
+        "rows": rows,
+    }
+
+
+def print_llm_report(result: Dict):
+    """打印LLM路由对比表"""
+    def ms(value):
+        return f"{value:>10.1f}" if value is not None else f"{'-':>10}"
+
+    config = result["config"]
+    headers = [("首token P50", 12), ("P95", 10), ("P99", 10), ("失败率", 9), ("首选请求", 10), ("备用请求", 10), ("连接数", 8)]
+
+    print("\n" + "="*94)
+    print(f"📊 LLM路由对比: {config['requests']} 个请求, 并发 {config['concurrency']}, 首选服务首token "
+          f"{config['first_token_ms']:g}ms (+{config['tail_ms']:g}ms 长尾 {config['tail_rate']:.0%}, "
+          f"错误 {config['error_rate']:.0%}), 备用服务 {config['first_token_ms'] * 2:g}ms")
+    print("="*94)
+    print(_display_pad("方式", 18) + "".join(_display_pad(name, width, right=True) for name, width in headers))
+    print("-"*94)
+    for row in result["rows"]:
+        print(
+            f"{_display_pad(row['label'], 18)}  {ms(row['p50_ms'])}{ms(row['p95_ms'])}{ms(row['p99_ms'])}"
+            f"{row['error_rate']:>9.1%}{row['primary_requests']:>10}{row['secondary_requests']:>10}{row['connections']:>8}"
+        )
+    print("="*94)
+    print("💡 连接数远小于请求数说明连接被复用; 对冲请求被取消时其连接随之关闭")
+
+
+def run_llm(args) -> int:
+    """llm子命令"""
+    result = benchmark_llm(args.requests, args.concurrency, args.first_token_ms, args.tail_ms, args.tail_rate,
+                           args.error_rate, args.hedge_delay)
+    print_llm_report(result)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存到: {args.json}")
+    return 0
+
+
+OLLAMA_SCENARIOS = (
+    # (名称, keep_alive, 说明)
+    ("keep_alive", "30m", "keep_alive=30m"),
+    ("no_keep_alive", "0", "keep_alive=0"),
+)
+
+
+def benchmark_ollama(questions: List[str], prompt_eval_ms: float, load_ms: float, num_parallel: int) -> Dict:
+    """
+    Ollama keep_alive与KV缓存复用对比(本地模拟服务)
+
+    每种方式使用新启动的模拟服务和新的对话记忆, 依次提问questions(一段多轮对话),
+    从每轮链路的llm阶段读取OllamaLLM记录的提示词计算量。
+    """
+    from app.chatbot import GovernmentChatbot
+    from app.evaluation import HashingEmbeddings
+    from app.fake_llm_server import FakeLLMServer
+    from app.ollama_llm import OllamaLLM
+    from app.rag import RAGRetriever
+    from app.tracing import tracer
+
+    rag = RAGRetriever()
+    rag.embeddings = HashingEmbeddings()
+    with tempfile.TemporaryDirectory() as directory:
+        rag.vector_store = create_store(VECTOR_BACKEND, directory, **rag.vector_store_options())
+        rag.add_chunks(rag.iter_chunks(rag.list_files(KNOWLEDGE_BASE_PATH)))
+    rag.build_lexical_index()
+    rag.setup_retriever()
+
+    rows = []
+    for scenario, keep_alive, label in OLLAMA_SCENARIOS:
+        print(f"⏳ 正在测试: {label}")
+        with FakeLLMServer("ollama", first_token_ms=0, token_ms=1, prompt_eval_ms=prompt_eval_ms,
+                           load_ms=load_ms, num_parallel=num_parallel) as server:
+            chatbot = GovernmentChatbot(rag, llm_type="fake")
+            chatbot.answer_cache = None
+            # 对话记忆的后台摘要使用fake LLM, 只测量问答请求之间的缓存复用
+            # (实际部署中摘要请求同样占用缓存槽位, 会挤掉会话的缓存)
+            memory = chatbot.new_memory()
+            chatbot.llm = OllamaLLM(base_url=server.url, model="fake", keep_alive=keep_alive)
+
+            turns = []
+            for question in questions:
+                start = time.perf_counter()
+                first_token = None
+                for event in chatbot.stream_chat(question, memory=memory):
+                    if event["type"] == "token" and first_token is None:
+                        first_token = time.perf_counter() - start
+                spans = {span.name: span.attributes for span in tracer.last_trace.spans}
+                llm = spans.get("llm", {})
+                turns.append({
+                    "prompt_tokens": spans.get("build_prompt", {}).get("prompt_tokens", 0),
+                    "evaluated": llm.get("prompt_eval_tokens", 0),
+                    "cached": llm.get("prompt_cached_tokens", 0),
+                    "eval_ms": llm.get("prompt_eval_ms", 0.0),
+                    "saved_ms": llm.get("prompt_eval_saved_ms", 0.0),
+                    "load_ms": llm.get("load_ms", 0.0),
+                    "first_token_ms": (first_token or 0.0) * 1000,
+                })
+            memory.wait()
+
+        rows.append({
+            "scenario": scenario,
+            "label": label,
+            "turns": turns,
+            "mean": {key: float(np.mean([turn[key] for turn in turns])) for key in turns[0]},
+            "server": dict(server.stats),
+        })
+    return {
+        "benchmark": "ollama",
+        "config": {
+            "turns": len(questions),
+            "prompt_eval_ms": prompt_eval_ms,
+            "load_ms": load_ms,
+            "num_parallel": num_parallel,
+        },
+        "rows": rows,
+    }
+
+
+def print_ollama_report(result: Dict):
+    """打印Ollama KV缓存复用对比表(每轮平均值)"""
+    config = result["config"]
+    headers = [("提示词tokens", 13), ("实际计算", 10), ("命中缓存", 10), ("计算耗时", 10), ("节省耗时", 10),
+               ("加载耗时", 10), ("首token", 10)]
+
+    print("\n" + "="*98)
+    print(f"📊 Ollama KV缓存复用对比: {config['turns']} 轮对话, 每个提示词token计算 {config['prompt_eval_ms']:g}ms, "
+          f"加载模型 {config['load_ms']:g}ms, {config['num_parallel']} 个缓存槽位 (每轮平均)")
+    print("="*98)
+    print(_display_pad("方式", 24) + "".join(_display_pad(name, width, right=True) for name, width in headers))
+    print("-"*98)
+    for row in result["rows"]:
+        mean = row["mean"]
+        print(
+            f"{_display_pad(row['label'], 24)}{mean['prompt_tokens']:>13.0f}{mean['evaluated']:>10.0f}"
+            f"{mean['cached']:>10.0f}{mean['eval_ms']:>8.0f}ms{mean['saved_ms']:>8.0f}ms"
+            f"{mean['load_ms']:>8.0f}ms{mean['first_token_ms']:>8.0f}ms"
+        )
+    print("="*98)
+    print("💡 提示词tokens为本轮发送的提示词(tiktoken计数), 实际计算/命中缓存为模拟服务按字符计的token数;")
+    print("   keep_alive=0时每轮都重新加载模型, 系统提示词前缀也无法命中缓存")
+
+
+def run_ollama(args) -> int:
+    """ollama子命令"""
+    from app.evaluation import load_labels
+
+    questions = [label["question"] for label in load_labels(args.labels)][:args.turns]
+    result = benchmark_ollama(questions, args.prompt_eval_ms, args.load_ms, args.num_parallel)
+    print_ollama_report(result)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存到: {args.json}")
+    return 0
+
+
+def _memory_mb(pid: str = "self") -> Dict[str, float]:
+    """进程的RSS、PSS(共享页按映射进程数均摊)和私有内存(MB), 读取/proc/<pid>/smaps_rollup(Linux 4.14+)"""
+    values = {"Rss": 0, "Pss": 0, "Private_Clean": 0, "Private_Dirty": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if name in values:
+                    values[name] = int(rest.split()[0])
+    except (OSError, ValueError):
+        return {}
+    return {
+        "rss_mb": values["Rss"] / 1024,
+        "pss_mb": values["Pss"] / 1024,
+        "private_mb": (values["Private_Clean"] + values["Private_Dirty"]) / 1024,
+    }
+
+
+def _build_workers_index(directory: str, n_chunks: int, embeddings: str):
+    """子进程: 构建合成语料的索引并保存到directory"""
+    from app.rag import RAGRetriever
+    from app.evaluation import HashingEmbeddings, synthetic_corpus
+
+    rag = RAGRetriever()
+    if embeddings == "hash":
+        rag.embeddings = HashingEmbeddings()
+    else:
+        rag.initialize_embeddings()
+    rag.vector_store = create_store(VECTOR_BACKEND, directory, **rag.vector_store_options())
+    rag.add_chunks(_with_chunk_ids(rag, synthetic_corpus(n_chunks, chunk_chars=CHUNK_SIZE)))
+    rag.build_lexical_index()
+    os.makedirs(directory, exist_ok=True)
+    rag.vector_store.save()
+    if rag.lexical_index is not None:
+        rag.lexical_index.save(os.path.join(directory, LEXICAL_INDEX_DIR))
+
+
+def _worker_throughput(rag, questions: List[str], k: int, seconds: float, worker: int, threads: int, results):
+    """工作进程: 在seconds秒内循环检索questions, 报告查询数和内存"""
+    from app.workers import configure_worker
+
+    configure_worker(worker, threads)
+    # 首次查询包含惰性初始化, 不计入吞吐量
+    rag.retrieve(questions[0], k)
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        rag.retrieve(questions[count % len(questions)], k)
+        count += 1
+    results.put({"worker": worker, "queries": count, "seconds": time.perf_counter() - start, **_memory_mb()})
+
+
+def benchmark_workers(n_chunks: int, n_questions: int, embeddings: str, worker_counts: List[int],
+                      seconds: float, k: int) -> Dict:
+    """
+    多进程检索吞吐量与内存对比
+
+    索引在独立子进程中构建并保存; 本进程像多进程服务的主进程一样加载索引和嵌入模型(prepare_for_fork),
+    然后对每个工作进程数fork出对应数量的进程同时检索, 统计总吞吐量和各进程的RSS/PSS/私有内存。
+    """
+    from app.embedding_cache import LazyEmbeddings
+    from app.evaluation import HashingEmbeddings, synthetic_labels
+    from app.lexical import BM25Index
+    from app.rag import RAGRetriever
+    from app.workers import prepare_for_fork, worker_threads
+
+    questions = [label["question"] for label in synthetic_labels(n_chunks, n_questions)]
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="benchmark_workers_") as directory:
+        print(f"⏳ 正在构建合成语料索引 ({n_chunks} 个文本块)")
+        with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+            pool.apply(_build_workers_index, (directory, n_chunks, embeddings))
+
+        rag = RAGRetriever()
+        if embeddings == "hash":
+            rag.embeddings = LazyEmbeddings(HashingEmbeddings)
+        else:
+            rag.initialize_embeddings(lazy=True)
+        rag.vector_store = open_store(VECTOR_BACKEND, directory, **rag.vector_store_options())
+        lexical_path = os.path.join(directory, LEXICAL_INDEX_DIR)
+        if HYBRID_SEARCH and BM25Index.exists(lexical_path):
+            rag.lexical_index = BM25Index.load(lexical_path)
+        rag.setup_retriever()
+        prepare_for_fork(rag)
+        parent = _memory_mb()
+
+        context = multiprocessing.get_context("fork")
+        for workers in worker_counts:
+            print(f"⏳ 正在测试 {workers} 个工作进程")
+            threads = worker_threads(workers)
+            results = context.Queue()
+            processes = [
+                context.Process(target=_worker_throughput, args=(rag, questions, k, seconds, worker, threads, results))
+                for worker in range(workers)
+            ]
+            for process in processes:
+                process.start()
+            reports = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+
+            rows.append({
+                "workers": workers,
+                "threads": threads,
+                "qps": sum(report["queries"] / report["seconds"] for report in reports),
+                "rss_mb": sum(report.get("rss_mb", 0) for report in reports),
+                "pss_mb": sum(report.get("pss_mb", 0) for report in reports),
+                "private_mb": sum(report.get("private_mb", 0) for report in reports),
+            })
+
+    return {
+        "benchmark": "workers",
+        "config": {
+            "embedding_model": embedding_model_id() if embeddings == "model" else "hashing",
+            "chunks": n_chunks,
+            "questions": len(questions),
+            "k": k,
+            "seconds": seconds,
+            "cpu_count": os.cpu_count(),
+            "vector_backend": VECTOR_BACKEND,
+            "vector_index": VECTOR_INDEX_TYPE,
+            "hybrid_search": HYBRID_SEARCH,
+        },
+        "parent": parent,
+        "rows": rows,
+    }
+
+
+def print_workers_report(result: Dict):
+    """打印多进程吞吐量与内存对比表"""
+    config = result["config"]
+    base_qps = result["rows"][0]["qps"] / result["rows"][0]["workers"] if result["rows"] else 0
+    headers = [("线程/进程", 10), ("吞吐量", 12), ("加速比", 8), ("RSS合计", 11), ("PSS合计", 11), ("私有内存", 11)]
+
+    print("\n" + "="*79)
+    print(f"📊 多进程检索吞吐量: 合成语料 {config['chunks']} 个文本块, {config['cpu_count']} 个CPU核, "
+          f"每种配置 {config['seconds']:g} 秒 (索引: {config['vector_index']})")
+    print("="*79)
+    print(_display_pad("工作进程", 16) + "".join(_display_pad(name, width, right=True) for name, width in headers))
+    print("-"*79)
+    for row in result["rows"]:
+        print(
+            f"{row['workers']:<16}{row['threads']:>10}{row['qps']:>8.0f}/秒"
+            f"{row['qps'] / base_qps if base_qps else 0:>7.2f}x"
+            f"{row['rss_mb']:>9.1f}MB{row['pss_mb']:>9.1f}MB{row['private_mb']:>9.1f}MB"
+        )
+    print("="*79)
+    parent = result["parent"]
+    if parent:
+        print(f"💡 主进程(已加载索引和模型): RSS {parent['rss_mb']:.1f}MB, 私有内存 {parent['private_mb']:.1f}MB")
+    print("   RSS合计把共享页面重复计算(相当于每个进程各自加载一份), PSS合计按映射进程数均摊共享页面;")
+    print("   私有内存为各工作进程写时复制后独占的部分, 加速比相对于单个工作进程的吞吐量")
+
+
+def run_workers(args) -> int:
+    """workers子命令"""
+    worker_counts = _parse_ints(args.workers) if args.workers else sorted({1, 2, os.cpu_count() or 1})
+    result = benchmark_workers(args.synthetic, args.questions, args.embeddings, worker_counts, args.seconds, args.k)
+    print_workers_report(result)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存到: {args.json}")
+    return 0
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="政务智能客服系统性能基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ann = subparsers.add_parser("ann", help="向量索引召回率与延迟对比")
+    ann.add_argument("--synthetic", type=int, default=0, help="使用N个合成向量代替当前向量数据库")
+    ann.add_argument("--dim", type=int, default=384, help="合成向量维度")
+    ann.add_argument("--queries", type=int, default=200, help="留出作为查询的向量数")
+    ann.add_argument("-k", type=int, default=HYBRID_CANDIDATES, help="recall@k中的k(默认与混合检索的向量候选数一致)")
+    ann.add_argument("--types", default=",".join(INDEX_TYPES), help="参与对比的索引类型(逗号分隔)")
+    ann.add_argument("--nprobe", default="1,4,16,64", help="IVF的nprobe取值(逗号分隔)")
+    ann.add_argument("--ef-search", default="16,32,64,128", help="HNSW的efSearch取值(逗号分隔)")
+    ann.add_argument("--json", help="将结果保存为JSON文件")
+    ann.set_defaults(func=run_ann)
+
+    backends = subparsers.add_parser("backends", help="向量数据库后端构建/加载/查询/内存对比")
+    backends.add_argument("--synthetic", type=int, default=0, help="使用N个合成向量代替当前向量数据库")
+    backends.add_argument("--dim", type=int, default=384, help="合成向量维度")
+    backends.add_argument("--queries", type=int, default=200, help="留出作为查询的向量数")
+    backends.add_argument("-k", type=int, default=HYBRID_CANDIDATES, help="每次查询返回的结果数")
+    backends.add_argument("--backends", default=",".join(BACKENDS), help="参与对比的后端(逗号分隔)")
+    backends.add_argument("--json", help="将结果保存为JSON文件")
+    backends.set_defaults(func=run_backends)
+
+    retrieval = subparsers.add_parser("retrieval", help="检索质量与性能基准(recall@k、MRR、延迟、构建耗时、内存)")
+    retrieval.add_argument("--labels", default=DEFAULT_LABELS, help="知识库的标注问题集")
+    retrieval.add_argument("--skip-data", action="store_true", help="不测试知识库目录(只测试合成语料)")
+    retrieval.add_argument("--synthetic", default="", help="合成语料的文本块数(逗号分隔, 如 10000,100000,1000000)")
+    retrieval.add_argument("--questions", type=int, default=200, help="合成语料的问题数")
+    retrieval.add_argument("-k", default="1,5,10", help="recall@k中的k(逗号分隔, 总会包含TOP_K_RESULTS)")
+    retrieval.add_argument("--embeddings", choices=["model", "hash"], default="model",
+                           help="model: 使用EMBEDDING_MODEL; hash: 离线字符哈希嵌入(不需要模型)")
+    retrieval.add_argument("--chat", action="store_true", help="同时测量完整对话延迟(使用fake LLM, 不访问网络)")
+    retrieval.add_argument("--concurrency", type=int, default=0,
+                           help="测量N个线程并发检索的吞吐量(对比启用/关闭检索微批处理)")
+    retrieval.add_argument("--json", help="将结果保存为JSON文件(可作为基线)")
+    retrieval.add_argument("--baseline", help="与之前保存的JSON基线比较, 回归时返回非零退出码")
+    retrieval.add_argument("--max-recall-drop", type=float, default=0.02, help="允许的召回率/MRR下降(绝对值)")
+    retrieval.add_argument("--max-latency-increase", type=float, default=0.25, help="允许的P95延迟增加(比例)")
+    retrieval.set_defaults(func=run_retrieval)
+
+    embeddings = subparsers.add_parser("embeddings", help="嵌入推理后端(torch/onnx/onnx-int8)一致性与速度对比")
+    embeddings.add_argument("--reference", default="torch", help="参照后端(没有安装torch时可用onnx)")
+    embeddings.add_argument("--variants", default="onnx,onnx-int8", help="参与对比的后端(逗号分隔)")
+    embeddings.add_argument("--labels", default=DEFAULT_LABELS, help="查询使用的标注问题集")
+    embeddings.add_argument("--queries", type=int, default=200, help="查询次数(循环使用标注问题)")
+    embeddings.add_argument("-k", type=int, default=10, help="比较检索结果的前k个")
+    embeddings.add_argument("--threads", type=int, default=8, help="并发查询的线程数")
+    embeddings.add_argument("--min-cosine", type=float, default=0.95, help="同一文本的最小余弦相似度")
+    embeddings.add_argument("--min-overlap", type=float, default=0.9, help="检索结果的最小平均重合度")
+    embeddings.add_argument("--json", help="将结果保存为JSON文件")
+    embeddings.set_defaults(func=run_embeddings)
+
+    llm = subparsers.add_parser("llm", help="LLM路由(连接复用/故障转移/熔断/对冲请求)对比, 使用本地模拟服务")
+    llm.add_argument("--requests", type=int, default=300, help="每种方式的请求数")
+    llm.add_argument("--concurrency", type=int, default=8, help="并发线程数")
+    llm.add_argument("--first-token-ms", type=float, default=30, help="首选服务的首token延迟(毫秒, 备用服务为2倍)")
+    llm.add_argument("--tail-ms", type=float, default=500, help="长尾请求额外增加的首token延迟(毫秒)")
+    llm.add_argument("--tail-rate", type=float, default=0.05, help="首选服务长尾请求的比例")
+    llm.add_argument("--error-rate", type=float, default=0.02, help="首选服务返回503的比例")
+    llm.add_argument("--hedge-delay", type=float, default=0.2, help="延迟样本不足时的对冲等待(秒)")
+    llm.add_argument("--json", help="将结果保存为JSON文件")
+    llm.set_defaults(func=run_llm)
+
+    ollama = subparsers.add_parser("ollama", help="Ollama keep_alive与KV缓存复用对比, 使用本地模拟服务")
+    ollama.add_argument("--labels", default=DEFAULT_LABELS, help="对话使用的标注问题集")
+    ollama.add_argument("--turns", type=int, default=8, help="对话轮数")
+    ollama.add_argument("--prompt-eval-ms", type=float, default=2, help="每个提示词token的计算耗时(毫秒)")
+    ollama.add_argument("--load-ms", type=float, default=1000, help="加载模型的耗时(毫秒)")
+    ollama.add_argument("--num-parallel", type=int, default=1, help="KV缓存槽位数(对应OLLAMA_NUM_PARALLEL)")
+    ollama.add_argument("--json", help="将结果保存为JSON文件")
+    ollama.set_defaults(func=run_ollama)
+
+    workers = subparsers.add_parser("workers", help="多进程检索吞吐量与内存(RSS/PSS)对比, 工作进程共享主进程加载的索引")
+    workers.add_argument("--synthetic", type=int, default=100000, help="合成语料的文本块数")
+    workers.add_argument("--questions", type=int, default=200, help="循环检索的问题数")
+    workers.add_argument("--workers", default="", help="参与对比的工作进程数(逗号分隔, 默认 1,2,CPU核数)")
+    workers.add_argument("--seconds", type=float, default=10, help="每种配置的测量时长(秒)")
+    workers.add_argument("-k", type=int, default=TOP_K_RESULTS, help="每次检索返回的文本块数")
+    workers.add_argument("--embeddings", choices=["model", "hash"], default="hash",
+                         help="model: 使用EMBEDDING_MODEL(在主进程中加载); hash: 离线字符哈希嵌入")
+    workers.add_argument("--json", help="将结果保存为JSON文件")
+    workers.set_defaults(func=run_workers)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n\n⚠️  已取消")
+        sys.exit(1)
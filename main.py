@@ -3,10 +3,25 @@
 Main CLI Application Entry Point
 """
 
+import os
 import sys
+import asyncio
 import argparse
-from app.rag import RAGRetriever
-from app.chatbot import GovernmentChatbot
+from app.config import (
+    SERVER_HOST,
+    SERVER_PORT,
+    LLM_MAX_CONCURRENCY,
+    MAX_SESSIONS,
+    SESSION_TTL,
+    SERVER_WORKERS,
+    WORKER_THREADS,
+    BATCH_CONCURRENCY,
+    BATCH_MAX_RETRIES,
+    BATCH_RETRY_BASE_DELAY,
+    BATCH_RETRY_MAX_DELAY
+)
+from app.profiling import profiler
+from app.tracing import tracer, format_trace
 
 
 def print_banner():
@@ -23,6 +38,7 @@ def print_banner():
   - 输入您的问题,系统将基于招聘知识库回答
   - 输入 'clear' 清空对话历史
   - 输入 'history' 查看对话记录
+  - 输入 'stats' 查看回答缓存命中统计和对话记忆占用
   - 输入 'quit' 或 'exit' 退出程序
 
 """
@@ -49,21 +65,135 @@ def main():
         action="store_true",
         help="显示回答的来源文档"
     )
+    parser.add_argument(
+        "--no-stream",
+        action="store_true",
+        help="等待完整回答后再输出(关闭流式输出)"
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="以HTTP/SSE服务模式运行(多会话共享同一个检索器和LLM客户端)"
+    )
+    parser.add_argument(
+        "--host",
+        default=SERVER_HOST,
+        help=f"服务监听地址 (默认 {SERVER_HOST})"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=SERVER_PORT,
+        help=f"服务监听端口 (默认 {SERVER_PORT})"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=SERVER_WORKERS,
+        help=f"服务模式的工作进程数, 大于1时主进程加载索引后fork出多个进程共享 (默认 {SERVER_WORKERS})"
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="QUESTIONS",
+        help="离线批量问答: 回答JSONL问题文件中的全部问题后退出(中断后重新运行可续跑)"
+    )
+    parser.add_argument(
+        "--output",
+        help="批量问答结果文件 (默认为问题文件名加 .answers.jsonl)"
+    )
+    parser.add_argument(
+        "--batch-concurrency",
+        type=int,
+        default=BATCH_CONCURRENCY,
+        help=f"批量问答同时进行的LLM请求数 (默认 {BATCH_CONCURRENCY})"
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="每次回答后输出各阶段耗时(问题改写、检索、提示词、LLM首token等)"
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="初始化完成后输出各阶段启动耗时并退出"
+    )
     
     args = parser.parse_args()
+    if args.profile_startup:
+        profiler.enable()
     
     try:
         # 打印欢迎信息
         print_banner()
         
+        # 先显示横幅再导入较重的依赖(langchain、faiss等)
+        with profiler.phase("导入 app.rag"):
+            from app.rag import RAGRetriever
+        with profiler.phase("导入 app.chatbot"):
+            from app.chatbot import GovernmentChatbot
+        
         # 初始化RAG检索器
         print("🔧 正在初始化系统...\n")
         rag_retriever = RAGRetriever()
-        rag_retriever.initialize(force_rebuild=args.rebuild)
+        with profiler.phase("初始化RAG检索系统"):
+            rag_retriever.initialize(force_rebuild=args.rebuild)
+        
+        if args.serve and args.workers > 1 and not args.profile_startup:
+            from app.workers import PreforkServer
+            
+            # 聊天机器人(对话记忆、回答缓存、LLM客户端)在各工作进程中创建
+            server = PreforkServer(
+                rag_retriever,
+                host=args.host,
+                port=args.port,
+                workers=args.workers,
+                max_concurrency=LLM_MAX_CONCURRENCY,
+                max_sessions=MAX_SESSIONS,
+                session_ttl=SESSION_TTL,
+                threads=WORKER_THREADS
+            )
+            server.serve_forever()
+            return
         
         # 初始化聊天机器人
         chatbot = GovernmentChatbot(rag_retriever)
         
+        if args.profile_startup:
+            # 嵌入模型默认在首次查询时加载, 这里主动加载以计入报告
+            rag_retriever.warmup()
+            profiler.report()
+            return
+        
+        if args.batch:
+            from app.batch import BatchAnswerer, load_questions
+            
+            output = args.output or os.path.splitext(args.batch)[0] + ".answers.jsonl"
+            answerer = BatchAnswerer(
+                chatbot,
+                concurrency=args.batch_concurrency,
+                max_retries=BATCH_MAX_RETRIES,
+                base_delay=BATCH_RETRY_BASE_DELAY,
+                max_delay=BATCH_RETRY_MAX_DELAY
+            )
+            answerer.run(load_questions(args.batch), output)
+            print(f"📄 结果已写入 {output}")
+            tracer.write_metrics_file()
+            return
+        
+        if args.serve:
+            from app.server import ChatServer
+            
+            server = ChatServer(
+                chatbot,
+                host=args.host,
+                port=args.port,
+                max_concurrency=LLM_MAX_CONCURRENCY,
+                max_sessions=MAX_SESSIONS,
+                session_ttl=SESSION_TTL
+            )
+            asyncio.run(server.serve_forever())
+            return
+        
         print("✅ 系统已就绪! 请开始提问...\n")
         print_separator()
         
@@ -96,11 +226,35 @@ def main():
                             print(f"  {msg['role']}: {msg['content'][:100]}...")
                     continue
                 
+                elif user_input.lower() in ['stats', '统计']:
+                    stats = chatbot.get_cache_stats()
+                    if not stats:
+                        print("\n📊 回答缓存未启用")
+                    else:
+                        print(f"\n📊 回答缓存: 命中 {stats['hits']} 次, 未命中 {stats['misses']} 次, "
+                              f"命中率 {stats['hit_rate']:.1%}, 条目 {stats['size']} 个")
+                    condense = chatbot.get_condense_stats()
+                    print(f"✏️  问题改写: 首轮 {condense['no_history']} 次, 跳过 {condense['standalone']} 次, "
+                          f"调用LLM {condense['condensed']} 次")
+                    usage = chatbot.get_memory_usage()
+                    print(f"💭 对话记忆: {usage['total']}/{usage['budget']} tokens "
+                          f"(摘要 {usage['summary']}, 待压缩 {usage['pending']}, 最近对话 {usage['recent']})")
+                    continue
+                
                 # 获取回答
                 print("\n🤖 助手: ", end="", flush=True)
-                response = chatbot.chat(user_input, show_sources=args.show_sources)
-                
-                print(response['answer'])
+                if args.no_stream:
+                    response = chatbot.chat(user_input, show_sources=args.show_sources)
+                    print(response['answer'])
+                else:
+                    # 边生成边输出
+                    response = {}
+                    for event in chatbot.stream_chat(user_input, show_sources=args.show_sources):
+                        if event["type"] == "token":
+                            print(event["content"], end="", flush=True)
+                        else:
+                            response = event
+                    print()
                 
                 # 显示来源文档(如果启用)
                 if args.show_sources and response.get('sources'):
@@ -108,6 +262,11 @@ def main():
                     for source in response['sources']:
                         print(f"  [{source['index']}] {source['content']}")
                 
+                if args.trace and tracer.last_trace is not None:
+                    print("\n⏱️  本轮耗时:")
+                    for line in format_trace(tracer.last_trace):
+                        print(f"  {line}")
+                
                 print_separator()
                 
             except KeyboardInterrupt:
@@ -116,6 +275,9 @@ def main():
             except Exception as e:
                 print(f"\n❌ 处理请求时出错: {str(e)}")
                 continue
+        
+        # METRICS_FILE按间隔写入, 退出前写入最终结果
+        tracer.write_metrics_file()
     
     except KeyboardInterrupt:
         print("\n\n👋 程序已中断")